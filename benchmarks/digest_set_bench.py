@@ -0,0 +1,111 @@
+"""Memory per entry of DigestSet versus a set of url strings, and of the
+frontier's record of discovered urls.
+
+Each measurement runs in a fresh process and reports the growth of its
+resident set size, which counts the set plus every object it keeps alive
+(for a set of strings, the strings themselves). The frontier keeps the raw
+SHA256 digests of the discovered urls in its memory-mapped snapshot, with
+a Bloom filter in front (BLOOM_ERROR_RATE 1%): its row counts the snapshot
+pages read while loading the filter, as a resumed crawl does, and the
+filter; its adds/s are urls loaded per second. The snapshot is written
+beforehand by another process.
+
+Run from the repository root:
+    python benchmarks/digest_set_bench.py [--sizes 1000000 10000000]
+"""
+import gc
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser, SUPPRESS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from utils import get_urlhash
+from utils.bloom import BloomFilter
+from utils.digest_set import DigestSet
+from crawler.snapshot import Snapshot, sorted_digests, write_snapshot
+
+
+def resident_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def urls(count):
+    # About as long as the urls of a crawl (60-70 characters)
+    for i in range(count):
+        yield f"https://www.ics.uci.edu/~faculty{i % 5000}/research/page-{i}.html"
+
+
+def snapshot_path(count):
+    return os.path.join(tempfile.gettempdir(), f"digest_set_bench-{count}.snapshot")
+
+
+def write_frontier_snapshot(count):
+    write_snapshot(
+        snapshot_path(count), 1, bytes(32),
+        sorted_digests(get_urlhash(url) for url in urls(count)), [])
+
+
+def load_frontier(count):
+    snapshot = Snapshot(snapshot_path(count))
+    discovered = BloomFilter(count, 0.01)
+    for digests in snapshot.iter_digest_chunks():
+        discovered.add_digests(digests)
+    return snapshot, discovered
+
+
+def measure(kind, count):
+    gc.collect()
+    before = resident_bytes()
+    start = time.perf_counter()
+    if kind == "frontier":
+        items = load_frontier(count)
+    else:
+        items = DigestSet() if kind == "digest" else set()
+        for url in urls(count):
+            items.add(url)
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    grown = resident_bytes() - before
+    print(f"{kind},{count},{grown},{elapsed}")
+
+
+def run(kind, count):
+    out = subprocess.run(
+        [sys.executable, __file__, "--measure", kind, str(count)],
+        check=True, capture_output=True, text=True).stdout
+    _, _, grown, elapsed = out.strip().split(",")
+    return int(grown), float(elapsed)
+
+
+def main(sizes):
+    print(f"{'entries':>12} {'structure':<12} {'bytes/entry':>12} {'total MB':>10} {'adds/s':>12}")
+    for count in sizes:
+        subprocess.run([sys.executable, __file__, "--write-snapshot", str(count)], check=True)
+        try:
+            for kind, label in [("set", "set of str"), ("digest", "DigestSet"),
+                                ("frontier", "frontier")]:
+                grown, elapsed = run(kind, count)
+                print(f"{count:>12,} {label:<12} {grown / count:>12.1f} "
+                      f"{grown / 1e6:>10.1f} {count / elapsed:>12,.0f}")
+        finally:
+            os.remove(snapshot_path(count))
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    # Internal: measure one structure in this process
+    parser.add_argument("--measure", nargs=2, metavar=("KIND", "COUNT"), help=SUPPRESS)
+    parser.add_argument("--write-snapshot", type=int, metavar="COUNT", help=SUPPRESS)
+    args = parser.parse_args()
+    if args.write_snapshot:
+        write_frontier_snapshot(args.write_snapshot)
+    elif args.measure:
+        measure(args.measure[0], int(args.measure[1]))
+    else:
+        main(args.sizes)
@@ -0,0 +1,148 @@
+"""Frontier persistence benchmarks.
+
+add_url throughput with the write-ahead log versus a shelve sync per url,
+and time until the first url can be handed out when resuming a crawl from
+the checkpoint snapshot versus scanning the whole save file, and the cost
+per page of admitting links into a resumed crawl with and without the bloom
+filter of discovered urls, and the memory held by the queue of pending urls
+with and without spilling them to disk.
+
+Run from the repository root:
+    python benchmarks/frontier_bench.py [--urls 5000] [--resume-urls 50000]
+"""
+import os
+import shelve
+import sys
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from threading import RLock
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from crawler.frontier import Frontier
+from utils import get_urlhash, normalize
+
+
+def sync_per_url(save_file, urls):
+    """The add_url persistence path before the write-ahead log."""
+    save = shelve.open(save_file)
+    save_lock = RLock()
+    start = time.perf_counter()
+    for url in urls:
+        url = normalize(url)
+        urlhash = get_urlhash(url)
+        with save_lock:
+            if urlhash in save:
+                continue
+            save[urlhash] = (url, False)
+            save.sync()
+    elapsed = time.perf_counter() - start
+    save.close()
+    return elapsed
+
+
+def make_config(save_file, frontier_memory_urls=0):
+    return SimpleNamespace(
+        save_file=save_file, seed_urls=[], time_delay=0,
+        wal_commit_interval=1.0, wal_commit_size=500, wal_checkpoint_size=10000,
+        bloom_capacity=2_000_000, bloom_error_rate=0.01,
+        priority_frontier=True, host_budget=0,
+        frontier_memory_urls=frontier_memory_urls)
+
+
+def write_ahead_log(save_file, urls):
+    frontier = Frontier(make_config(save_file), restart=True)
+    start = time.perf_counter()
+    for url in urls:
+        frontier.add_url(url)
+    elapsed = time.perf_counter() - start
+    frontier.close()
+    return elapsed
+
+
+def time_to_first_url(save_file, from_snapshot):
+    if not from_snapshot:
+        os.remove(f"{save_file}.snapshot")
+    start = time.perf_counter()
+    frontier = Frontier(make_config(save_file), restart=False)
+    frontier.get_tbd_url()
+    elapsed = time.perf_counter() - start
+    frontier.close()
+    return elapsed
+
+
+def resume(save_file, count):
+    frontier = Frontier(make_config(save_file), restart=True)
+    for i in range(count):
+        frontier.add_url(f"https://sub{i % 500}.ics.uci.edu/people/{i}")
+    frontier.close()
+    # Save file scan first: its close() writes the snapshot the second run uses
+    for label, from_snapshot in [("save file scan", False), ("snapshot", True)]:
+        elapsed = time_to_first_url(save_file, from_snapshot)
+        print(f"resume, {label:<14} {elapsed:>8.2f} s to first url ({count} pending)")
+
+
+def admission(save_file, count, pages=200, links=50):
+    """Pages of links into a crawl resumed from the snapshot of resume(),
+    half of them already discovered."""
+    for label, use_filter in [("no filter", False), ("bloom filter", True)]:
+        frontier = Frontier(make_config(save_file), restart=False)
+        frontier._loader.join()
+        if not use_filter:
+            frontier._loaded_filter = None
+        for page in range(pages):
+            for i in range(links // 2):
+                frontier.add_url(f"https://sub{i % 500}.ics.uci.edu/people/{(page * links + i) % count}")
+                frontier.add_url(f"https://www.cs.uci.edu/{label[0]}/{page}/{i}")
+            frontier._pages += 1
+        print(f"admission, {label:<12} {frontier._store_lookups / pages:>6.1f} save file lookups/page, "
+              f"lock held {frontier._lock_held / pages * 1e3:.2f} ms/page ({links} links)")
+        frontier.close()
+
+
+def queue_memory(save_file, count, cap=10000):
+    """Memory held by the pending urls of a crawl, and the time to hand
+    them all out, with every url in memory and with at most `cap`."""
+    for label, memory_urls in [("in memory", 0), (f"spill past {cap}", cap)]:
+        frontier = Frontier(make_config(save_file, memory_urls), restart=True)
+        queue = frontier.to_be_downloaded
+        tracemalloc.start()
+        for i in range(count):
+            queue.put(f"https://sub{i % 500}.ics.uci.edu/people/{i}")
+        held, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        start = time.perf_counter()
+        for _ in range(count):
+            queue.release(queue.get(timeout=0))
+        elapsed = time.perf_counter() - start
+        print(f"queue, {label:<16} {held / 2 ** 20:>7.1f} MiB held, {peak / 2 ** 20:.1f} MiB peak, "
+              f"{count / elapsed:.0f} urls/s handed out ({count} pending)")
+        frontier.close()
+
+
+def main(count, resume_count):
+    # Every url twice: the second add is the "already discovered" path
+    urls = [f"https://www.ics.uci.edu/~user{i % 97}/page/{i}" for i in range(count)] * 2
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            for label, fn in [("shelve sync per url", sync_per_url), ("write-ahead log", write_ahead_log)]:
+                elapsed = fn(os.path.join(tmp, label.replace(" ", "_")), urls)
+                print(f"{label:<20} {len(urls) / elapsed:>10.0f} add_url/s")
+            if resume_count:
+                resume(os.path.join(tmp, "resume"), resume_count)
+                admission(os.path.join(tmp, "resume"), resume_count)
+                queue_memory(os.path.join(tmp, "queue"), resume_count)
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--urls", type=int, default=5000)
+    parser.add_argument("--resume-urls", type=int, default=50000)
+    args = parser.parse_args()
+    main(args.urls, args.resume_urls)
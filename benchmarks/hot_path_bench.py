@@ -0,0 +1,256 @@
+"""Micro-benchmarks of the scraping hot path, with a saved baseline.
+
+Each function runs over the bundled corpus: the pages in benchmarks/corpus
+(a faculty directory, a publication list, a news article, an events
+calendar and a wiki page) and the recorded link list in
+tests/corpus/links.tsv. For every function it reports
+
+    ops/s        calls per second, best of --rounds rounds
+    peak B/op    bytes allocated at the peak of a call, averaged over calls
+    kept B/op    bytes still allocated after a round, per call
+
+Memory is measured with tracemalloc in a separate, untimed round.
+
+--save writes the results to a baseline JSON file; --compare checks them
+against one and exits with status 1 if a function got slower, or peaks
+higher, by more than --tolerance. Baselines depend on the machine, so
+compare against one saved on the same machine.
+
+Run from the repository root:
+    python benchmarks/hot_path_bench.py [--rounds 5] [--only is_valid normalize_url]
+        [--save benchmarks/baseline.json | --compare benchmarks/baseline.json [--tolerance 0.2]]
+"""
+import glob
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from types import SimpleNamespace
+
+from bs4 import BeautifulSoup
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+import scraper
+import tokenizer
+from crawler.frontier import Frontier
+from utils.page_extract import extract_page
+from utils.page_store import PageStore
+from utils.stats import CrawlStats, MetricsFlusher
+
+CORPUS_DIR = os.path.join(ROOT, "benchmarks", "corpus")
+LINKS_FILE = os.path.join(ROOT, "tests", "corpus", "links.tsv")
+# A timed round repeats the workload until it lasts at least this long
+MIN_ROUND_SECONDS = 0.2
+
+
+def load_corpus():
+    pages = []
+    for path in sorted(glob.glob(os.path.join(CORPUS_DIR, "*.html"))):
+        with open(path, "rb") as f:
+            name = os.path.splitext(os.path.basename(path))[0]
+            pages.append((f"https://www.ics.uci.edu/benchmark/{name}", f.read()))
+    with open(LINKS_FILE, encoding="utf-8") as f:
+        links = [line.rstrip("\n").split("\t", 1)[1] for line in f if "\t" in line]
+    return pages, links
+
+
+def html_response(url, content):
+    raw = SimpleNamespace(content=content, headers={"Content-Type": "text/html; charset=utf-8"})
+    return SimpleNamespace(url=url, status=200, error=None, raw_response=raw,
+                           headers=raw.headers, payload_size=0)
+
+
+class Benchmark(object):
+    """A function under test, called once per input as fn(state, input).
+
+    setup() builds the state of a round and teardown(state) cleans it up;
+    only the calls are timed."""
+
+    def __init__(self, name, fn, inputs, setup=lambda: None, teardown=lambda state: None):
+        self.name = name
+        self.fn = fn
+        self.inputs = inputs
+        self.setup = setup
+        self.teardown = teardown
+
+    def run_once(self):
+        fn = self.fn
+        state = self.setup()
+        try:
+            start = time.perf_counter()
+            for item in self.inputs:
+                fn(state, item)
+            return time.perf_counter() - start
+        finally:
+            self.teardown(state)
+
+    def measure_memory(self):
+        """Average peak and retained traced bytes per call."""
+        state = self.setup()
+        peaks = 0
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            for item in self.inputs:
+                current = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+                self.fn(state, item)
+                peaks += tracemalloc.get_traced_memory()[1] - current
+            kept = tracemalloc.get_traced_memory()[0] - before
+        finally:
+            tracemalloc.stop()
+            self.teardown(state)
+        return peaks / len(self.inputs), kept / len(self.inputs)
+
+
+def make_benchmarks(pages, links):
+    valid_links = [link for link in links if scraper.is_valid(link)]
+    responses = [html_response(url, content) for url, content in pages]
+    word_lists = [extract_page(content).words for _, content in pages]
+
+    def fresh_stats():
+        # Every round starts a new crawl, so pages are not skipped as duplicates
+        scraper.stats = CrawlStats(near_dup_threshold=scraper.NEAR_DUP_THRESHOLD)
+
+    def recorded_pages():
+        # A recrawl: every page was stored by the previous crawl
+        fresh_stats()
+        store = PageStore("pages.shelve")
+        scraper.set_page_store(store)
+        for resp in responses:
+            scraper.extract_next_links(resp.url, resp)
+        return store
+
+    def forget_pages(store):
+        scraper.set_page_store(None)
+        store.close()
+        for path in glob.glob("pages.shelve*"):
+            os.remove(path)
+
+    # Parsed once; tokenize only reads the soup
+    soups = [BeautifulSoup(content, "lxml") for _, content in pages]
+
+    config = SimpleNamespace(
+        save_file="frontier.shelve", seed_urls=[], time_delay=0,
+        wal_commit_interval=1.0, wal_commit_size=500, wal_checkpoint_size=10 ** 9,
+        bloom_capacity=100_000, bloom_error_rate=0.01,
+        priority_frontier=True, host_budget=0, frontier_memory_urls=0)
+
+    return [
+        Benchmark("extract_next_links", lambda _, resp: scraper.extract_next_links(resp.url, resp),
+                  responses, fresh_stats),
+        Benchmark("extract_next_links_unchanged",
+                  lambda _, resp: scraper.extract_next_links(resp.url, resp),
+                  responses, recorded_pages, forget_pages),
+        Benchmark("normalize_url", lambda _, link: scraper.normalize_url(link), links),
+        Benchmark("is_valid", lambda _, link: scraper.is_valid(link), links),
+        Benchmark("compute_simhash", lambda _, words: scraper.compute_simhash(words), word_lists),
+        Benchmark("tokenize", lambda _, soup: tokenizer.tokenize(soup), soups),
+        # Every link twice: the second add takes the "already discovered" path
+        Benchmark("Frontier.add_url", Frontier.add_url, valid_links * 2,
+                  lambda: Frontier(config, restart=True), Frontier.close),
+    ]
+
+
+def time_rounds(bench, rounds):
+    best = None
+    for _ in range(rounds):
+        calls = 0
+        elapsed = 0.0
+        while elapsed < MIN_ROUND_SECONDS:
+            elapsed += bench.run_once()
+            calls += len(bench.inputs)
+        rate = calls / elapsed
+        best = rate if best is None else max(best, rate)
+    return best
+
+
+def run_suite(benchmarks, rounds):
+    results = {}
+    for bench in benchmarks:
+        # The functions print skipped pages and malformed urls
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            # One untimed round warms up caches and imports
+            bench.run_once()
+            ops = time_rounds(bench, rounds)
+            peak, kept = bench.measure_memory()
+        results[bench.name] = {"ops_per_sec": ops, "peak_bytes_per_op": peak, "kept_bytes_per_op": kept}
+        print(f"  {bench.name:<28} {ops:>12,.0f} ops/s {peak:>12,.0f} peak B/op {kept:>10,.0f} kept B/op")
+    return results
+
+
+def machine():
+    return {"python": platform.python_version(), "platform": platform.platform(),
+            "processor": platform.processor(), "cpus": os.cpu_count()}
+
+
+def compare(results, baseline, tolerance):
+    """Return a description of each regression against the baseline."""
+    regressions = []
+    for name, result in results.items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        if result["ops_per_sec"] < before["ops_per_sec"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: {result['ops_per_sec']:,.0f} ops/s, "
+                f"baseline {before['ops_per_sec']:,.0f} "
+                f"({result['ops_per_sec'] / before['ops_per_sec'] - 1:+.0%})")
+        # Small peaks vary with interpreter internals; ignore changes under 1 KiB
+        if result["peak_bytes_per_op"] > max(before["peak_bytes_per_op"] * (1 + tolerance),
+                                             before["peak_bytes_per_op"] + 1024):
+            regressions.append(
+                f"{name}: {result['peak_bytes_per_op']:,.0f} peak B/op, "
+                f"baseline {before['peak_bytes_per_op']:,.0f}")
+    return regressions
+
+
+def main(rounds, only, save, against, tolerance):
+    pages, links = load_corpus()
+    print(f"{len(pages)} pages, {sum(len(c) for _, c in pages) / 1e3:.0f} KB, {len(links)} links")
+    # The crawl reports are not part of the hot path
+    scraper.metrics_flusher = MetricsFlusher(lambda: None, interval=3600, every_pages=10 ** 9)
+    benchmarks = [b for b in make_benchmarks(pages, links) if not only or b.name in only]
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        # The frontier writes its save files and Logs/ here
+        os.chdir(tmp)
+        try:
+            results = run_suite(benchmarks, rounds)
+        finally:
+            os.chdir(cwd)
+
+    if save:
+        with open(save, "w", encoding="utf-8") as f:
+            json.dump({"machine": machine(), "results": results}, f, indent=2, sort_keys=True)
+        print(f"Saved baseline to {save}")
+    if against:
+        with open(against, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("machine") != machine():
+            print(f"Warning: baseline {against} was saved on another machine.")
+        regressions = compare(results, baseline, tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"No regressions against {against} (tolerance {tolerance:.0%}).")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--only", nargs="+", metavar="NAME", help="run only these benchmarks")
+    parser.add_argument("--save", metavar="JSON", help="save the results as a baseline")
+    parser.add_argument("--compare", metavar="JSON", help="flag regressions against a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed slowdown or peak growth, as a fraction")
+    args = parser.parse_args()
+    sys.exit(main(args.rounds, args.only, args.save, args.compare, args.tolerance))
@@ -0,0 +1,55 @@
+"""Link processing cost per page with and without the link cache.
+
+Pages are generated like a template-heavy department site: every page
+repeats the same navigation and footer links and adds a few of its own.
+
+Run from the repository root:
+    python benchmarks/link_cache_bench.py [--pages 500] [--shared 150] [--unique 20]
+"""
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+import scraper
+
+
+def site_pages(pages, shared, unique):
+    nav = [f"/about/section-{i}" for i in range(shared // 3)]
+    nav += [f"https://www.ics.uci.edu/people/group-{i}?sort=name&utm_source=nav" for i in range(shared // 3)]
+    nav += [f"https://www.cs.uci.edu/events/talk-{i}#top" for i in range(shared - len(nav))]
+    for page in range(pages):
+        page_url = f"https://www.ics.uci.edu/research/area-{page % 40}/project-{page}"
+        own = [f"project-{page}/paper-{i}.html" for i in range(unique)]
+        yield page_url, nav + own
+
+
+def resolve_all(pages):
+    links = 0
+    for page_url, hrefs in pages:
+        links += len(scraper.resolve_links(page_url, hrefs))
+    return links
+
+
+def main(pages, shared, unique):
+    workload = list(site_pages(pages, shared, unique))
+    print(f"{pages} pages, {shared} shared + {unique} own links each")
+    for label, size in [("no cache", 0), ("cache", scraper.LINK_CACHE_SIZE)]:
+        scraper.set_link_cache_size(size)
+        start = time.perf_counter()
+        links = resolve_all(workload)
+        elapsed = time.perf_counter() - start
+        info = scraper.link_cache_info()
+        print(f"  {label:<9} {elapsed / pages * 1e3:>7.2f} ms/page {links / elapsed:>10,.0f} links/s "
+              f"hits {info.hits:,} misses {info.misses:,}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--shared", type=int, default=150)
+    parser.add_argument("--unique", type=int, default=20)
+    args = parser.parse_args()
+    main(args.pages, args.shared, args.unique)
@@ -0,0 +1,87 @@
+"""Parse throughput of the page extractor versus the old three-walk soup code.
+
+Run from the repository root:
+    python benchmarks/parse_bench.py [--repeat 5]
+"""
+import glob
+import os
+import sys
+import time
+import unicodedata
+from argparse import ArgumentParser
+
+from bs4 import BeautifulSoup
+from bs4.element import Comment
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+import scraper
+from utils.page_extract import extract_page, DISALLOWED_TAGS, WORD_RE
+
+
+def three_walks(content):
+    """What extract_next_links did before the single-pass extractor."""
+    try:
+        soup = BeautifulSoup(content, "lxml")
+    except Exception:
+        soup = BeautifulSoup(content, "html.parser")
+    visible = [t.strip() for t in soup.find_all(string=True)
+               if t.parent.name not in DISALLOWED_TAGS and not isinstance(t, Comment) and t.strip()]
+    text_content = unicodedata.normalize("NFKC", " ".join(visible))
+    words = WORD_RE.findall(" ".join(visible).lower())
+    hrefs = [link.get("href").strip() for link in soup.find_all("a", href=True)]
+    return text_content, words, hrefs
+
+
+def large_page(target_bytes):
+    """A page close to scraper.MAX_BYTES: long listing with a link per row."""
+    row = ("<tr><td><a href='/people/{i}'>Person {i}</a></td>"
+           "<td>Research interests include distributed systems and data management.</td></tr>\n")
+    rows = []
+    size = 0
+    i = 0
+    while size < target_bytes:
+        r = row.format(i=i)
+        rows.append(r)
+        size += len(r)
+        i += 1
+    return f"<html><head><title>Directory</title></head><body><table>{''.join(rows)}</table></body></html>".encode()
+
+
+def measure(fn, pages, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for content in pages:
+            fn(content)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(repeat):
+    corpus = []
+    for path in sorted(glob.glob(os.path.join(ROOT, "tests", "corpus", "html", "*.html"))):
+        with open(path, "rb") as f:
+            corpus.append(f.read())
+    workloads = [
+        ("corpus", corpus),
+        ("large page", [large_page(scraper.MAX_BYTES - 100_000)]),
+    ]
+    candidates = [
+        ("three soup walks", three_walks),
+        ("soup single pass", lambda c: extract_page(c, "soup")),
+        ("lxml streaming", lambda c: extract_page(c, "lxml")),
+    ]
+    for name, pages in workloads:
+        total_mb = sum(len(p) for p in pages) / 1e6
+        print(f"{name}: {len(pages)} page(s), {total_mb:.2f} MB")
+        for label, fn in candidates:
+            elapsed = measure(fn, pages, repeat)
+            print(f"  {label:<18} {len(pages) / elapsed:>9.1f} pages/s {total_mb / elapsed:>8.2f} MB/s")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    main(args.repeat)
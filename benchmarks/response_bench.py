@@ -0,0 +1,83 @@
+"""Cost of decoding cache server answers the scraper turns down.
+
+For answers the scraper rejects (error status, oversize page, non-HTML) and
+for a regular page: time and peak memory from the CBOR body sent by the
+cache server to scraper.page_content, decoding the pickled page up front
+(as Response used to) and on first access.
+
+Run from the repository root:
+    python benchmarks/response_bench.py [--rounds 20]
+"""
+import logging
+import os
+import pickle
+import sys
+import time
+import tracemalloc
+from argparse import ArgumentParser
+
+import cbor
+import requests
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import scraper
+from utils.download import decode_cache_response
+
+logger = logging.getLogger("response_bench")
+
+
+def cache_answer(status, content_type, body):
+    raw = requests.Response()
+    raw.status_code = status
+    raw.url = "https://www.ics.uci.edu/benchmark"
+    raw.headers["Content-Type"] = content_type
+    raw._content = body
+    return cbor.dumps({
+        "url": raw.url, "status": status, "response": pickle.dumps(raw)})
+
+
+def cases():
+    page = b"<html><body>" + b"<p>Lorem ipsum dolor sit amet.</p>" * 1500 + b"</body></html>"
+    return [
+        ("404 page", cache_answer(404, "text/html", page)),
+        ("oversize page", cache_answer(
+            200, "text/html", b"<html>" + b"x" * (scraper.MAX_BYTES + scraper.MAX_PAYLOAD_SLACK))),
+        ("2 MB pdf", cache_answer(200, "application/pdf", b"%PDF-1.4" + b"\0" * 2_000_000)),
+        ("50 kB html", cache_answer(200, "text/html", page)),
+    ]
+
+
+def fetch(body, eager):
+    resp = decode_cache_response("https://www.ics.uci.edu/benchmark", 200, body, logger)
+    if eager:
+        resp.raw_response
+    return scraper.page_content(resp)
+
+
+def measure(body, eager, rounds):
+    fetch(body, eager)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fetch(body, eager)
+    elapsed = (time.perf_counter() - start) / rounds
+    tracemalloc.start()
+    fetch(body, eager)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main(rounds):
+    print(f"{'':<14} {'eager':>20} {'lazy':>20}")
+    for label, body in cases():
+        eager_time, eager_peak = measure(body, True, rounds)
+        lazy_time, lazy_peak = measure(body, False, rounds)
+        print(f"{label:<14} {eager_time * 1e3:>8.3f} ms {eager_peak / 2 ** 20:>6.2f} MiB"
+              f" {lazy_time * 1e3:>8.3f} ms {lazy_peak / 2 ** 20:>6.2f} MiB")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    main(args.rounds)
@@ -0,0 +1,69 @@
+"""Lookup cost of SimhashIndex versus the linear scan it replaced.
+
+Run from the repository root:
+    python benchmarks/simhash_index_bench.py [--sizes 10000 100000 1000000]
+"""
+import os
+import random
+import sys
+import time
+from argparse import ArgumentParser
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.simhash import SimhashIndex
+
+
+def linear_find_near(fingerprints, fingerprint, threshold):
+    for old in fingerprints:
+        if bin(old ^ fingerprint).count("1") < threshold:
+            return old
+    return None
+
+
+def probes_for(stored, rng, count, threshold):
+    """Half unseen fingerprints, half near-duplicates of stored ones."""
+    probes = [rng.getrandbits(64) for _ in range(count // 2)]
+    for fp in rng.sample(stored, count - len(probes)):
+        for bit in rng.sample(range(64), threshold - 1):
+            fp ^= 1 << bit
+        probes.append(fp)
+    return probes
+
+
+def time_per_call(fn, probes):
+    start = time.perf_counter()
+    for fp in probes:
+        fn(fp)
+    return (time.perf_counter() - start) / len(probes)
+
+
+def main(sizes, blocks, threshold=5, probe_count=2000, seed=121):
+    rng = random.Random(seed)
+    print(f"threshold={threshold} blocks={blocks or threshold + 1}")
+    print(f"{'stored':>10} {'build s':>9} {'index us':>10} {'linear us':>11}")
+    for size in sizes:
+        stored = [rng.getrandbits(64) for _ in range(size)]
+        index = SimhashIndex(threshold=threshold, blocks=blocks)
+        start = time.perf_counter()
+        for fp in stored:
+            index.add(fp)
+        build = time.perf_counter() - start
+
+        probes = probes_for(stored, rng, probe_count, threshold)
+        indexed = time_per_call(index.find_near, probes)
+        # The linear scan is far too slow to probe thousands of times at 1M.
+        linear_probes = probes[:max(1, probe_count * 1000 // size)]
+        linear = time_per_call(
+            lambda fp: linear_find_near(stored, fp, threshold), linear_probes)
+        print(f"{size:>10} {build:>9.2f} {indexed * 1e6:>10.2f} "
+              f"{linear * 1e6:>11.1f}")
+        del index, stored
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--blocks", type=int, default=None)
+    args = parser.parse_args()
+    main(args.sizes, args.blocks)
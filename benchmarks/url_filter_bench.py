@@ -0,0 +1,164 @@
+"""Throughput of the compiled url filter versus the old is_valid.
+
+Uses the recorded link set in tests/corpus/links.tsv (verdict, tab, url per
+line): hrefs of the corpus pages plus paths seen across the crawled
+subdomains, including the known traps. Both filters are checked against the
+recorded verdicts before timing.
+
+Run from the repository root:
+    python benchmarks/url_filter_bench.py [--repeat 20]
+"""
+import os
+import re
+import sys
+import time
+from argparse import ArgumentParser
+from collections import Counter
+from urllib.parse import urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from utils.url_filter import UrlFilter
+
+
+LEGACY_FILETYPE_PATTERN = re.compile(
+    r"\.(css|js|bmp|gif|jpe?g|ico|png|tiff?|mid|mp2|mp3|mp4|"
+    r"wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf|ps|eps|tex|ppt|pptx|"
+    r"doc|docx|xls|xlsx|names|data|dat|exe|bz2|tar|msi|bin|7z|psd|"
+    r"dmg|iso|epub|dll|cnf|tgz|sha1|thmx|mso|arff|rtf|jar|csv|"
+    r"rm|smil|wmv|swf|wma|zip|rar|gz)$"
+)
+
+LEGACY_VALID_SCHEMES = frozenset({"https", "http"})
+def legacy_is_valid(url):
+    """scraper.is_valid before the rule engine, kept for comparison."""
+    try:
+        if not url or len(url) > 2000:
+            return False
+
+        parsed = urlparse(url)
+        scheme = parsed.scheme.lower()
+        netloc = parsed.netloc.lower()
+        path = parsed.path or ""
+        query = parsed.query or ""
+
+        if scheme not in LEGACY_VALID_SCHEMES:
+            return False
+        if not re.search(r"(ics\.uci\.edu|cs\.uci\.edu|informatics\.uci\.edu|stat\.uci\.edu)$", netloc):
+            return False
+        if LEGACY_FILETYPE_PATTERN.search(path.lower()):
+            return False
+        if len(query) > 120 or path.count("/") > 15:
+            return False
+        if re.search(r"/\d{4}/\d{2}/\d{2}", path):
+            return False
+        if re.search(r"(page|p)=\d{3,}", query):
+            return False
+        if query:
+            if query.count("&") + 1 > 8:
+                return False
+        segments = [seg for seg in path.strip("/").split("/") if seg]
+        if len(segments) > 3 and len(set(segments)) < len(segments) / 2:
+            return False
+        if re.search(r"(sessionid|jsessionid|phpsessid|sid|token|ref)=\w+", query, re.IGNORECASE):
+            return False
+        if re.search(r"(session|login|logout)[=/]?", path, re.IGNORECASE):
+            return False
+        if len(netloc.split(".")) > 6:
+            return False
+        if any(len(seg) > 100 for seg in segments):
+            return False
+
+        path_lower = path.lower()
+        query_lower = query.lower()
+
+        #isg.ics calendar trap
+        if netloc == "isg.ics.uci.edu" and (path_lower.startswith("/events/") or path_lower.startswith("/event/")):
+            return False
+
+        #WICS / NGS calendar pages only (keep rest of the site)
+        if netloc in {"wics.ics.uci.edu", "ngs.ics.uci.edu"} and path_lower.startswith("/events/"):
+            return False
+
+        #doku.php wiki trees
+        if "doku.php" in path_lower:
+            return False
+
+        # gitlab commit/page explosion
+        if netloc == "gitlab.ics.uci.edu":
+            return False
+
+        # large image galleries with very low text value
+        if "/~eppstein/pix" in path_lower:
+            return False
+
+        # grape reported as an infinite trap
+        if netloc == "grape.ics.uci.edu":
+            return False
+
+        # fano rules tree
+        if netloc == "fano.ics.uci.edu" and path_lower.startswith("/ca/rules/"):
+            return False
+
+        # generic calendar engines mentioned (ical / tribe / wp-json)
+        if "ical" in path_lower or "ical" in query_lower:
+            return False
+        if "tribe_event" in query_lower or "/tribe/" in path_lower:
+            return False
+        if "wp-json" in path_lower:
+            return False
+
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def load_links():
+    links = []
+    with open(os.path.join(ROOT, "tests", "corpus", "links.tsv"), encoding="utf-8") as f:
+        for line in f:
+            verdict, url = line.rstrip("\n").split("\t", 1)
+            links.append((url, verdict == "1"))
+    return links
+
+
+def measure(fn, urls, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for url in urls:
+            fn(url)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(repeat):
+    links = load_links()
+    urls = [url for url, _ in links]
+    url_filter = UrlFilter.from_file()
+    candidates = [
+        ("legacy is_valid", legacy_is_valid),
+        ("UrlFilter.is_valid", url_filter.is_valid),
+        ("UrlFilter.check", url_filter.check),
+    ]
+    for label, fn in candidates[:2]:
+        wrong = sum(fn(url) != verdict for url, verdict in links)
+        assert not wrong, f"{label} disagrees with {wrong} recorded verdicts"
+
+    print(f"{len(urls)} recorded links, {sum(v for _, v in links)} valid")
+    for label, fn in candidates:
+        elapsed = measure(fn, urls, repeat)
+        print(f"  {label:<20} {len(urls) / elapsed:>12,.0f} urls/s")
+
+    reasons = Counter(url_filter.check(url) for url in urls)
+    del reasons[None]
+    print("rejections by reason:")
+    for reason, count in reasons.most_common():
+        print(f"  {reason:<20} {count}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    main(args.repeat)
@@ -1,26 +1,94 @@
+import time
+
 from utils import get_logger
+from utils.stats import MetricsFlusher
+from utils.timing import stage_timings
+from utils.page_store import PageStore
 from crawler.frontier import Frontier
 from crawler.worker import Worker
+from crawler.autoscale import Autoscaler
+from crawler.async_worker import AsyncWorker
+from crawler.pipeline import Pipeline
+import scraper
+
+# ENGINE in config.ini -> (worker class, how many of them to start)
+ENGINES = {
+    "threads": (Worker, lambda config: config.threads_count),
+    # One event loop multiplexes every download
+    "asyncio": (AsyncWorker, lambda config: 1),
+    # Runs its own fetch threads and analysis processes
+    "pipeline": (Pipeline, lambda config: 1),
+}
 
 class Crawler(object):
-    def __init__(self, config, restart, frontier_factory=Frontier, worker_factory=Worker):
+    def __init__(self, config, restart, frontier_factory=Frontier, worker_factory=None):
         self.config = config
         self.logger = get_logger("CRAWLER")
+        scraper.set_link_cache_size(config.link_cache_size)
+        scraper.set_trap_limits(config.trap_min_pages, config.trap_bad_ratio)
+        if config.recrawl:
+            scraper.set_page_store(PageStore(config.recrawl_file))
         self.frontier = frontier_factory(config, restart)
         self.workers = list()
-        self.worker_factory = worker_factory
+        engine, self.workers_count = ENGINES[config.engine]
+        self.worker_factory = worker_factory or engine
+        # Only the threads engine runs one download per thread
+        self.autoscaler = None
+        if config.autoscale and config.engine == "threads":
+            self.autoscaler = Autoscaler(
+                self, config.min_threads_count, config.max_threads_count,
+                config.autoscale_interval)
+        # Only written on a timer and at the end of the crawl
+        self.timings_flusher = MetricsFlusher(
+            lambda: stage_timings.dump(config.stage_timings_file),
+            interval=config.stage_timings_interval, every_pages=float("inf"))
 
     def start_async(self):
-        self.workers = [
-            self.worker_factory(worker_id, self.config, self.frontier)
-            for worker_id in range(self.config.threads_count)]
-        for worker in self.workers:
-            worker.start()
+        self.started = time.monotonic()
+        if self.autoscaler is not None:
+            scaler = self.autoscaler
+            scaler.start_workers(max(scaler.min_workers, min(
+                scaler.max_workers, self.workers_count(self.config))))
+            scaler.start()
+        else:
+            self.workers = [
+                self.worker_factory(worker_id, self.config, self.frontier)
+                for worker_id in range(self.workers_count(self.config))]
+            for worker in self.workers:
+                worker.start()
+        self.timings_flusher.start()
 
     def start(self):
         self.start_async()
         self.join()
 
     def join(self):
-        for worker in self.workers:
-            worker.join()
+        # The autoscaler may add workers while the others are joined
+        while True:
+            alive = [worker for worker in self.workers if worker.is_alive()]
+            if not alive:
+                break
+            for worker in alive:
+                worker.join()
+        if self.autoscaler is not None:
+            self.autoscaler.stop()
+        # Frontiers that buffer their state get a chance to write it out.
+        if hasattr(self.frontier, "close"):
+            self.frontier.close()
+        scraper.metrics_flusher.close()
+        if scraper.page_store is not None:
+            store = scraper.page_store
+            self.logger.info(
+                f"Recrawl: {store.unchanged_count} pages unchanged, "
+                f"{store.changed_count} new or changed.")
+            scraper.set_page_store(None)
+            store.close()
+        self.timings_flusher.close()
+        self.logger.info(f"Link cache: {scraper.link_cache_info()}")
+        if hasattr(self.frontier, "completed_count"):
+            # Comparable between builds when replaying the same archive
+            elapsed = time.monotonic() - self.started
+            pages = self.frontier.completed_count
+            self.logger.info(
+                f"Crawled {pages} pages in {elapsed:.1f} s "
+                f"({pages / max(elapsed, 1e-9):.1f} pages/s).")
@@ -0,0 +1,212 @@
+import asyncio
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+from urllib.parse import urlencode
+
+from inspect import getsource
+from utils.download import decode_cache_response, latencies, DOWNLOAD_FAILED_STATUS
+from utils.response import Response
+from utils import get_logger
+import scraper
+
+
+class CacheServerError(Exception):
+    pass
+
+
+class _Connection(object):
+    ''' One keep-alive HTTP/1.1 connection to the cache server. '''
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    async def get(self, target, host_header):
+        self.writer.write(
+            f"GET {target} HTTP/1.1\r\n"
+            f"Host: {host_header}\r\n"
+            f"Accept-Encoding: identity\r\n"
+            f"Connection: keep-alive\r\n\r\n".encode("latin-1"))
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        parts = status_line.split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith(b"HTTP/"):
+            raise CacheServerError(f"Bad status line {status_line!r}")
+        status = int(parts[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                raise CacheServerError("Connection closed in headers")
+            if line in (b"\r\n", b"\n"):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    # Trailers end with an empty line
+                    while (await self.reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readexactly(2)
+            body = b"".join(chunks)
+        elif "content-length" in headers:
+            body = await self.reader.readexactly(int(headers["content-length"]))
+        else:
+            body = await self.reader.read()
+            headers["connection"] = "close"
+        reusable = headers.get("connection", "").lower() != "close"
+        return status, body, reusable
+
+    def close(self):
+        self.writer.close()
+
+
+class _ConnectionPool(object):
+    ''' Idle keep-alive connections to the cache server, shared by every
+    download of the event loop. '''
+
+    def __init__(self, host, port, connect_timeout):
+        self.host = host
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self._idle = []
+
+    async def acquire(self):
+        if self._idle:
+            return self._idle.pop()
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port),
+            timeout=self.connect_timeout)
+        return _Connection(reader, writer)
+
+    def release(self, connection, reusable):
+        if reusable:
+            self._idle.append(connection)
+        else:
+            connection.close()
+
+    def close(self):
+        for connection in self._idle:
+            connection.close()
+        self._idle = []
+
+
+class AsyncWorker(Thread):
+    ''' Crawls with a single asyncio event loop instead of one thread per
+    download.
+
+    Up to `config.async_concurrency` downloads are in flight at once over a
+    pool of keep-alive connections to the cache server. The frontier and
+    scraper.scraper are the same ones the threaded Worker uses; since they
+    block (locks, parsing), they run on small thread pools so the loop keeps
+    serving the open connections. '''
+
+    def __init__(self, worker_id, config, frontier):
+        self.logger = get_logger(f"AsyncWorker-{worker_id}", "Worker")
+        self.config = config
+        self.frontier = frontier
+        # basic check for requests in scraper
+        assert {getsource(scraper).find(req) for req in {"from requests import", "import requests"}} == {-1}, "Do not use requests in scraper.py"
+        assert {getsource(scraper).find(req) for req in {"from urllib.request import", "import urllib.request"}} == {-1}, "Do not use urllib.request in scraper.py"
+        super().__init__(daemon=True)
+
+    def run(self):
+        asyncio.run(self._crawl())
+
+    async def _crawl(self):
+        loop = asyncio.get_running_loop()
+        host, port = self.config.cache_server
+        self._pool = _ConnectionPool(host, port, self.config.connect_timeout)
+        # get_tbd_url waits for a host to become ready; give it its own thread
+        # so that wait never holds up scraping.
+        self._frontier_pool = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="AsyncFrontier")
+        self._scrape_pool = ThreadPoolExecutor(
+            max_workers=self.config.threads_count, thread_name_prefix="AsyncScrape")
+        slots = asyncio.Semaphore(self.config.async_concurrency)
+        tasks = set()
+        try:
+            while True:
+                await slots.acquire()
+                tbd_url = await loop.run_in_executor(
+                    self._frontier_pool, self.frontier.get_tbd_url)
+                if not tbd_url:
+                    slots.release()
+                    self.logger.info("Frontier is empty. Stopping Crawler.")
+                    break
+                task = asyncio.create_task(self._process(tbd_url))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                task.add_done_callback(lambda _: slots.release())
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            self._pool.close()
+            self._frontier_pool.shutdown()
+            self._scrape_pool.shutdown()
+
+    async def _process(self, tbd_url):
+        loop = asyncio.get_running_loop()
+        try:
+            resp = await self._download(tbd_url)
+            self.logger.info(
+                f"Downloaded {tbd_url}, status <{resp.status}>, "
+                f"using cache {self.config.cache_server}.")
+            await loop.run_in_executor(
+                self._scrape_pool, self._scrape, tbd_url, resp)
+        except Exception as e:
+            self.logger.error(f"Failed to process {tbd_url}: {e!r}")
+        finally:
+            # The frontier enforces politeness per host; completing the url
+            # always frees its host.
+            await loop.run_in_executor(
+                self._scrape_pool, self.frontier.mark_url_complete, tbd_url)
+
+    def _scrape(self, tbd_url, resp):
+        for scraped_url in scraper.scraper(tbd_url, resp):
+            self.frontier.add_url(scraped_url)
+
+    async def _download(self, url):
+        ''' Same contract as utils.download.download: connection errors and
+        timeouts are retried with exponential backoff, as are 502/503/504
+        answers, and a download that never succeeds reports
+        DOWNLOAD_FAILED_STATUS. '''
+        host, port = self.config.cache_server
+        target = "/?" + urlencode([("q", f"{url}"), ("u", f"{self.config.user_agent}")])
+        host_header = f"{host}:{port}"
+        error = None
+        for attempt in range(self.config.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(self.config.retry_backoff * 2 ** (attempt - 1))
+            start = time.monotonic()
+            connection = None
+            try:
+                connection = await self._pool.acquire()
+                status, body, reusable = await asyncio.wait_for(
+                    connection.get(target, host_header),
+                    timeout=self.config.read_timeout)
+            except (OSError, EOFError, ValueError, asyncio.TimeoutError,
+                    asyncio.IncompleteReadError, CacheServerError) as e:
+                if connection is not None:
+                    connection.close()
+                error = e
+                continue
+            self._pool.release(connection, reusable)
+            latencies.record(time.monotonic() - start)
+            if status in (502, 503, 504) and attempt < self.config.max_retries:
+                continue
+            return decode_cache_response(url, status, body, self.logger)
+        self.logger.error(f"Download failed for url {url}: {error!r}")
+        return Response({
+            "error": f"Download failed for url {url}: {error!r}",
+            "status": DOWNLOAD_FAILED_STATUS,
+            "url": url})
@@ -0,0 +1,133 @@
+import heapq
+import math
+from threading import Thread, Event, Lock
+
+from utils import get_logger
+from utils import download
+
+
+def plan(current, load, latency, delay, min_workers, max_workers):
+    ''' How many workers the frontier can keep busy.
+
+    `load` is HostScheduler.load(). A host admits one download at a time and
+    then rests `delay` seconds, so a worker per active host is only busy a
+    latency / (latency + delay) share of the time; hosts that are ready but
+    not picked up show the pool is short right now. Growth is immediate,
+    shrinking goes half way per step so a brief lull does not drain the
+    pool. '''
+    pending, hosts, ready, leased = load
+    if not pending and not leased:
+        target = min_workers
+    else:
+        busy = latency / (latency + delay) if latency and delay else 1.0
+        target = math.ceil(hosts * busy)
+        if ready:
+            target = max(target, current + ready)
+        if target < current:
+            target = current - math.ceil((current - target) / 2)
+    return max(min_workers, min(max_workers, target))
+
+
+class Autoscaler(Thread):
+    ''' Grows and shrinks the pool of crawl threads of a Crawler.
+
+    Every `interval` seconds it sizes the pool with plan() from the frontier
+    queue and the median download latency. New workers are started right
+    away; surplus workers retire (see retire()) before taking their next
+    url, so no download is cut short. Stopped workers are dropped from the
+    crawler with their log handlers closed, and their ids are given to the
+    next workers started, so there are never more worker loggers than the
+    largest the pool has been. '''
+
+    def __init__(self, crawler, min_workers, max_workers, interval):
+        super().__init__(daemon=True, name="Autoscaler")
+        self.logger = get_logger("AUTOSCALE")
+        self.crawler = crawler
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.interval = interval
+        self.target = crawler.workers_count(crawler.config)
+        # Workers started and not retired or stopped
+        self.active = 0
+        self._lock = Lock()
+        self._stopped = Event()
+        # Id of each worker in crawler.workers, and the ids free for reuse
+        self._worker_ids = dict()
+        self._free_ids = []
+
+    def start_workers(self, count):
+        self._prune()
+        for _ in range(count):
+            if self._free_ids:
+                worker_id = heapq.heappop(self._free_ids)
+            else:
+                worker_id = len(self._worker_ids)
+            worker = self.crawler.worker_factory(
+                worker_id, self.crawler.config, self.crawler.frontier)
+            worker.pool = self
+            self._worker_ids[worker] = worker_id
+            with self._lock:
+                self.active += 1
+            self.crawler.workers.append(worker)
+            worker.start()
+
+    def _prune(self):
+        ''' Drop the stopped workers from the crawler and free their ids. '''
+        alive = []
+        for worker in self.crawler.workers:
+            if worker.is_alive():
+                alive.append(worker)
+                continue
+            worker_id = self._worker_ids.pop(worker, None)
+            if worker_id is not None:
+                heapq.heappush(self._free_ids, worker_id)
+            logger = getattr(worker, "logger", None)
+            if logger is not None:
+                # get_logger adds new ones when the id is reused
+                for handler in list(logger.handlers):
+                    logger.removeHandler(handler)
+                    handler.close()
+        self.crawler.workers[:] = alive
+
+    def retire(self, worker):
+        ''' Called by a worker before taking a url; True if it should stop. '''
+        with self._lock:
+            if self.active > self.target:
+                self.active -= 1
+                return True
+            return False
+
+    def worker_stopped(self):
+        ''' A worker stopped on its own: the frontier was empty, or it failed. '''
+        with self._lock:
+            self.active -= 1
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.adjust()
+
+    def stop(self):
+        self._stopped.set()
+
+    def adjust(self):
+        self._prune()
+        load = self.crawler.frontier.to_be_downloaded.load()
+        latency = download.latencies.percentile(50)
+        with self._lock:
+            active = self.active
+            if not active:
+                # The crawl is over (or not started): nothing to scale
+                return
+            target = plan(
+                active, load, latency, self.crawler.config.time_delay,
+                self.min_workers, self.max_workers)
+            self.target = target
+        if target != active:
+            pending, hosts, ready, leased = load
+            latency_text = f"{latency:.2f} s" if latency is not None else "unknown"
+            self.logger.info(
+                f"{active} -> {target} workers: {pending} urls pending on "
+                f"{hosts} hosts, {ready} ready, {leased} downloading, "
+                f"median latency {latency_text}.")
+        if target > active:
+            self.start_workers(target - active)
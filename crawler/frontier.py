@@ -1,18 +1,359 @@
 import os
+import re
+import json
+import math
 import shelve
+import time
+import heapq
 
-from threading import Thread, RLock
-from queue import Queue, Empty
+from collections import deque
+from hashlib import sha256
+from inspect import getsource
+from itertools import chain
+from threading import Thread, Lock, RLock, Condition, Event
+from urllib.parse import urlparse, parse_qsl
+
+from utils import get_logger, get_urlhash, normalize, write_file_atomically
+from utils.bloom import BloomFilter
+from scraper import is_valid, url_filter, trap_templates
+from crawler.wal import WriteAheadLog
+from crawler.spill import SpillingScheduler
+from crawler.snapshot import Snapshot, sorted_digests, write_snapshot
+
+
+class HostScheduler(object):
+    ''' Per-host FIFO queues handed out in politeness order.
+
+    A host with pending urls is either waiting on the ready-time heap or
+    leased to the worker that is downloading one of its urls. Releasing the
+    lease puts the host back on the heap, ready `delay` seconds later, so a
+    host is never fetched by two workers at once nor twice within the
+    politeness window, while other hosts keep every worker busy. '''
+
+    def __init__(self, delay):
+        self.delay = delay
+        self._queues = dict()       # host -> deque of urls to be downloaded
+        self._ready = []            # heap of (ready time, host) for hosts not leased
+        self._next_ready = dict()   # host -> earliest time it may be fetched again
+        self._leased = set()        # hosts with a url being downloaded
+        self._pending = 0
+        self._producers = 0         # background loaders still adding urls
+        self._cond = Condition()
+
+    @staticmethod
+    def host_of(url):
+        return urlparse(url).netloc.lower()
+
+    def __len__(self):
+        return self._pending
+
+    def load(self):
+        ''' (pending urls, hosts with pending or leased urls, hosts ready to
+        be fetched now, leased hosts), for sizing the worker pool. '''
+        with self._cond:
+            now = time.monotonic()
+            ready = sum(1 for ready_time, _ in self._ready if ready_time <= now)
+            hosts = len(self._queues.keys() | self._leased)
+            return self._pending, hosts, ready, len(self._leased)
+
+    def restore(self, url):
+        ''' Queue a url again after a restart. '''
+        self.put(url)
+
+    def evict(self, count):
+        ''' Take up to `count` pending urls out, the least promising first:
+        at most half of the pending urls of the host with the most at a
+        time, never a host's last one, so every host stays scheduled. '''
+        evicted = []
+        with self._cond:
+            while len(evicted) < count and self._queues:
+                host = max(self._queues, key=lambda host: len(self._queues[host]))
+                take = min(count - len(evicted), len(self._queues[host]) // 2)
+                if not take:
+                    break
+                evicted.extend(self._take_worst(host, take))
+                self._pending -= take
+        return evicted
+
+    def _take_worst(self, host, count):
+        queue = self._queues[host]
+        # The last queued go first
+        return [queue.pop() for _ in range(count)]
+
+    def get_state(self):
+        ''' Scheduling state to persist with the frontier, if any. '''
+        return None
+
+    def set_state(self, state):
+        pass
+
+    def close(self):
+        pass
+
+    def add_producer(self):
+        ''' Keep get() waiting, even with nothing pending, until the matching
+        remove_producer() call. '''
+        with self._cond:
+            self._producers += 1
+
+    def remove_producer(self):
+        with self._cond:
+            self._producers -= 1
+            self._cond.notify_all()
+
+    def put(self, url):
+        host = self.host_of(url)
+        with self._cond:
+            queue = self._queues.get(host)
+            if queue is None:
+                queue = self._queues[host] = deque()
+            queue.append(url)
+            self._pending += 1
+            # An idle host enters the heap with its first pending url
+            if len(queue) == 1 and host not in self._leased:
+                heapq.heappush(
+                    self._ready, (self._next_ready.get(host, 0.0), host))
+                self._cond.notify()
+
+    def get(self, timeout):
+        ''' Lease the host whose politeness window expires first and return
+        its next url. Waits while other hosts are leased or a producer is
+        loading urls, since either may still add some; returns None once
+        nothing is pending or in flight for `timeout` seconds. '''
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if self._ready:
+                    ready_time, host = self._ready[0]
+                    if ready_time <= now:
+                        heapq.heappop(self._ready)
+                        queue = self._queues[host]
+                        url = queue.popleft()
+                        if not queue:
+                            del self._queues[host]
+                        self._pending -= 1
+                        self._leased.add(host)
+                        return url
+                    wait_for = ready_time - now
+                elif self._leased or self._producers:
+                    wait_for = None
+                elif now < deadline:
+                    wait_for = deadline - now
+                else:
+                    return None
+                self._cond.wait(wait_for)
+
+    def release(self, url):
+        ''' End the lease taken by get() once the url has been downloaded. '''
+        host = self.host_of(url)
+        with self._cond:
+            if host not in self._leased:
+                return
+            self._leased.discard(host)
+            ready_time = time.monotonic() + self.delay
+            self._next_ready[host] = ready_time
+            if host in self._queues:
+                heapq.heappush(self._ready, (ready_time, host))
+            self._cond.notify_all()
+
+
+# Score = -(DEPTH_WEIGHT * depth + HOST_WEIGHT * log2(1 + pages crawled on
+# the host) + PATTERN_WEIGHT * log2(1 + urls seen with the same pattern)),
+# so shallow urls of little-crawled hosts and one-off patterns come first.
+DEPTH_WEIGHT = 1.0
+HOST_WEIGHT = 1.0
+PATTERN_WEIGHT = 2.0
+# Hosts past their budget only get a worker when no other host is ready
+OVER_BUDGET_PENALTY = 1000.0
+# Patterns counted at most; past it the rarest half is forgotten
+MAX_PATTERNS = 100_000
+
+_DIGITS_RE = re.compile(r"\d+")
+
+
+class UrlScorer(object):
+    ''' Scores urls from their depth, the pages crawled on their host and
+    how often their pattern (digits and query values masked) was seen.
+
+    At most `max_patterns` patterns are counted: when one more is seen, only
+    the most common half is kept. A forgotten pattern was rare, so its urls
+    score about the same as before. '''
+
+    def __init__(self, max_patterns=MAX_PATTERNS):
+        self.max_patterns = max_patterns
+        self.patterns = dict()      # pattern -> urls queued with it
+        self.host_pages = dict()    # host -> pages crawled
+
+    @staticmethod
+    def pattern(parsed):
+        keys = sorted({key for key, _ in parse_qsl(parsed.query, keep_blank_values=True)})
+        return f"{parsed.netloc.lower()}{_DIGITS_RE.sub('{d}', parsed.path)}?{'&'.join(keys)}"
+
+    def score(self, url, host, count=True):
+        ''' Score of a url being queued; `count` adds it to its pattern. '''
+        parsed = urlparse(url)
+        depth = len([segment for segment in parsed.path.split("/") if segment])
+        if parsed.query:
+            depth += 1
+        pattern = self.pattern(parsed)
+        seen = self.patterns.get(pattern, 0)
+        if count:
+            self.patterns[pattern] = seen + 1
+            if len(self.patterns) > self.max_patterns:
+                self.forget_rare_patterns()
+        return -(DEPTH_WEIGHT * depth
+                 + HOST_WEIGHT * math.log2(1 + self.host_pages.get(host, 0))
+                 + PATTERN_WEIGHT * math.log2(1 + seen))
+
+    def forget_rare_patterns(self):
+        kept = heapq.nlargest(
+            self.max_patterns // 2, self.patterns.items(), key=lambda item: item[1])
+        self.patterns = dict(kept)
+
+
+class PriorityScheduler(HostScheduler):
+    ''' HostScheduler handing out the best-scored urls first.
+
+    Each host keeps a heap of its urls by UrlScorer score instead of a FIFO.
+    Hosts out of their politeness window move from the ready-time heap to a
+    heap keyed on the score of their best url (less OVER_BUDGET_PENALTY once
+    `host_budget` pages of the host were crawled; 0 means no budget), which
+    get() pops. Superseded entries of the second heap are skipped when they
+    surface, so put(), get() and release() are all O(log n). '''
+
+    def __init__(self, delay, host_budget=0):
+        super().__init__(delay)
+        self.host_budget = host_budget
+        self.scorer = UrlScorer()
+        self._best = []             # heap of (-priority, seq, host) for hosts ready now
+        self._in_best = dict()      # host -> seq of its live entry in _best
+        self._seq = 0
+
+    def put(self, url, count=True):
+        host = self.host_of(url)
+        with self._cond:
+            self._seq += 1
+            score = self.scorer.score(url, host, count)
+            queue = self._queues.get(host)
+            if queue is None:
+                queue = self._queues[host] = []
+            heapq.heappush(queue, (-score, self._seq, url))
+            self._pending += 1
+            if host in self._leased:
+                return
+            if host in self._in_best:
+                if queue[0][2] == url:
+                    # Its best url changed
+                    self._push_best(host)
+            elif len(queue) == 1:
+                heapq.heappush(
+                    self._ready, (self._next_ready.get(host, 0.0), host))
+                self._cond.notify()
+
+    def restore(self, url):
+        ''' Queue a url again after a restart or a spill, without counting its
+        pattern twice. '''
+        self.put(url, count=False)
+
+    def _take_worst(self, host, count):
+        # Sorted is a heap, and the best url stays first
+        queue = sorted(self._queues[host])
+        self._queues[host] = queue[:-count]
+        return [entry[2] for entry in queue[-count:]]
+
+    def _push_best(self, host):
+        self._seq += 1
+        priority = -self._queues[host][0][0]
+        if self.host_budget and self.scorer.host_pages.get(host, 0) >= self.host_budget:
+            priority -= OVER_BUDGET_PENALTY
+        self._in_best[host] = self._seq
+        heapq.heappush(self._best, (-priority, self._seq, host))
+
+    def get(self, timeout):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                while self._ready and self._ready[0][0] <= now:
+                    _, host = heapq.heappop(self._ready)
+                    self._push_best(host)
+                while self._best:
+                    _, seq, host = heapq.heappop(self._best)
+                    if self._in_best.get(host) != seq:
+                        continue
+                    del self._in_best[host]
+                    queue = self._queues[host]
+                    url = heapq.heappop(queue)[2]
+                    if not queue:
+                        del self._queues[host]
+                    self._pending -= 1
+                    self._leased.add(host)
+                    return url
+                if self._ready:
+                    wait_for = self._ready[0][0] - now
+                elif self._leased or self._producers:
+                    wait_for = None
+                elif now < deadline:
+                    wait_for = deadline - now
+                else:
+                    return None
+                self._cond.wait(wait_for)
+
+    def release(self, url):
+        host = self.host_of(url)
+        with self._cond:
+            if host not in self._leased:
+                return
+            pages = self.scorer.host_pages
+            pages[host] = pages.get(host, 0) + 1
+        super().release(url)
+
+    def load(self):
+        with self._cond:
+            now = time.monotonic()
+            ready = len(self._in_best) + sum(
+                1 for ready_time, _ in self._ready if ready_time <= now)
+            hosts = len(self._queues.keys() | self._leased)
+            return self._pending, hosts, ready, len(self._leased)
+
+    def get_state(self):
+        with self._cond:
+            return {"patterns": dict(self.scorer.patterns),
+                    "host_pages": dict(self.scorer.host_pages)}
+
+    def set_state(self, state):
+        with self._cond:
+            self.scorer.patterns = dict(state["patterns"])
+            self.scorer.host_pages = dict(state["host_pages"])
+            if len(self.scorer.patterns) > self.scorer.max_patterns:
+                self.scorer.forget_rare_patterns()
 
-from utils import get_logger, get_urlhash, normalize
-from scraper import is_valid
 
 class Frontier(object):
     def __init__(self, config, restart):
         self.logger = get_logger("FRONTIER")
         self.config = config
-        self.to_be_downloaded = Queue()
+        if self.config.priority_frontier:
+            self.to_be_downloaded = PriorityScheduler(
+                self.config.time_delay, self.config.host_budget)
+        else:
+            self.to_be_downloaded = HostScheduler(self.config.time_delay)
+        if self.config.frontier_memory_urls:
+            # Pending urls past the cap wait on disk; any left from an
+            # earlier run are queued again from the checkpoint and log
+            self.to_be_downloaded = SpillingScheduler(
+                self.to_be_downloaded, f"{self.config.save_file}.spill",
+                self.config.frontier_memory_urls)
         self.save_lock = RLock()
+        wal_file = f"{self.config.save_file}.wal"
+        # The log up to the checkpoint being written, see _checkpoint
+        self.old_wal_file = f"{wal_file}.old"
+        self.snapshot_file = f"{self.config.save_file}.snapshot"
+        # Scheduling state (url scores) as of the last checkpoint
+        self.priority_file = f"{self.config.save_file}.priority"
+        # Trap templates learned by the scraper, as of the last checkpoint
+        self.traps_file = f"{self.config.save_file}.traps"
         
         if not os.path.exists(self.config.save_file) and not restart:
             # Save file does not exist, but request to load save.
@@ -24,17 +365,324 @@ class Frontier(object):
             self.logger.info(
                 f"Found save file {self.config.save_file}, deleting it.")
             os.remove(self.config.save_file)
-        # Load existing save file, or create one if it does not exist.
-        self.save = shelve.open(self.config.save_file)
         if restart:
+            for path in (wal_file, self.old_wal_file, self.snapshot_file,
+                         self.priority_file, self.traps_file):
+                if os.path.exists(path):
+                    os.remove(path)
+            trap_templates.clear()
+        # The save file is a checkpoint: changes since the last checkpoint
+        # live in self.unsaved and in the write-ahead log until the next one.
+        # It is opened by _resume, in the background when resuming from a
+        # snapshot, since loading a large one is slow.
+        self.save = None
+        self.unsaved = dict()
+        # Changes cut off by the checkpoint being written, until it is done
+        self.checkpointing = dict()
+        # Snapshot of the last checkpoint and its position in the log
+        self.snapshot = None
+        self.checkpoint_id = 0
+        # Every discovered url hash is added, so a url missing from it is
+        # new without asking the save file. Until a resumed snapshot has been
+        # loaded into it, it is bypassed.
+        self.discovered_filter = BloomFilter(
+            self.config.bloom_capacity, self.config.bloom_error_rate)
+        self._filter_ready = True
+        self._loaded_filter = None
+        # add_url / mark_url_complete counters for report()
+        self._pages = 0
+        self._added_checks = 0
+        self._filter_skips = 0
+        self._store_lookups = 0
+        self._trap_skips = 0
+        self._lock_held = 0.0
+        self._validator_signature = sha256(
+            getsource(is_valid).encode("utf-8") + url_filter.signature()).digest()
+        self._loader = None
+        # Checkpoints run one at a time, on the checkpointer thread once
+        # the frontier is open; the save file is only used by them.
+        self._checkpoint_lock = Lock()
+        self._checkpoint_wanted = Event()
+        self._closing = False
+        self.wal = WriteAheadLog(
+            wal_file, self.config.wal_commit_interval,
+            self.config.wal_commit_size)
+        if restart:
+            # Load existing save file, or create one if it does not exist.
+            self.save = shelve.open(self.config.save_file)
             for url in self.config.seed_urls:
                 self.add_url(url)
+            # From now on add_url only asks the snapshot, never the save file
+            self._checkpoint()
         else:
             # Set the frontier state with contents of save file.
-            self._parse_save_file()
-            if not self.save:
+            self._resume()
+            if self.snapshot is not None:
+                discovered = self.snapshot.discovered_count
+            else:
+                discovered = len(self.save)
+            if not discovered and not self.unsaved:
                 for url in self.config.seed_urls:
                     self.add_url(url)
+        self._checkpointer = Thread(
+            target=self._checkpoint_when_wanted, daemon=True, name="Checkpointer")
+        self._checkpointer.start()
+
+    def _resume(self):
+        if os.path.exists(self.priority_file):
+            try:
+                with open(self.priority_file, encoding="utf-8") as f:
+                    self.to_be_downloaded.set_state(json.load(f))
+            except (OSError, ValueError, KeyError) as e:
+                self.logger.error(f"Ignoring scheduling state: {e!r}")
+        if os.path.exists(self.traps_file):
+            try:
+                with open(self.traps_file, encoding="utf-8") as f:
+                    trap_templates.set_state(json.load(f))
+            except (OSError, ValueError, TypeError) as e:
+                self.logger.error(f"Ignoring trap templates: {e!r}")
+        records = list(self.wal.replay())
+        old_records = []
+        if os.path.exists(self.old_wal_file):
+            # The run died while writing a checkpoint
+            old_records = list(self.wal.replay(self.old_wal_file))
+        log_checkpoint = None
+        if records and records[0][0] == "checkpoint":
+            log_checkpoint = records[0][1]
+        snapshot = None
+        if os.path.exists(self.snapshot_file):
+            try:
+                snapshot = Snapshot(self.snapshot_file)
+            except ValueError as e:
+                self.logger.error(f"Ignoring snapshot: {e}")
+        if snapshot is not None and snapshot.checkpoint_id == log_checkpoint:
+            # Written in full: the log it was cut from is checkpointed
+            if old_records:
+                os.remove(self.old_wal_file)
+            self._resume_from_snapshot(snapshot, records)
+            return
+        # No snapshot, or the run died before the snapshot of the last
+        # checkpoint was written: rebuild everything from the save file.
+        if snapshot is not None:
+            snapshot.close()
+        self.save = shelve.open(self.config.save_file)
+        self._replay_wal(old_records + records, self._is_discovered)
+        self.save.update(self.unsaved)
+        self.save.sync()
+        self.unsaved.clear()
+        for urlhash in self.save.keys():
+            self.discovered_filter.add(urlhash)
+        self._parse_save_file()
+        self._checkpoint()
+
+    def _replay_wal(self, records, is_discovered):
+        ''' Recover changes logged after the last checkpoint. '''
+        replayed = 0
+        for op, value in records:
+            if op == "checkpoint":
+                self.checkpoint_id = value
+                continue
+            urlhash = get_urlhash(value)
+            if op == "done":
+                self.unsaved[urlhash] = (value, True)
+            elif urlhash not in self.unsaved and not is_discovered(urlhash):
+                self.unsaved[urlhash] = (value, False)
+            replayed += 1
+        if replayed:
+            self.logger.info(
+                f"Recovered {replayed} changes from {self.wal.path}.")
+
+    def _resume_from_snapshot(self, snapshot, records):
+        ''' Start from the checkpoint snapshot plus the log written after it.
+
+        Urls logged since the checkpoint are queued right away; a background
+        thread streams the pending urls of the snapshot into the queue and
+        then opens the save file, so workers can start before either is
+        loaded. The log is kept as it is and folded in by the next
+        checkpoint. '''
+        self.snapshot = snapshot
+        self.checkpoint_id = snapshot.checkpoint_id
+        self._replay_wal(
+            records, lambda urlhash: urlhash in snapshot)
+        completed = set()
+        for urlhash in self.unsaved:
+            self.discovered_filter.add(urlhash)
+        self._filter_ready = False
+        for url, done in self.unsaved.values():
+            if done:
+                completed.add(url)
+            elif is_valid(url):
+                self.to_be_downloaded.put(url)
+        # Validity was checked when the urls were queued; it only needs
+        # checking again if is_valid has changed since the snapshot.
+        revalidate = snapshot.signature != self._validator_signature
+        self.to_be_downloaded.add_producer()
+        self._loader = Thread(
+            target=self._load_snapshot_pending,
+            args=(snapshot, completed, revalidate), daemon=True)
+        self._loader.start()
+        self.logger.info(
+            f"Resuming from checkpoint {self.checkpoint_id}: loading "
+            f"{snapshot.pending_count} urls to be downloaded from "
+            f"{snapshot.discovered_count} total urls discovered.")
+
+    def _load_snapshot_pending(self, snapshot, completed, revalidate):
+        try:
+            for url in snapshot.iter_pending():
+                if url in completed:
+                    continue
+                if revalidate and not is_valid(url):
+                    continue
+                self.to_be_downloaded.restore(url)
+        finally:
+            self.to_be_downloaded.remove_producer()
+        # Fill a filter of its own so add_url need not wait. It is merged into
+        # the shared one by the next caller holding save_lock, which is not
+        # taken here so that adding urls never waits for the loading.
+        loaded = BloomFilter(
+            self.config.bloom_capacity, self.config.bloom_error_rate)
+        for digests in snapshot.iter_digest_chunks():
+            loaded.add_digests(digests)
+        self._loaded_filter = loaded
+        # Only needed by the next checkpoint, which waits for this thread
+        self.save = shelve.open(self.config.save_file)
+
+    def _use_loaded_filter(self):
+        ''' Whether the filter holds every discovered url. Call with save_lock held. '''
+        if not self._filter_ready and self._loaded_filter is not None:
+            self.discovered_filter.update(self._loaded_filter)
+            self._loaded_filter = None
+            self._filter_ready = True
+        return self._filter_ready
+
+    def _is_discovered(self, urlhash):
+        if urlhash in self.unsaved or urlhash in self.checkpointing:
+            return True
+        self._store_lookups += 1
+        # The snapshot holds everything discovered up to the checkpoint
+        if self.snapshot is not None:
+            return urlhash in self.snapshot
+        return urlhash in self.save
+
+    def _checkpoint(self):
+        ''' Fold the logged changes into the save file and write a snapshot of
+        the discovered and pending urls.
+
+        Only the cut holds save_lock: the changes logged so far are set
+        aside with the log they are in, and add_url / mark_url_complete go
+        on with a new log while the rest runs. The old log is deleted once
+        the snapshot is on disk, so a crash or a failure at any point leaves
+        every change either checkpointed or in a log. '''
+        with self._checkpoint_lock:
+            loader = self._loader
+            if loader is not None:
+                # Opens the save file once the snapshot is loaded
+                loader.join()
+            with self.save_lock:
+                self._loader = None
+                self._use_loaded_filter()
+                changes = self.checkpointing = self.unsaved
+                self.unsaved = dict()
+                self.checkpoint_id += 1
+                checkpoint_id = self.checkpoint_id
+                self.wal.rotate(self.old_wal_file, "checkpoint", checkpoint_id)
+                state = self.to_be_downloaded.get_state()
+                previous = self.snapshot
+            try:
+                self.save.update(changes)
+                self.save.sync()
+                write_snapshot(
+                    self.snapshot_file, checkpoint_id, self._validator_signature,
+                    self._discovered_at_cut(previous, changes),
+                    self._pending_at_cut(previous, changes))
+                snapshot = Snapshot(self.snapshot_file)
+            except Exception:
+                # Keep the changes for the next checkpoint, which adds the
+                # new log to the old one
+                with self.save_lock:
+                    changes.update(self.unsaved)
+                    self.unsaved = changes
+                    self.checkpointing = dict()
+                raise
+            with self.save_lock:
+                self.snapshot = snapshot
+                self.checkpointing = dict()
+                if previous is not None:
+                    previous.close()
+            if state is not None:
+                write_file_atomically(self.priority_file, json.dumps(state))
+            write_file_atomically(self.traps_file, json.dumps(trap_templates.get_state()))
+            os.remove(self.old_wal_file)
+            self.logger.info(self.report())
+
+    def _discovered_at_cut(self, previous, changes):
+        ''' Raw digests of the urls discovered at the cut: those of the
+        previous snapshot merged with the ones discovered since. The save
+        file is only read (and its hex keys sorted) without a snapshot. '''
+        if previous is None:
+            return sorted_digests(self.save.keys())
+        return previous.merged_digest_chunks(
+            sorted_digests(urlhash for urlhash in changes if urlhash not in previous))
+
+    def _pending_at_cut(self, previous, changes):
+        ''' Urls not completed at the cut: those of the previous snapshot
+        and the ones discovered since, less the ones completed since. '''
+        if previous is None:
+            return (url for url, completed in self.save.values()
+                    if not completed and is_valid(url))
+        completed = {url for url, done in changes.values() if done}
+        revalidate = previous.signature != self._validator_signature
+        return chain(
+            (url for url in previous.iter_pending()
+             if url not in completed and (not revalidate or is_valid(url))),
+            (url for url, done in changes.values() if not done))
+
+    def _checkpoint_when_wanted(self):
+        while True:
+            self._checkpoint_wanted.wait()
+            self._checkpoint_wanted.clear()
+            if self._closing:
+                return
+            try:
+                self._checkpoint()
+            except Exception as e:
+                self.logger.error(f"Checkpoint failed: {e!r}")
+
+    @property
+    def completed_count(self):
+        ''' Urls completed since this frontier was opened. '''
+        return self._pages
+
+    def report(self):
+        ''' Cost of recording discovered and completed urls, per page. '''
+        pages = max(self._pages, 1)
+        checks = max(self._added_checks, 1)
+        fill = self.discovered_filter.count / self.discovered_filter.capacity
+        return (
+            f"Checkpoint {self.checkpoint_id}: {self._pages} pages, "
+            f"{self._added_checks / pages:.1f} links/page, "
+            f"{self._store_lookups / pages:.2f} save file lookups/page, "
+            f"lock held {self._lock_held / pages * 1e6:.0f} us/page, "
+            f"{self._filter_skips / checks:.0%} of links decided by the "
+            f"filter ({fill:.0%} of its capacity), {self._trap_skips} links "
+            f"refused by {trap_templates.blocked_count} trap templates.")
+
+    def _log_change(self, op, url):
+        self.wal.append(op, url)
+        if len(self.unsaved) >= self.config.wal_checkpoint_size:
+            # Taken by the checkpointer thread, not by the caller
+            self._checkpoint_wanted.set()
+
+    def close(self):
+        self._closing = True
+        self._checkpoint_wanted.set()
+        self._checkpointer.join()
+        self._checkpoint()
+        with self.save_lock:
+            self.snapshot.close()
+            self.wal.close()
+            self.save.close()
+            self.to_be_downloaded.close()
 
     def _parse_save_file(self):
         ''' This function can be overridden for alternate saving techniques. '''
@@ -42,47 +690,68 @@ class Frontier(object):
         tbd_count = 0
         for url, completed in self.save.values():
             if not completed and is_valid(url):
-                self.to_be_downloaded.put(url)
+                self.to_be_downloaded.restore(url)
                 tbd_count += 1
         self.logger.info(
             f"Found {tbd_count} urls to be downloaded from {total_count} "
             f"total urls discovered.")
 
     def get_tbd_url(self):
-        try:
-            return self.to_be_downloaded.get(timeout=1.0)
-        except Empty:
-            return None
+        # Blocks until some host's politeness window has expired
+        return self.to_be_downloaded.get(timeout=1.0)
 
     def add_url(self, url):
         # Strip trailing / at the end of url
         url = normalize(url)
+        if trap_templates.blocked(url):
+            # Not recorded as discovered: it is refused again if found again
+            with self.save_lock:
+                self._trap_skips += 1
+            return
         # Produce a unique, fixed-length SHA256 hash
         urlhash = get_urlhash(url)
 
         with self.save_lock:
-            if urlhash in self.save:
-                return # URL is already discovered
+            start = time.perf_counter()
             try:
-                # Mark url as discovered, but not yet downloaded
-                self.save[urlhash] = (url, False)
-                # Update disk right away
-                self.save.sync()
-            except Exception as e:
-                self.logger.error(f"Failed to save URL {url}: {e}")
-                return
-        # Add url to queue to be downloaded
-        # to_be_downloaded Queue is already thread safe
-        self.to_be_downloaded.put(url)
+                self._add_url(url, urlhash)
+            finally:
+                self._lock_held += time.perf_counter() - start
+
+    def _add_url(self, url, urlhash):
+        self._added_checks += 1
+        if self._use_loaded_filter() and urlhash not in self.discovered_filter:
+            # Definitely new, no need to look it up
+            self._filter_skips += 1
+        elif self._is_discovered(urlhash):
+            return # URL is already discovered
+        self.discovered_filter.add(urlhash)
+        try:
+            # Mark url as discovered, but not yet downloaded
+            self.unsaved[urlhash] = (url, False)
+            # Add url to its host's queue to be downloaded
+            self.to_be_downloaded.put(url)
+            # Reaches disk with the next group commit of the log
+            self._log_change("add", url)
+        except Exception as e:
+            self.logger.error(f"Failed to save URL {url}: {e}")
+            return
     
     def mark_url_complete(self, url):
         urlhash = get_urlhash(url)
         with self.save_lock:
-            if urlhash not in self.save:
+            start = time.perf_counter()
+            self._pages += 1
+            # The filter can only rule the url out; that is enough for a
+            # sanity check, so the save file is not consulted.
+            if self._use_loaded_filter() and urlhash not in self.discovered_filter:
                 # This should not happen.
                 self.logger.error(
                     f"Completed url {url}, but have not seen it before.")
 
-            # Mark URL as downloaded and write change to disk immediately
-            self.save[urlhash] = (url, True)
-            self.save.sync()
+            # Mark URL as downloaded, logged with the next group commit
+            self.unsaved[urlhash] = (url, True)
+            self._log_change("done", url)
+            self._lock_held += time.perf_counter() - start
+        # Start the politeness window of the url's host
+        self.to_be_downloaded.release(url)
@@ -0,0 +1,202 @@
+import os
+import time
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor
+from queue import Queue
+from threading import Thread, Lock, Semaphore
+
+from inspect import getsource
+from utils.download import download
+from utils import get_logger
+import scraper
+
+
+class StageStats(object):
+    ''' Items handled by one pipeline stage and the time spent on them. '''
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.busy = 0.0
+        self._lock = Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.busy += seconds
+
+    def summary(self, elapsed, threads=1):
+        with self._lock:
+            count, busy = self.count, self.busy
+        rate = count / elapsed if elapsed else 0.0
+        utilization = busy / (elapsed * threads) if elapsed else 0.0
+        return f"{self.name}: {count} pages, {rate:.1f}/s, {utilization:.0%} busy"
+
+
+def _analyze(url, final_url, content):
+    # Runs in a worker process; timed there so the stage statistics exclude
+    # the time pages wait in the pool.
+    begin = time.monotonic()
+    analysis = scraper.analyze_page(url, final_url, content)
+    return analysis, time.monotonic() - begin
+
+
+class Pipeline(Thread):
+    ''' Crawls with one stage per kind of work instead of doing everything
+    on every worker thread.
+
+        fetch   THREADCOUNT threads take urls from the frontier and download
+                them; this is the only stage waiting on the network.
+        analyze PIPELINE_PROCESSES processes parse pages and fingerprint them
+                (scraper.analyze_page), free of the GIL the fetchers share.
+        merge   One thread applies the results to the crawl statistics
+                (scraper.merge_page), adds the outlinks to the frontier and
+                completes the url, so that state has a single writer.
+
+    Stages are connected by queues holding at most PIPELINE_QUEUE_SIZE pages,
+    so a slow stage makes the ones before it wait instead of piling up
+    downloaded pages in memory.
+
+    The analysis processes are forked by a forkserver rather than by this
+    process, whose other threads (frontier, log, fetchers) may hold locks at
+    the time that a forked child would find taken forever. They import
+    scraper afresh, so analyze_page must not depend on state set at run
+    time. '''
+
+    def __init__(self, worker_id, config, frontier):
+        self.logger = get_logger(f"Pipeline-{worker_id}", "Worker")
+        self.config = config
+        self.frontier = frontier
+        # basic check for requests in scraper
+        assert {getsource(scraper).find(req) for req in {"from requests import", "import requests"}} == {-1}, "Do not use requests in scraper.py"
+        assert {getsource(scraper).find(req) for req in {"from urllib.request import", "import urllib.request"}} == {-1}, "Do not use urllib.request in scraper.py"
+        self.stats = {
+            name: StageStats(name) for name in ("fetch", "analyze", "merge")}
+        self._fetched = Queue(maxsize=config.pipeline_queue_size)
+        # Pages submitted for analysis and not merged yet
+        self._analyzing = Semaphore(config.pipeline_queue_size)
+        self._analyzed = Queue()
+        super().__init__(daemon=True)
+
+    def run(self):
+        processes = self.config.pipeline_processes or os.cpu_count()
+        start = time.monotonic()
+        context = multiprocessing.get_context("forkserver")
+        with ProcessPoolExecutor(max_workers=processes, mp_context=context) as pool:
+            fetchers = [
+                Thread(target=self._fetch, name=f"Fetch-{i}", daemon=True)
+                for i in range(self.config.threads_count)]
+            stages = fetchers + [
+                Thread(target=self._dispatch, args=(pool,), name="Analyze", daemon=True),
+                Thread(target=self._merge, name="Merge", daemon=True)]
+            for stage in stages:
+                stage.start()
+            for fetcher in fetchers:
+                self._join_reporting(fetcher, start, processes)
+            self._fetched.put(None)
+            for stage in stages[len(fetchers):]:
+                self._join_reporting(stage, start, processes)
+        self.logger.info(self._report(start, processes))
+
+    def _join_reporting(self, thread, start, processes):
+        while thread.is_alive():
+            thread.join(self.config.pipeline_report_interval)
+            if thread.is_alive():
+                self.logger.info(self._report(start, processes))
+
+    def _report(self, start, processes):
+        elapsed = time.monotonic() - start
+        return " | ".join((
+            self.stats["fetch"].summary(elapsed, self.config.threads_count),
+            self.stats["analyze"].summary(elapsed, processes),
+            self.stats["merge"].summary(elapsed),
+            f"queued: {self._fetched.qsize()} fetched, "
+            f"{self._analyzed.qsize()} analyzed"))
+
+    def _fetch(self):
+        while True:
+            tbd_url = self.frontier.get_tbd_url()
+            if not tbd_url:
+                self.logger.info("Frontier is empty. Stopping fetcher.")
+                return
+            begin = time.monotonic()
+            try:
+                resp = download(tbd_url, self.config, self.logger)
+            except Exception as e:
+                self.logger.error(f"Failed to download {tbd_url}: {e!r}")
+                resp = None
+            else:
+                self.logger.info(
+                    f"Downloaded {tbd_url}, status <{resp.status}>, "
+                    f"using cache {self.config.cache_server}.")
+            self.stats["fetch"].record(time.monotonic() - begin)
+            self._fetched.put((tbd_url, resp))
+
+    def _dispatch(self, pool):
+        try:
+            while True:
+                item = self._fetched.get()
+                if item is None:
+                    break
+                tbd_url, resp = item
+                try:
+                    self._submit(pool, tbd_url, resp)
+                except Exception as e:
+                    # e.g. BrokenProcessPool: the merge stage still completes the url
+                    self.logger.error(f"Failed to analyze {tbd_url}: {e!r}")
+                    self._analyzed.put((tbd_url, None, None))
+            # Every submitted page is merged before the merge stage stops
+            for _ in range(self.config.pipeline_queue_size):
+                self._analyzing.acquire()
+        finally:
+            self._analyzed.put(None)
+
+    def _submit(self, pool, tbd_url, resp):
+        content = scraper.page_content(resp) if resp is not None else None
+        if content is None:
+            # Nothing to parse; the merge stage still completes the url
+            self._analyzed.put((tbd_url, None, None))
+            return
+        page = None
+        if scraper.page_store is not None:
+            page = scraper.page_fingerprint(resp, content)
+            links = scraper.revisit(tbd_url, page)
+            if links is not None:
+                # Unchanged since the last crawl: no analysis needed
+                for scraped_url in links:
+                    self.frontier.add_url(scraped_url)
+                self._analyzed.put((tbd_url, None, None))
+                return
+        self._analyzing.acquire()
+        try:
+            future = pool.submit(_analyze, tbd_url, resp.url, content)
+        except BaseException:
+            self._analyzing.release()
+            raise
+        future.add_done_callback(
+            lambda f, url=tbd_url, page=page: self._analyzed.put((url, f, page)))
+
+    def _merge(self):
+        while True:
+            item = self._analyzed.get()
+            if item is None:
+                return
+            tbd_url, future, page = item
+            begin = time.monotonic()
+            try:
+                if future is not None:
+                    self._analyzing.release()
+                    analysis, analyze_time = future.result()
+                    self.stats["analyze"].record(analyze_time)
+                    links = scraper.merge_page(tbd_url, analysis)
+                    for scraped_url in links:
+                        self.frontier.add_url(scraped_url)
+                    if page is not None:
+                        scraper.remember_page(tbd_url, page, analysis, links)
+            except Exception as e:
+                self.logger.error(f"Failed to process {tbd_url}: {e!r}")
+            finally:
+                # Completing the url always frees its host.
+                self.frontier.mark_url_complete(tbd_url)
+            self.stats["merge"].record(time.monotonic() - begin)
@@ -0,0 +1,133 @@
+import os
+import mmap
+import struct
+import tempfile
+
+MAGIC = b"FRSNAP01"
+# magic, checkpoint id, discovered count, pending count, validator signature
+HEADER = struct.Struct("<8sQQQ32s")
+DIGEST_SIZE = 32
+URL_LENGTH = struct.Struct("<I")
+
+
+def sorted_digests(urlhashes):
+    ''' The raw digests of hex url hashes, sorted, for write_snapshot. '''
+    return sorted(bytes.fromhex(urlhash) for urlhash in urlhashes)
+
+
+def write_snapshot(path, checkpoint_id, signature, digest_chunks, pending_urls):
+    ''' Write the frontier snapshot for a checkpoint.
+
+    The file holds the sorted raw SHA256 digests of every discovered url,
+    followed by the length-prefixed pending urls. `digest_chunks` gives the
+    digests in order, as bytes holding one or more of them (see
+    sorted_digests and Snapshot.merged_digest_chunks). It is written to a
+    temporary file and renamed over the old snapshot, so readers only ever
+    see a complete one. Both iterables are only read once. '''
+    # A temporary file of its own, so that writers never share one
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(HEADER.pack(MAGIC, checkpoint_id, 0, 0, signature))
+            digest_bytes = 0
+            for chunk in digest_chunks:
+                f.write(chunk)
+                digest_bytes += len(chunk)
+            pending_count = 0
+            for url in pending_urls:
+                encoded = url.encode("utf-8")
+                f.write(URL_LENGTH.pack(len(encoded)))
+                f.write(encoded)
+                pending_count += 1
+            f.seek(0)
+            f.write(HEADER.pack(
+                MAGIC, checkpoint_id, digest_bytes // DIGEST_SIZE, pending_count, signature))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+class Snapshot(object):
+    ''' Read-only, memory-mapped view of a snapshot file.
+
+    Nothing is read up front: membership tests binary search the mapped
+    digests and iter_pending() decodes urls as it goes, so the operating
+    system only pages in what is actually used. '''
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (magic, self.checkpoint_id, self.discovered_count,
+             self.pending_count, self.signature) = HEADER.unpack_from(self._map)
+        except struct.error:
+            self._map.close()
+            raise ValueError(f"Truncated snapshot {path}")
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(f"Not a frontier snapshot: {path}")
+        self._digests_start = HEADER.size
+        self._pending_start = (
+            self._digests_start + self.discovered_count * DIGEST_SIZE)
+
+    def __contains__(self, urlhash):
+        ''' Whether the hex url hash was discovered at the checkpoint. '''
+        digest = bytes.fromhex(urlhash)
+        index = self._bisect(digest)
+        offset = self._digests_start + index * DIGEST_SIZE
+        return index < self.discovered_count and self._map[offset:offset + DIGEST_SIZE] == digest
+
+    def _bisect(self, digest):
+        ''' Index of the first digest not below `digest`. '''
+        lo, hi = 0, self.discovered_count
+        start = self._digests_start
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = start + mid * DIGEST_SIZE
+            if self._map[offset:offset + DIGEST_SIZE] < digest:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def iter_digest_chunks(self, chunk_size=1 << 16, first=0):
+        ''' The raw digests of the discovered urls from the `first`th,
+        `chunk_size` at a time. '''
+        start = self._digests_start
+        for first in range(first, self.discovered_count, chunk_size):
+            count = min(chunk_size, self.discovered_count - first)
+            offset = start + first * DIGEST_SIZE
+            yield self._map[offset:offset + count * DIGEST_SIZE]
+
+    def merged_digest_chunks(self, digests, chunk_size=1 << 16):
+        ''' The raw digests of the discovered urls with the sorted raw
+        `digests`, none of which are in the snapshot, in order: the digests
+        of the next snapshot, copied from this one a chunk at a time
+        instead of being read back from the save file and sorted. '''
+        start = self._digests_start
+        copied = 0
+        for digest in digests:
+            index = self._bisect(digest)
+            while copied < index:
+                count = min(chunk_size, index - copied)
+                offset = start + copied * DIGEST_SIZE
+                yield self._map[offset:offset + count * DIGEST_SIZE]
+                copied += count
+            yield digest
+        yield from self.iter_digest_chunks(chunk_size, copied)
+
+    def iter_pending(self):
+        offset = self._pending_start
+        for _ in range(self.pending_count):
+            (length,) = URL_LENGTH.unpack_from(self._map, offset)
+            offset += URL_LENGTH.size
+            yield self._map[offset:offset + length].decode("utf-8")
+            offset += length
+
+    def close(self):
+        self._map.close()
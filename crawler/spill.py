@@ -0,0 +1,133 @@
+import os
+from collections import deque
+from threading import Lock
+
+class SpillingScheduler(object):
+    ''' Keeps about `max_in_memory` urls in a HostScheduler and spills the
+    rest to disk.
+
+    Every url is put into the scheduler, so new hosts and well-scored urls
+    are always in memory and each url is scored (and its pattern counted)
+    once. When that takes the scheduler past `max_in_memory`, it gives up
+    its least promising urls (HostScheduler.evict: the worst of the hosts
+    with the most pending, never a host's last one) until a segment of
+    max_in_memory / 4 urls is free, and they are appended to segment files
+    in `directory`. Once the scheduler is another segment below that (after
+    get() or release()), or empty, the oldest segment is read back in a
+    single read, restored into the scheduler and deleted. Segments only
+    duplicate what the save file, snapshot and log already record, so they
+    are not fsynced and are thrown away on start. '''
+
+    def __init__(self, scheduler, directory, max_in_memory):
+        self.scheduler = scheduler
+        self.directory = directory
+        self.max_in_memory = max_in_memory
+        self.segment_size = max(1, max_in_memory // 4)
+        self._lock = Lock()
+        self._segments = deque()    # (path, urls) of full segments, oldest first
+        self._tail = None           # segment being appended to
+        self._tail_path = None
+        self._tail_count = 0
+        self._next_segment = 0
+        self._spilled = 0
+        # Spill statistics for report()
+        self.spilled_total = 0
+        self.refills = 0
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            if name.endswith(".segment"):
+                os.remove(os.path.join(directory, name))
+
+    def __len__(self):
+        return len(self.scheduler) + self._spilled
+
+    def put(self, url):
+        with self._lock:
+            self.scheduler.put(url)
+            self._spill_overflow()
+
+    def restore(self, url):
+        with self._lock:
+            self.scheduler.restore(url)
+            self._spill_overflow()
+
+    def _spill_overflow(self):
+        if len(self.scheduler) <= self.max_in_memory:
+            return
+        excess = len(self.scheduler) - (self.max_in_memory - self.segment_size)
+        for url in self.scheduler.evict(excess):
+            if self._tail is None:
+                self._tail_path = os.path.join(
+                    self.directory, f"{self._next_segment:08d}.segment")
+                self._next_segment += 1
+                self._tail = open(self._tail_path, "w", encoding="utf-8")
+            self._tail.write(url + "\n")
+            self._tail_count += 1
+            self._spilled += 1
+            self.spilled_total += 1
+            if self._tail_count >= self.segment_size:
+                self._close_tail()
+
+    def _close_tail(self):
+        self._tail.close()
+        self._segments.append((self._tail_path, self._tail_count))
+        self._tail = None
+        self._tail_count = 0
+
+    def _refill(self):
+        ''' Restore the oldest segments into the scheduler while it has room
+        for them and a segment to spare. '''
+        with self._lock:
+            while self._spilled:
+                if not self._segments:
+                    self._close_tail()
+                path, count = self._segments[0]
+                room = self.max_in_memory - self.segment_size - len(self.scheduler)
+                if count > room and len(self.scheduler):
+                    return
+                self._segments.popleft()
+                with open(path, encoding="utf-8") as f:
+                    urls = f.read().splitlines()
+                os.remove(path)
+                for url in urls:
+                    self.scheduler.restore(url)
+                self._spilled -= count
+                self.refills += 1
+
+    def get(self, timeout):
+        while True:
+            self._refill()
+            url = self.scheduler.get(timeout)
+            if url is not None or not self._spilled:
+                return url
+
+    def release(self, url):
+        self.scheduler.release(url)
+        self._refill()
+
+    def load(self):
+        ''' HostScheduler.load(), spilled urls counting as pending; their
+        hosts are not known until they are read back. '''
+        pending, hosts, ready, leased = self.scheduler.load()
+        return pending + self._spilled, hosts, ready, leased
+
+    def get_state(self):
+        return self.scheduler.get_state()
+
+    def set_state(self, state):
+        self.scheduler.set_state(state)
+
+    def add_producer(self):
+        self.scheduler.add_producer()
+
+    def remove_producer(self):
+        self.scheduler.remove_producer()
+
+    def close(self):
+        with self._lock:
+            if self._tail is not None:
+                self._close_tail()
+            for path, _ in self._segments:
+                os.remove(path)
+            self._segments.clear()
+            self._spilled = 0
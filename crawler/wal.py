@@ -0,0 +1,107 @@
+import os
+import json
+import shutil
+
+from threading import Thread, Lock, Event
+
+
+class WriteAheadLog(object):
+    ''' Append-only log of frontier changes with group commit.
+
+    Records are buffered in memory and written to the log together, followed
+    by a single fsync, once `commit_size` records are waiting or
+    `commit_interval` seconds have passed, whichever comes first. Commits
+    run on a background thread so appending never waits for the disk. A
+    crash therefore loses at most the records of the last commit window.
+    When a checkpoint starts, rotate() sets the log aside and starts a new
+    one. '''
+
+    def __init__(self, path, commit_interval=1.0, commit_size=500):
+        self.path = path
+        self.commit_interval = commit_interval
+        self.commit_size = commit_size
+        self._buffer = []
+        self._lock = Lock()       # guards the buffer
+        self._io_lock = Lock()    # keeps commits in append order
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._closed = Event()
+        self._wakeup = Event()
+        self._flusher = Thread(target=self._flush_periodically, daemon=True)
+        self._flusher.start()
+
+    def append(self, *record):
+        with self._lock:
+            self._buffer.append(record)
+            full = len(self._buffer) >= self.commit_size
+        if full:
+            self._wakeup.set()
+
+    def commit(self):
+        with self._io_lock:
+            with self._lock:
+                records, self._buffer = self._buffer, []
+            if not records or self._file.closed:
+                return
+            self._file.write("".join(
+                json.dumps(record, ensure_ascii=False) + "\n"
+                for record in records))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def replay(self, path=None):
+        ''' Yield the committed records in the order they were appended,
+        from this log or from one set aside by rotate(). '''
+        with open(path or self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield tuple(json.loads(line))
+                except ValueError:
+                    # Torn write at the tail of the log from a crash
+                    break
+
+    def rotate(self, old_path, *first_record):
+        ''' Set the records appended so far aside in `old_path`, committed,
+        and start the log over. An optional first record, such as the id of
+        the checkpoint the new log continues from, is committed right away.
+        Once the old records are checkpointed the old file can be deleted;
+        until then both logs are needed to recover, and a later rotate()
+        adds to it rather than replacing it. '''
+        with self._io_lock:
+            with self._lock:
+                records, self._buffer = self._buffer, []
+            self._file.write("".join(
+                json.dumps(record, ensure_ascii=False) + "\n"
+                for record in records))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            if os.path.exists(old_path):
+                # Left by a checkpoint that failed: still needed, add to it
+                with open(self.path, encoding="utf-8") as src, \
+                        open(old_path, "a", encoding="utf-8") as dst:
+                    shutil.copyfileobj(src, dst)
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                os.remove(self.path)
+            else:
+                os.replace(self.path, old_path)
+            self._file = open(self.path, "a", encoding="utf-8")
+            if first_record:
+                self._file.write(
+                    json.dumps(first_record, ensure_ascii=False) + "\n")
+                self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._closed.set()
+        self._wakeup.set()
+        self._flusher.join()
+        self.commit()
+        with self._io_lock:
+            self._file.close()
+
+    def _flush_periodically(self):
+        while not self._closed.is_set():
+            self._wakeup.wait(self.commit_interval)
+            self._wakeup.clear()
+            self.commit()
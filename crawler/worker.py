@@ -1,10 +1,11 @@
 from threading import Thread
+from time import perf_counter
 
 from inspect import getsource
 from utils.download import download
 from utils import get_logger
+from utils.timing import stage_timings
 import scraper
-import time
 
 
 class Worker(Thread):
@@ -12,23 +13,51 @@ class Worker(Thread):
         self.logger = get_logger(f"Worker-{worker_id}", "Worker")
         self.config = config
         self.frontier = frontier
+        # Autoscaler that may retire this worker, if any
+        self.pool = None
         # basic check for requests in scraper
         assert {getsource(scraper).find(req) for req in {"from requests import", "import requests"}} == {-1}, "Do not use requests in scraper.py"
         assert {getsource(scraper).find(req) for req in {"from urllib.request import", "import urllib.request"}} == {-1}, "Do not use urllib.request in scraper.py"
         super().__init__(daemon=True)
         
     def run(self):
-        while True:
-            tbd_url = self.frontier.get_tbd_url()
-            if not tbd_url:
-                self.logger.info("Frontier is empty. Stopping Crawler.")
-                break
-            resp = download(tbd_url, self.config, self.logger)
-            self.logger.info(
-                f"Downloaded {tbd_url}, status <{resp.status}>, "
-                f"using cache {self.config.cache_server}.")
-            scraped_urls = scraper.scraper(tbd_url, resp)
-            for scraped_url in scraped_urls:
-                self.frontier.add_url(scraped_url)
-            self.frontier.mark_url_complete(tbd_url)
-            time.sleep(self.config.time_delay)
+        retired = False
+        try:
+            while True:
+                if self.pool is not None and self.pool.retire(self):
+                    retired = True
+                    self.logger.info("Retired by the autoscaler.")
+                    break
+                # Includes waiting out the politeness delay of the ready hosts
+                start = perf_counter()
+                tbd_url = self.frontier.get_tbd_url()
+                stage_timings.record("worker.get_url", perf_counter() - start)
+                if not tbd_url:
+                    self.logger.info("Frontier is empty. Stopping Crawler.")
+                    break
+                try:
+                    start = perf_counter()
+                    resp = download(tbd_url, self.config, self.logger)
+                    downloaded = perf_counter()
+                    stage_timings.record("worker.download", downloaded - start)
+                    stage_timings.count(f"status_{resp.status}")
+                    self.logger.info(
+                        f"Downloaded {tbd_url}, status <{resp.status}>, "
+                        f"using cache {self.config.cache_server}.")
+                    scraped_urls = scraper.scraper(tbd_url, resp)
+                    scraped = perf_counter()
+                    stage_timings.record("worker.scrape", scraped - downloaded)
+                    for scraped_url in scraped_urls:
+                        self.frontier.add_url(scraped_url)
+                    stage_timings.record("worker.add_urls", perf_counter() - scraped)
+                finally:
+                    # The frontier enforces politeness per host, so there is no
+                    # sleep here; completing the url always frees its host.
+                    start = perf_counter()
+                    self.frontier.mark_url_complete(tbd_url)
+                    stage_timings.record("worker.complete_url", perf_counter() - start)
+        finally:
+            # Stopped on an empty frontier or by an exception; retire()
+            # already counted a retired worker out
+            if self.pool is not None and not retired:
+                self.pool.worker_stopped()
@@ -8,26 +8,73 @@ except RuntimeError:
     pass
 
 
+import signal
 from configparser import ConfigParser
 from argparse import ArgumentParser
 
 from utils.server_registration import get_cache_server
 from utils.config import Config
+from utils import download
+from utils.cache_archive import Archive, ArchiveWriter
+from utils.cache_server import ArchiveServer
+from utils.profiler import start_profiling, profile_on_signal
 from crawler import Crawler
 
 
-def main(config_file, restart):
+def install_profiler(seconds, now):
+    ''' Profile the crawl for `seconds` on SIGUSR1 (kill -USR1 <pid>), and
+    right away if `now`. Results go to Logs/. '''
+    if hasattr(signal, "SIGUSR1"):
+        profile_on_signal(signal.SIGUSR1, seconds)
+    if now:
+        start_profiling(seconds)
+        print(f"Profiling for {seconds:.0f} s, writing to Logs/.")
+
+
+def main(config_file, restart, record=None, replay=None):
     cparser = ConfigParser()
     cparser.read(config_file)
     config = Config(cparser)
-    config.cache_server = get_cache_server(config, restart)
-    crawler = Crawler(config, restart)
-    crawler.start()
+    server = None
+    if replay:
+        # Offline: a local server answers from the archive, as fast as it can
+        server = ArchiveServer(Archive(replay))
+        server.start()
+        config.cache_server = server.server_address
+        config.time_delay = 0
+        print(f"Replaying {len(server.archive)} recorded urls from {replay}.")
+    else:
+        config.cache_server = get_cache_server(config, restart)
+    writer = None
+    if record:
+        writer = ArchiveWriter(record)
+        download.record_to(writer)
+    try:
+        crawler = Crawler(config, restart)
+        crawler.start()
+    finally:
+        if writer is not None:
+            download.record_to(None)
+            writer.close()
+            print(f"Recorded {writer.records} answers to {record}.")
+        if server is not None:
+            server.shutdown()
+            print(f"{server.hits} urls replayed, {server.misses} not in {replay}.")
 
 
 if __name__ == "__main__":
     parser = ArgumentParser()
     parser.add_argument("--restart", action="store_true", default=False)
     parser.add_argument("--config_file", type=str, default="config.ini")
+    # Use a separate SAVE file for replays, --restart starts it over
+    parser.add_argument("--record", metavar="ARCHIVE",
+                        help="save every cache server answer to ARCHIVE")
+    parser.add_argument("--replay", metavar="ARCHIVE",
+                        help="crawl offline, answering from ARCHIVE")
+    parser.add_argument("--profile", action="store_true", default=False,
+                        help="profile the first PROFILE_SECONDS of the crawl")
+    parser.add_argument("--profile-seconds", type=float, default=30.0,
+                        help="length of a profile, taken with --profile or on SIGUSR1")
     args = parser.parse_args()
-    main(args.config_file, args.restart)
+    install_profiler(args.profile_seconds, args.profile)
+    main(args.config_file, args.restart, args.record, args.replay)
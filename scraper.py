@@ -1,26 +1,54 @@
 import re
 from urllib.parse import urlparse, urljoin, urlunparse, parse_qsl, urlencode
-from bs4 import BeautifulSoup
-from collections import Counter, defaultdict
-from bs4.element import Comment
+from collections import Counter, namedtuple
+from functools import lru_cache
 import hashlib
-import unicodedata
+from time import perf_counter
+from utils.page_extract import extract_page
+from utils import simhash as _simhash
+from utils import write_file_atomically
+from utils.stats import CrawlStats, MetricsFlusher
+from utils.url_filter import UrlFilter
+from utils.url_templates import TrapTemplates
+from utils import page_store as _page_store
+from utils.timing import stage_timings
 
 
-seen_hashes = set()  # For exact duplicate detection
-seen_simhashes = set()  # For near-duplicate detection
+# Pages whose simhashes differ in fewer than this many bits are near-duplicates
+NEAR_DUP_THRESHOLD = 5
+# Token hash behind compute_simhash: "md5" gives the same fingerprints as the original implementation
+SIMHASH_TOKEN_HASH = "blake2b"
+
+# Duplicate detection, unique pages, word and subdomain counts; shared by all workers
+stats = CrawlStats(near_dup_threshold=NEAR_DUP_THRESHOLD)
+
+# Compiled crawl rules from utils/url_rules.json
+url_filter = UrlFilter.from_file()
+
+# Url templates whose pages keep being low-information or duplicates; the
+# frontier stops admitting urls of the blocked ones and persists it
+trap_templates = TrapTemplates()
+
+# PageStore of the pages crawled before, for recrawls; set_page_store()
+# (RECRAWL in config.ini). None crawls every page as new.
+page_store = None
+
+# Distinct links whose resolved, normalized and validated form is remembered;
+# set_link_cache_size() changes it (LINK_CACHE_SIZE in config.ini)
+LINK_CACHE_SIZE = 1 << 16
+
+# Seconds / pages between rewrites of metrics.txt and subdomain_counts.txt
+METRICS_FLUSH_INTERVAL = 60.0
+METRICS_FLUSH_PAGES = 200
 
 page_hashes = set()
 page_shingles = []
-longest_page = ("", 0)
-word_counter = Counter()
-subdomain_counts = defaultdict(int)
-report_urls = set()
-seen_urls = set()
-page_counter = 0
 
 LOW_INFO_MIN = 30
 MAX_BYTES = 5_000_000
+# A pickled page is its body plus headers, request and redirect history;
+# past MAX_BYTES + this much, the body alone is over MAX_BYTES.
+MAX_PAYLOAD_SLACK = 1_000_000
 
 STOPWORDS = frozenset({
     'i', 'me', 'my', 'myself', 'we', 'our', 'ours', 'ourselves', 'you',
@@ -49,90 +77,249 @@ STOPWORDS = frozenset({
 
 
 def scraper(url, resp):
-    links = extract_next_links(url, resp)
-    return [link for link in links if is_valid(link)]
+    # extract_next_links only returns links that passed is_valid
+    return extract_next_links(url, resp)
 
 
 def extract_next_links(url, resp):
-    global longest_page
-    global page_counter
-
-    if resp.status != 200 or resp.raw_response is None or resp.raw_response.content is None:
+    content = page_content(resp)
+    if content is None:
+        stage_timings.count("pages_not_parsed")
         return []
+    page = None
+    if page_store is not None:
+        page = page_fingerprint(resp, content)
+        links = revisit(url, page)
+        if links is not None:
+            return links
+    analysis = analyze_page(url, resp.url, content)
+    links = merge_page(url, analysis)
+    if page is not None:
+        remember_page(url, page, analysis, links)
+    return links
+
+
+def set_page_store(store):
+    """Reuse the outlinks of pages unchanged since they were recorded in
+    store (a utils.page_store.PageStore), and record the others; None stops."""
+    global page_store
+    page_store = store
+
+
+def page_fingerprint(resp, content):
+    """Validators and body hash of a page, for revisit and remember_page."""
+    return _page_store.fingerprint(resp.headers, content)
+
+
+def revisit(url, page):
+    """Outlinks of a page unchanged since page_store recorded it, or None.
+
+    The page is not parsed again: the words and fingerprints recorded with
+    it are counted as merge_page would count them (this crawl may have
+    started over with --restart), and its recorded outlinks are returned.
+    """
+    record = page_store.unchanged(url, page)
+    if record is None:
+        return None
+    stage_timings.count("pages_unchanged")
+    count_page(url, record)
+    metrics_flusher.page_done()
+    # The rules may have changed since
+    return [link for link in record.links if is_valid(link)]
+
+
+def remember_page(url, page, analysis, links):
+    page_store.remember(url, page, analysis, links)
+
+
+# Everything about a page that does not depend on what was crawled before it:
+# canonical / report_key -> normalized and report URL of the page (resp.url or url)
+# page_hash / simhash   -> fingerprints for exact and near-duplicate detection
+# word_count            -> number of words on the page
+# word_freqs            -> Counter of the non-stopwords
+# raw_links             -> outlinks joined with the page URL, in document order
+# normalized            -> raw link -> normalized link, or None if it is not valid
+PageAnalysis = namedtuple("PageAnalysis", [
+    "canonical", "report_key", "page_hash", "simhash",
+    "word_count", "word_freqs", "raw_links", "normalized"])
+
+
+def page_content(resp):
+    """Return the body of a response worth parsing, or None.
+
+    Status and payload size are checked before resp.raw_response decodes
+    the page, so most rejected responses are never unpickled.
+    """
+    if resp.status != 200:
+        return None
+    if resp.payload_size > MAX_BYTES + MAX_PAYLOAD_SLACK:
+        stage_timings.count("pages_rejected_undecoded")
+        return None
+    if resp.raw_response is None or resp.raw_response.content is None:
+        return None
 
     content = resp.raw_response.content
     if content is None or len(content) == 0:
-        return []
+        return None
     if len(content) > MAX_BYTES:
-        return []
+        return None
 
     content_type = resp.raw_response.headers.get("Content-Type", "").lower()
     if "html" not in content_type:
         head = content[:256].lstrip().lower()
         if not (head.startswith(b"<!doctype") and b"html" in head) and not head.startswith(b"<html"):
-            return []
+            return None
+    return content
 
+
+def analyze_page(url, final_url, content):
+    """Parse a page and compute its PageAnalysis.
+
+    Reads no module state, so it can run in a worker process; merge_page
+    applies the result to the crawl statistics. (Stage timings recorded in
+    a worker process stay in that process.)
+    """
+    start = perf_counter()
+    page_url = final_url or url
+    # Visible text, words and hrefs in one pass over the page
+    page = extract_page(content)
+    words = page.words
+    parsed = perf_counter()
+    stage_timings.record("scraper.parse", parsed - start)
+
+    raw_links = []
+    normalized = {}
+    for abs_link, link_normalized in resolve_links(page_url, page.hrefs):
+        raw_links.append(abs_link)
+        normalized[abs_link] = link_normalized
+    resolved = perf_counter()
+    stage_timings.record("scraper.resolve_links", resolved - parsed)
+
+    analysis = PageAnalysis(
+        normalize_url(page_url), report_key(page_url),
+        compute_page_hash(page.text), compute_simhash(words),
+        len(words), Counter(w for w in words if w not in STOPWORDS),
+        raw_links, normalized)
+    stage_timings.record("scraper.fingerprint", perf_counter() - resolved)
+    return analysis
+
+
+# Hrefs naming a host; they resolve the same against any URL with the same scheme
+_NETLOC_HREF_RE = re.compile(r"(?:[a-zA-Z][a-zA-Z0-9+.-]*:)?//[^/?#]")
+# Characters urljoin drops before parsing (but keeps in hrefs it returns as they are)
+_UNSAFE_URL_CHARS = str.maketrans("", "", "\t\r\n")
+
+
+def _resolve_link(base, href):
+    """Join an href with the page URL; returns the absolute link and its
+    normalized form, or None in its place if that is not valid."""
+    abs_link = urljoin(base, href)
+    link_normalized = normalize_url(abs_link)
+    return abs_link, link_normalized if is_valid(link_normalized) else None
+
+
+# Nav bars and footers repeat the same hrefs on every page of a site
+resolve_link = lru_cache(maxsize=LINK_CACHE_SIZE)(_resolve_link)
+
+
+def resolve_links(page_url, hrefs):
+    """resolve_link for every href of a page, skipping those urljoin rejects.
+
+    The cache is keyed on the least of the page URL each href depends on:
+    hrefs naming a host resolve the same on every page with the same
+    scheme, root-relative ones on every page of the same host. Anything
+    else is keyed on the full page URL.
+    """
     try:
-        soup = BeautifulSoup(resp.raw_response.content, "lxml")
-    except Exception:
-        soup = BeautifulSoup(resp.raw_response.content, "html.parser")
-
-    texts = soup.find_all(string=True)
-    visible_texts = (t.strip() for t in texts if _tag_visible(t))
-    text_content = " ".join(t for t in visible_texts if t)
-    text_content = unicodedata.normalize("NFKC", text_content)
-
-    page_hash = compute_page_hash(text_content)
-    dup_exact = False
-    if page_hash in seen_hashes:
+        parsed = urlparse(page_url)
+    except ValueError:
+        return []
+    scheme_base = f"{parsed.scheme}://"
+    origin = f"{scheme_base}{parsed.netloc}"
+    resolved = []
+    for href in hrefs:
+        parsed_href = href.translate(_UNSAFE_URL_CHARS)
+        if _NETLOC_HREF_RE.match(parsed_href):
+            base = scheme_base
+        elif parsed_href.startswith("/") and not parsed_href.startswith("//"):
+            base = origin
+        else:
+            base = page_url
+        try:
+            resolved.append(resolve_link(base, href))
+        except Exception:
+            continue
+    return resolved
+
+
+def set_link_cache_size(maxsize):
+    """Replace the link cache with an empty one holding up to maxsize links."""
+    global resolve_link
+    resolve_link = lru_cache(maxsize=maxsize)(_resolve_link)
+
+
+def set_trap_limits(min_pages, bad_ratio):
+    """Block a url template once min_pages of its pages were crawled and
+    bad_ratio of them were low-information or duplicates (0 pages: never)."""
+    trap_templates.min_pages = min_pages
+    trap_templates.bad_ratio = bad_ratio
+
+
+def link_cache_info():
+    """Hits, misses, maxsize and current size of the link cache."""
+    return resolve_link.cache_info()
+
+
+def count_page(url, page):
+    """Record a page in the crawl statistics: its fingerprints, words and
+    trap template. `page` is a PageAnalysis, or the PageRecord of a page
+    unchanged since it was analyzed. False if it has no canonical URL."""
+    start = perf_counter()
+    dup_exact = not stats.add_page_hash(page.page_hash)
+    if dup_exact:
+        stage_timings.count("pages_exact_duplicate")
         print(f"Skipping exact duplicate: {url}")
-        dup_exact = True
-    else:
-        seen_hashes.add(page_hash)
-
-    words = _extract_words(soup)
-    simhash = compute_simhash(words)
-    dup_near = False
-    for old_hash in seen_simhashes:
-        if hamming_distance(simhash, old_hash) < 5:
-            print(f"Skipping near-duplicate: {url}")
-            dup_near = True
-            break
-    if not dup_near:
-        seen_simhashes.add(simhash)
-
-    canonical = normalize_url(resp.url or url)
+
+    dup_near = not stats.add_simhash(page.simhash)
+    if dup_near:
+        stage_timings.count("pages_near_duplicate")
+        print(f"Skipping near-duplicate: {url}")
+    deduped = perf_counter()
+    stage_timings.record("scraper.dedupe", deduped - start)
+
+    canonical = page.canonical
     if canonical is None:
-        return []
-    report_urls.add(report_key(resp.url or url))
-    first_time = canonical not in seen_urls
-    seen_urls.add(canonical)
+        return False
+    first_time = stats.add_url(canonical, page.report_key)
 
-    count = len(words)
+    count = page.word_count
+    blocked = trap_templates.record(url, dup_exact or dup_near or count < LOW_INFO_MIN)
+    if blocked is not None:
+        stage_timings.count("trap_templates_blocked")
+        print(f"[Trap] {blocked} keeps yielding duplicate or low-information pages — no longer admitted.")
 
     if not dup_exact and not dup_near and count >= LOW_INFO_MIN:
-        word_counter.update(w for w in words if w not in STOPWORDS)
-        if count > longest_page[1]:
-            longest_page = (canonical, count)
+        stats.add_page_words(canonical, count, page.word_freqs)
 
-    if first_time:
-        host = str(urlparse(canonical).netloc.lower())
-        if host.endswith(".uci.edu"):
-            subdomain_counts[host] += 1
-    else:
-        host = urlparse(canonical).netloc.lower()
+    host = urlparse(canonical).netloc.lower()
+    if first_time and host.endswith(".uci.edu"):
+        stats.add_subdomain_page(host)
+    stage_timings.record("scraper.stats", perf_counter() - deduped)
+    return True
 
-    raw_links = []
-    for link in soup.find_all("a", href=True):
-        href = link.get("href").strip()
-        try:
-            abs_link = urljoin(resp.url or url, href)
-        except Exception:
-            continue
-        raw_links.append(abs_link)
+
+def merge_page(url, analysis):
+    """Record an analyzed page in the crawl statistics and return its outlinks."""
+    if not count_page(url, analysis):
+        metrics_flusher.page_done()
+        return []
+    canonical = analysis.canonical
+    host = urlparse(canonical).netloc.lower()
+    raw_links = analysis.raw_links
+    counted = perf_counter()
 
     # --- Adaptive Trap Detection Logic ---
-    pages_seen = subdomain_counts.get(host, 0)
+    pages_seen = stats.subdomain_count(host)
     link_limit = 600 + pages_seen * 15          # increase limit gradually
     same_host_limit = 400 + pages_seen * 8      # increase host-link limit gradually
 
@@ -168,14 +355,14 @@ def extract_next_links(url, resp):
 
     extracted_links = set()
     for link in raw_links:
-        normalized = normalize_url(link)
-        if is_valid(normalized):
+        normalized = analysis.normalized[link]
+        if normalized is not None:
             extracted_links.add(normalized)
+    stage_timings.record("scraper.filter_links", perf_counter() - counted)
+    stage_timings.count("links_found", len(analysis.raw_links))
+    stage_timings.count("links_kept", len(extracted_links))
 
-    page_counter += 1
-    if page_counter % 200 == 0:
-        write_metrics()
-        write_subdomain_counts()
+    metrics_flusher.page_done()
     return list(extracted_links)
 
 
@@ -190,6 +377,9 @@ TRACKING_PARAMS = frozenset({
 })
 
 
+_HTTP_SCHEME_RE = re.compile(r"^https?://")
+
+
 def normalize_url(url: str) -> str | None:
     """
     Normalize URLs by:
@@ -205,7 +395,7 @@ def normalize_url(url: str) -> str | None:
             return None
 
         # Add scheme if missing
-        if not re.match(r"^https?://", url):
+        if not _HTTP_SCHEME_RE.match(url):
             url = "https://" + url
 
         parsed = urlparse(url)
@@ -256,64 +446,14 @@ def normalize_url(url: str) -> str | None:
         return None
 
 
-DISALLOWED_TAGS = frozenset({"style", "script", "head", "title", "meta", "[document]"})
-
-
-def _tag_visible(el, _disallowed=DISALLOWED_TAGS):
-    """Use tag name to identify if text is visible to user"""
-    # Retrieve current HTML tag from the current text node
-    parent = getattr(el, "parent", None)
-    if not parent:  # Safeguard against malformed URLs
-        return False
-    if parent.name in _disallowed:  # Omit tags not visible to user
-        return False
-    if isinstance(el, Comment):  # Filter out comments that cannot be seen by the user
-        return False
-    s = str(el).strip()
-    return bool(s)
-
-
-# Regex patterm that matches sequences of one or more alphabetic character(s), ensuring there is a word boundary
-_word_re = re.compile(r"\b[a-zA-Z]+\b")
-
-
-def _extract_words(soup):
-    """Extract words visible words to user on given URL page"""
-    texts = soup.find_all(string=True)
-    vis = [t.strip() for t in texts if _tag_visible(t)]
-    text = " ".join(vis)
-    return _word_re.findall(text.lower())
-
-
-FILETYPE_PATTERN = re.compile(
-    r"\.(css|js|bmp|gif|jpe?g|ico|png|tiff?|mid|mp2|mp3|mp4|"
-    r"wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf|ps|eps|tex|ppt|pptx|"
-    r"doc|docx|xls|xlsx|names|data|dat|exe|bz2|tar|msi|bin|7z|psd|"
-    r"dmg|iso|epub|dll|cnf|tgz|sha1|thmx|mso|arff|rtf|jar|csv|"
-    r"rm|smil|wmv|swf|wma|zip|rar|gz)$"
-)
-
-VALID_SCHEMES = frozenset({"https", "http"})
-
-
 def compute_page_hash(content):
     """Compute a SHA256 hash of the page text for exact duplicate detection."""
     return hashlib.sha256(content.encode("utf-8")).hexdigest()
 
 
-def compute_simhash(words):
+def compute_simhash(words, token_hash=None):
     """Compute a simple simhash value for near-duplicate detection."""
-    hash_bits = [0] * 64
-    for word, freq in Counter(words).items():
-        h = int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16)
-        for i in range(64):
-            bit = (h >> i) & 1
-            hash_bits[i] += freq if bit else -freq
-    fingerprint = 0
-    for i, bit_sum in enumerate(hash_bits):
-        if bit_sum > 0:
-            fingerprint |= 1 << i
-    return fingerprint
+    return _simhash.compute_simhash(words, token_hash or SIMHASH_TOKEN_HASH)
 
 
 def hamming_distance(x, y):
@@ -322,119 +462,50 @@ def hamming_distance(x, y):
 
 
 def is_valid(url):
-    try:
-        if not url or len(url) > 2000:
-            return False
+    """Whether the url may be crawled; url_filter.check(url) tells why not."""
+    return url_filter.check(url) is None
 
-        parsed = urlparse(url)
-        scheme = parsed.scheme.lower()
-        netloc = parsed.netloc.lower()
-        path = parsed.path or ""
-        query = parsed.query or ""
-
-        if scheme not in VALID_SCHEMES:
-            return False
-        if not re.search(r"(ics\.uci\.edu|cs\.uci\.edu|informatics\.uci\.edu|stat\.uci\.edu)$", netloc):
-            return False
-        if FILETYPE_PATTERN.search(path.lower()):
-            return False
-        if len(query) > 120 or path.count("/") > 15:
-            return False
-        if re.search(r"/\d{4}/\d{2}/\d{2}", path):
-            return False
-        if re.search(r"(page|p)=\d{3,}", query):
-            return False
-        if query:
-            if query.count("&") + 1 > 8:
-                return False
-        segments = [seg for seg in path.strip("/").split("/") if seg]
-        if len(segments) > 3 and len(set(segments)) < len(segments) / 2:
-            return False
-        if re.search(r"(sessionid|jsessionid|phpsessid|sid|token|ref)=\w+", query, re.IGNORECASE):
-            return False
-        if re.search(r"(session|login|logout)[=/]?", path, re.IGNORECASE):
-            return False
-        if len(netloc.split(".")) > 6:
-            return False
-        if any(len(seg) > 100 for seg in segments):
-            return False
-        
-        path_lower = path.lower()
-        query_lower = query.lower()
-
-        #isg.ics calendar trap
-        if netloc == "isg.ics.uci.edu" and (path_lower.startswith("/events/") or path_lower.startswith("/event/")):
-            return False
-
-        #WICS / NGS calendar pages only (keep rest of the site)
-        if netloc in {"wics.ics.uci.edu", "ngs.ics.uci.edu"} and path_lower.startswith("/events/"):
-            return False
-
-        #doku.php wiki trees
-        if "doku.php" in path_lower:
-            return False
-
-        # gitlab commit/page explosion
-        if netloc == "gitlab.ics.uci.edu":
-            return False
-
-        # large image galleries with very low text value
-        if "/~eppstein/pix" in path_lower:
-            return False
-
-        # grape reported as an infinite trap
-        if netloc == "grape.ics.uci.edu":
-            return False
-
-        # fano rules tree
-        if netloc == "fano.ics.uci.edu" and path_lower.startswith("/ca/rules/"):
-            return False
-
-        # generic calendar engines mentioned (ical / tribe / wp-json)
-        if "ical" in path_lower or "ical" in query_lower:
-            return False
-        if "tribe_event" in query_lower or "/tribe/" in path_lower:
-            return False
-        if "wp-json" in path_lower:
-            return False
-        
-        return True
-    except (TypeError, ValueError):
-        return False
-    
 
 def write_metrics():
     """Log metrics in file metrics.txt
         1. Number of unique pages
         2. Longest page in terms of words
         3. Top 50 Most Common Words"""
-    with open("metrics.txt", "w", encoding="utf-8") as f:
-        try:
-            f.write("=== 1) Unique Pages ===\n")
-            f.write(f"Total unique pages: {len(report_urls)}\n\n")
-            f.write("=== 2) Longest Page ===\n")
-            f.write(f"Longest page in terms of words: {longest_page[0]}, {longest_page[1]} words\n\n")
-            f.write("=== 3) 50 Most Common Words ===\n")
-            for word, count in word_counter.most_common(50):
-                f.write(f"{word}, {count}\n")
-        except NameError as e:
-            print(f"Error occurred with retrieving metrics - {e}")
-        except Exception as e:
-            print(f"Exception occurred: {e}")
+    try:
+        longest_page = stats.longest_page()
+        lines = [
+            "=== 1) Unique Pages ===\n",
+            f"Total unique pages: {stats.unique_pages()}\n\n",
+            "=== 2) Longest Page ===\n",
+            f"Longest page in terms of words: {longest_page[0]}, {longest_page[1]} words\n\n",
+            "=== 3) 50 Most Common Words ===\n"]
+        for word, count in stats.most_common_words(50):
+            lines.append(f"{word}, {count}\n")
+        write_file_atomically("metrics.txt", "".join(lines))
+    except Exception as e:
+        print(f"Exception occurred: {e}")
 
 
 def write_subdomain_counts():
     """Log subdomains and number of unique pages per subdomain in file subdomain_counts.txt ordered alphabetically"""
     try:
-        sorted_subdomains = sorted(subdomain_counts.items())
-        with open("subdomain_counts.txt", "w", encoding="utf-8") as f:
-            f.write("=== Subdomain Summary ===\n")
-            for subdomain, count in sorted_subdomains:
-                f.write(f"{subdomain}, {count}\n")
-    except NameError as e:
-            print(f"Error occurred with retrieving subdomain metrics - {e}")
+        sorted_subdomains = sorted(stats.subdomain_counts().items())
+        lines = ["=== Subdomain Summary ===\n"]
+        for subdomain, count in sorted_subdomains:
+            lines.append(f"{subdomain}, {count}\n")
+        write_file_atomically("subdomain_counts.txt", "".join(lines))
     except Exception as e:
-            print(f"Exception occurred: {e}")
+        print(f"Exception occurred: {e}")
+
+
+def write_reports():
+    write_metrics()
+    write_subdomain_counts()
+
+
+# Writes the reports in the background; close() it when the crawl is over
+metrics_flusher = MetricsFlusher(
+    write_reports, interval=METRICS_FLUSH_INTERVAL, every_pages=METRICS_FLUSH_PAGES)
 
 
 def report_key(u: str) -> str:
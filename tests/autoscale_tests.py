@@ -0,0 +1,159 @@
+import unittest
+import sys
+import os
+import time
+import logging
+import threading
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from crawler.autoscale import Autoscaler, plan
+from crawler.frontier import HostScheduler
+from crawler.worker import Worker
+
+
+class TestPlan(unittest.TestCase):
+    def test_nothing_to_do(self):
+        self.assertEqual(plan(8, (0, 0, 0, 0), 0.2, 0.5, 2, 16), 2)
+
+    def test_hosts_and_latency(self):
+        # 20 hosts, each keeps a worker busy 0.5 / (0.5 + 0.5) of the time
+        self.assertEqual(plan(10, (500, 20, 0, 10), 0.5, 0.5, 1, 16), 10)
+        # Without a latency estimate, one worker per host
+        self.assertEqual(plan(10, (500, 12, 0, 10), None, 0.5, 1, 16), 12)
+        self.assertEqual(plan(10, (500, 40, 0, 10), None, 0.5, 1, 16), 16)
+
+    def test_ready_hosts_grow_the_pool(self):
+        self.assertEqual(plan(4, (500, 6, 3, 4), 0.1, 0.5, 1, 16), 7)
+
+    def test_shrinks_half_way(self):
+        self.assertEqual(plan(10, (5, 2, 0, 2), None, 0.5, 1, 16), 6)
+        self.assertEqual(plan(6, (5, 2, 0, 2), None, 0.5, 1, 16), 4)
+
+
+class TestHostSchedulerLoad(unittest.TestCase):
+    def test_load(self):
+        scheduler = HostScheduler(delay=10)
+        for host in "abc":
+            scheduler.put(f"https://{host}.ics.uci.edu/1")
+            scheduler.put(f"https://{host}.ics.uci.edu/2")
+        url = scheduler.get(timeout=0)
+        self.assertEqual(scheduler.load(), (5, 3, 2, 1))
+        scheduler.release(url)
+        # Released into its politeness window: pending but not ready
+        self.assertEqual(scheduler.load(), (5, 3, 2, 0))
+
+
+class FakeWorker(threading.Thread):
+    ''' Worker loop without downloads: every url takes 20 ms. '''
+
+    def __init__(self, worker_id, config, frontier):
+        super().__init__(daemon=True)
+        self.worker_id = worker_id
+        # Like get_logger, adds a handler to the logger of its id
+        self.logger = logging.getLogger(f"FakeWorker-{worker_id}")
+        self.logger.addHandler(logging.NullHandler())
+        self.frontier = frontier
+        self.pool = None
+        self.retired = False
+
+    def run(self):
+        scheduler = self.frontier.to_be_downloaded
+        try:
+            while True:
+                if self.pool is not None and self.pool.retire(self):
+                    self.retired = True
+                    break
+                url = scheduler.get(timeout=0.2)
+                if url is None:
+                    break
+                time.sleep(0.02)
+                scheduler.release(url)
+        finally:
+            if not self.retired:
+                self.pool.worker_stopped()
+
+
+class TestAutoscaler(unittest.TestCase):
+    def start(self, scheduler, workers, delay=0):
+        # Every worker started, the crawler only keeps the running ones
+        self.started = []
+
+        def worker_factory(*args):
+            self.started.append(FakeWorker(*args))
+            return self.started[-1]
+        crawler = SimpleNamespace(
+            config=SimpleNamespace(time_delay=delay), workers=[],
+            frontier=SimpleNamespace(to_be_downloaded=scheduler),
+            worker_factory=worker_factory, workers_count=lambda config: workers)
+        scaler = Autoscaler(crawler, min_workers=1, max_workers=8, interval=0.05)
+        scaler.logger.disabled = True
+        scaler.start_workers(workers)
+        scaler.start()
+        self.addCleanup(scaler.stop)
+        return crawler, scaler
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 10
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+    def finish(self, crawler, scaler, scheduler):
+        for worker in self.started:
+            worker.join(10)
+        self.assertEqual(len(scheduler), 0)
+        self.assertEqual(scaler.active, 0)
+
+    def test_grows_with_ready_hosts(self):
+        scheduler = HostScheduler(delay=0)
+        for i in range(600):
+            scheduler.put(f"https://host{i % 30}.ics.uci.edu/{i}")
+        crawler, scaler = self.start(scheduler, workers=2)
+        self.wait_for(lambda: scaler.active == 8)
+        self.finish(crawler, scaler, scheduler)
+
+    def test_retires_surplus_workers(self):
+        # Two hosts resting 50 ms between downloads keep two workers busy at most
+        scheduler = HostScheduler(delay=0.05)
+        for i in range(40):
+            scheduler.put(f"https://host{i % 2}.ics.uci.edu/{i}")
+        crawler, scaler = self.start(scheduler, workers=8, delay=0.05)
+        self.wait_for(lambda: scaler.active <= 2)
+        self.assertGreaterEqual(sum(worker.retired for worker in self.started), 6)
+        self.finish(crawler, scaler, scheduler)
+
+    def test_reuses_stopped_worker_ids(self):
+        scheduler = HostScheduler(delay=0)
+        crawler, scaler = self.start(scheduler, workers=3)
+        # Nothing to download: the workers stop and are dropped
+        self.wait_for(lambda: scaler.active == 0)
+        for worker in self.started:
+            worker.join(10)
+        scaler.stop()
+        scaler.start_workers(2)
+        self.assertEqual(crawler.workers, self.started[3:])
+        self.assertEqual([worker.worker_id for worker in self.started], [0, 1, 2, 0, 1])
+        # The handlers of the stopped workers were closed and removed
+        self.assertEqual(len(logging.getLogger("FakeWorker-0").handlers), 1)
+        self.assertEqual(len(logging.getLogger("FakeWorker-2").handlers), 0)
+
+    def test_failed_workers_stop_counting(self):
+        def get_tbd_url():
+            raise RuntimeError("frontier failed")
+        crawler = SimpleNamespace(
+            config=SimpleNamespace(time_delay=0), workers=[],
+            frontier=SimpleNamespace(get_tbd_url=get_tbd_url),
+            worker_factory=Worker, workers_count=lambda config: 2)
+        scaler = Autoscaler(crawler, min_workers=1, max_workers=8, interval=0.05)
+        scaler.logger.disabled = True
+        excepthook = threading.excepthook
+        threading.excepthook = lambda args: None
+        self.addCleanup(setattr, threading, "excepthook", excepthook)
+        scaler.start_workers(2)
+        for worker in crawler.workers:
+            worker.join(10)
+        self.assertEqual(scaler.active, 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,414 @@
+import unittest
+import sys
+import os
+import time
+import logging
+import pickle
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from types import SimpleNamespace
+from unittest import mock
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlparse, parse_qs
+
+import cbor
+import requests
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import scraper
+from utils import download
+from utils.response import Response
+from utils.page_store import PageStore
+from utils.stats import CrawlStats
+from utils.url_templates import TrapTemplates
+from utils.cache_archive import Archive, ArchiveWriter
+from utils.cache_server import ArchiveServer
+from crawler.async_worker import AsyncWorker
+from crawler.pipeline import Pipeline
+
+
+def html_response(url):
+    raw = requests.Response()
+    raw.status_code = 200
+    raw.url = url
+    raw.headers["Content-Type"] = "text/html"
+    raw._content = (
+        f"<html><body><p>{url} page</p>"
+        f'<a href="{url}/a">a</a> <a href="{url}/b#top">b</a>'
+        f"</body></html>").encode("utf-8")
+    return raw
+
+
+class CacheServerStub(BaseHTTPRequestHandler):
+    ''' Answers like the cache server; urls containing "slow" hang for a while,
+    urls containing "page" get an HTML page linking to two others. '''
+    protocol_version = "HTTP/1.1"
+    requests_seen = 0
+    client_ports = []
+
+    def do_GET(self):
+        CacheServerStub.requests_seen += 1
+        CacheServerStub.client_ports.append(self.client_address[1])
+        url = parse_qs(urlparse(self.path).query)["q"][0]
+        if "slow" in url:
+            time.sleep(1.0)
+        resp = {"url": url, "status": 200}
+        if "page" in url:
+            resp["response"] = pickle.dumps(html_response(url))
+        body = cbor.dumps(resp)
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestResponse(unittest.TestCase):
+    def answer(self, status, raw):
+        return Response({"url": raw.url, "status": status, "response": pickle.dumps(raw)})
+
+    def test_decoded_on_first_access(self):
+        resp = self.answer(200, html_response("https://www.ics.uci.edu/page"))
+        size = resp.payload_size
+        self.assertGreater(size, 0)
+        self.assertIsNone(resp._raw_response)
+        self.assertEqual(resp.headers["Content-Type"], "text/html")
+        self.assertIn(b"page</p>", resp.raw_response.content)
+        self.assertEqual(resp.payload_size, size)
+        self.assertFalse(hasattr(resp, "__dict__"))
+
+    def test_without_page(self):
+        resp = Response({"url": "https://www.ics.uci.edu", "status": 607, "error": "unreachable"})
+        self.assertIsNone(resp.raw_response)
+        self.assertEqual(resp.headers, {})
+        self.assertEqual(resp.payload_size, 0)
+
+    def test_rejected_without_decoding(self):
+        not_found = self.answer(404, html_response("https://www.ics.uci.edu/page"))
+        raw = html_response("https://www.ics.uci.edu/big")
+        raw._content = b"<html>" + b"x" * (scraper.MAX_BYTES + scraper.MAX_PAYLOAD_SLACK)
+        oversize = self.answer(200, raw)
+        for resp in (not_found, oversize):
+            self.assertIsNone(scraper.page_content(resp))
+            self.assertIsNone(resp._raw_response)
+        page = self.answer(200, html_response("https://www.ics.uci.edu/page"))
+        self.assertIsNotNone(scraper.page_content(page))
+
+    def test_picklable(self):
+        resp = self.answer(200, html_response("https://www.ics.uci.edu/page"))
+        copy = pickle.loads(pickle.dumps(resp))
+        self.assertEqual((copy.url, copy.status), (resp.url, resp.status))
+        self.assertEqual(copy.raw_response.content, resp.raw_response.content)
+
+
+class TestRecrawl(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.store = PageStore(os.path.join(tmp.name, "pages.shelve"))
+        self.addCleanup(self.store.close)
+        scraper.set_page_store(self.store)
+        self.addCleanup(scraper.set_page_store, None)
+        self.parsed = []
+        analyze_page = scraper.analyze_page
+
+        def counting(url, final_url, content):
+            self.parsed.append(url)
+            return analyze_page(url, final_url, content)
+
+        scraper.analyze_page = counting
+        self.addCleanup(setattr, scraper, "analyze_page", analyze_page)
+
+    def crawl(self, url, etag=None, extra=""):
+        raw = html_response(url)
+        raw._content += extra.encode("utf-8")
+        if etag is not None:
+            raw.headers["ETag"] = etag
+        resp = Response({"url": url, "status": 200, "response": pickle.dumps(raw)})
+        return scraper.extract_next_links(url, resp)
+
+    def test_unchanged_page_not_parsed(self):
+        url = "https://www.ics.uci.edu/recrawl/same"
+        links = self.crawl(url)
+        self.assertEqual(sorted(links), [
+            "https://ics.uci.edu/recrawl/same/a", "https://ics.uci.edu/recrawl/same/b"])
+        self.assertEqual(self.crawl(url), links)
+        self.assertEqual(self.parsed, [url])
+        self.assertEqual((self.store.unchanged_count, self.store.changed_count), (1, 1))
+
+    def test_changed_page_parsed(self):
+        url = "https://www.ics.uci.edu/recrawl/changed"
+        self.crawl(url)
+        links = self.crawl(url, extra='<a href="/new">new</a>')
+        self.assertIn("https://ics.uci.edu/new", links)
+        self.assertEqual(self.parsed, [url, url])
+
+    def test_validators_decide_first(self):
+        url = "https://www.ics.uci.edu/recrawl/etag"
+        self.crawl(url, etag='"v1"')
+        # Same ETag: unchanged whatever the body; a new one: parsed
+        self.crawl(url, etag='"v1"', extra="<p>ad</p>")
+        self.assertEqual(self.parsed, [url])
+        self.crawl(url, etag='"v2"')
+        self.assertEqual(self.parsed, [url, url])
+
+    def test_restart_counts_unchanged_pages(self):
+        # A crawl started over with --restart counts unchanged pages like parsed ones
+        url = "https://www.ics.uci.edu/recrawl/restart"
+        text = "<p>" + "anteater " * 40 + "</p>"
+        counted = []
+        for _ in range(2):
+            crawl_stats = CrawlStats(near_dup_threshold=scraper.NEAR_DUP_THRESHOLD)
+            with mock.patch.object(scraper, "stats", crawl_stats), \
+                    mock.patch.object(scraper, "trap_templates", TrapTemplates()):
+                self.crawl(url, extra=text)
+                counted.append((
+                    crawl_stats.unique_pages(), crawl_stats.longest_page(),
+                    crawl_stats.most_common_words(3), scraper.trap_templates.get_state()))
+        self.assertEqual(self.parsed, [url])
+        self.assertEqual(counted[0], counted[1])
+        self.assertEqual(counted[1][2][0], ("anteater", 40))
+
+    def test_page_done_once(self):
+        url = "https://www.ics.uci.edu/recrawl/done"
+        with mock.patch.object(scraper, "metrics_flusher") as flusher:
+            self.crawl(url)
+            self.crawl(url)
+            # Without a canonical URL the page still counts as done
+            analysis = scraper.analyze_page(url, url, b"<html></html>")._replace(canonical=None)
+            self.assertEqual(scraper.merge_page(url, analysis), [])
+        self.assertEqual(flusher.page_done.call_count, 3)
+
+
+class CacheServerTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), CacheServerStub)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def config(self, **overrides):
+        settings = dict(
+            cache_server=self.server.server_address, user_agent="IR UF25 test",
+            connect_timeout=1, read_timeout=5, max_retries=0, retry_backoff=0,
+            hedge_percentile=0, threads_count=1)
+        settings.update(overrides)
+        return SimpleNamespace(**settings)
+
+
+class TestDownload(CacheServerTestCase):
+    def test_reuses_connection(self):
+        config = self.config()
+        del CacheServerStub.client_ports[:]
+        for _ in range(3):
+            resp = download.download("https://www.ics.uci.edu/", config, logging.getLogger("test"))
+            self.assertEqual(resp.status, 200)
+        # Keep-alive: every request came over the same connection
+        self.assertEqual(len(set(CacheServerStub.client_ports)), 1)
+
+    def test_read_timeout(self):
+        start = time.monotonic()
+        resp = download.download("https://www.ics.uci.edu/slow", self.config(read_timeout=0.2), logging.getLogger("test"))
+        self.assertEqual(resp.status, download.DOWNLOAD_FAILED_STATUS)
+        self.assertLess(time.monotonic() - start, 1.0)
+
+    def test_errors_without_logger(self):
+        # Callers need not pass a logger, even for the error paths
+        with self.assertLogs("utils.download", "ERROR"):
+            resp = download.download("https://www.ics.uci.edu/slow", self.config(read_timeout=0.2))
+        self.assertEqual(resp.status, download.DOWNLOAD_FAILED_STATUS)
+        with self.assertLogs("utils.download", "ERROR"):
+            resp = download.decode_cache_response("https://www.ics.uci.edu/", 500, b"")
+        self.assertEqual(resp.status, 500)
+
+    def test_hedged_request(self):
+        config = self.config(hedge_percentile=95)
+        tracker = download.latencies
+        try:
+            download.latencies = download.LatencyTracker()
+            for _ in range(download.HEDGE_MIN_SAMPLES):
+                download.latencies.record(0.01)
+            before = CacheServerStub.requests_seen
+            resp = download.download("https://www.ics.uci.edu/slow", config, logging.getLogger("test"))
+            self.assertEqual(resp.status, 200)
+            # The slow primary got a hedge after the p95 latency
+            self.assertEqual(CacheServerStub.requests_seen - before, 2)
+        finally:
+            download.latencies = tracker
+
+
+class ListFrontier(object):
+    ''' Hands out a fixed list of urls and records what was completed. '''
+
+    def __init__(self, urls):
+        self.urls = list(urls)
+        self.completed = []
+        self.lock = threading.Lock()
+
+    def get_tbd_url(self):
+        with self.lock:
+            return self.urls.pop() if self.urls else None
+
+    def add_url(self, url):
+        pass
+
+    def mark_url_complete(self, url):
+        with self.lock:
+            self.completed.append(url)
+
+
+class EngineTestCase(CacheServerTestCase):
+    def setUp(self):
+        cwd = os.getcwd()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.addCleanup(os.chdir, cwd)
+        # get_logger writes to Logs/ under the working directory
+        os.chdir(tmp.name)
+
+
+class TestAsyncWorker(EngineTestCase):
+    def test_downloads_concurrently(self):
+        urls = [f"https://www.ics.uci.edu/slow/{i}" for i in range(20)]
+        frontier = ListFrontier(urls)
+        worker = AsyncWorker(0, self.config(async_concurrency=20), frontier)
+        start = time.monotonic()
+        worker.start()
+        worker.join(10)
+        # Each download takes a second on the server; serially this is 20s
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertCountEqual(frontier.completed, urls)
+
+    def test_unreachable_server(self):
+        config = self.config(
+            cache_server=("127.0.0.1", 1), max_retries=1, async_concurrency=5)
+        frontier = ListFrontier(["https://www.ics.uci.edu/"])
+        worker = AsyncWorker(0, config, frontier)
+        worker.start()
+        worker.join(10)
+        self.assertEqual(frontier.completed, ["https://www.ics.uci.edu/"])
+
+
+class ListFrontierAdding(ListFrontier):
+    def __init__(self, urls):
+        super().__init__(urls)
+        self.added = []
+
+    def add_url(self, url):
+        with self.lock:
+            self.added.append(url)
+
+
+class TestPipeline(EngineTestCase):
+    def test_pipeline(self):
+        urls = [f"https://www.ics.uci.edu/page{i}" for i in range(10)]
+        urls.append("https://www.ics.uci.edu/notes")
+        frontier = ListFrontierAdding(urls)
+        config = self.config(
+            pipeline_processes=2, pipeline_queue_size=4,
+            pipeline_report_interval=5, threads_count=3)
+        pipeline = Pipeline(0, config, frontier)
+        pipeline.start()
+        pipeline.join(30)
+        self.assertFalse(pipeline.is_alive())
+        self.assertCountEqual(frontier.completed, urls)
+        # Outlinks are normalized (no www., no fragment) by the merge stage
+        self.assertCountEqual(frontier.added, [
+            f"https://ics.uci.edu/page{i}/{name}"
+            for i in range(10) for name in "ab"])
+        self.assertEqual(pipeline.stats["fetch"].count, 11)
+        self.assertEqual(pipeline.stats["analyze"].count, 10)
+        self.assertEqual(pipeline.stats["merge"].count, 11)
+
+    def test_broken_pool(self):
+        # Every url is still completed and the pipeline stops
+        urls = [f"https://www.ics.uci.edu/page{i}" for i in range(6)]
+        frontier = ListFrontierAdding(urls)
+        config = self.config(
+            pipeline_processes=1, pipeline_queue_size=2,
+            pipeline_report_interval=5, threads_count=2)
+        pipeline = Pipeline(0, config, frontier)
+        with mock.patch.object(ProcessPoolExecutor, "submit", side_effect=BrokenProcessPool("gone")):
+            pipeline.start()
+            pipeline.join(30)
+        self.assertFalse(pipeline.is_alive())
+        self.assertCountEqual(frontier.completed, urls)
+        self.assertEqual(frontier.added, [])
+        self.assertEqual(pipeline.stats["analyze"].count, 0)
+
+
+class TestRecordReplay(EngineTestCase):
+    def record(self, urls):
+        writer = ArchiveWriter("cache.archive")
+        download.record_to(writer)
+        try:
+            recorded = [download.download(url, self.config(), logging.getLogger("test")) for url in urls]
+        finally:
+            download.record_to(None)
+            writer.close()
+        return recorded
+
+    def test_replays_recorded_answers(self):
+        urls = ["https://www.ics.uci.edu/page1", "https://www.ics.uci.edu/page2", "https://www.ics.uci.edu/notes"]
+        recorded = self.record(urls)
+        archive = Archive("cache.archive")
+        self.addCleanup(archive.close)
+        self.assertEqual(len(archive), 3)
+        server = ArchiveServer(archive)
+        server.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        config = self.config(cache_server=server.server_address)
+        for url, before in zip(urls, recorded):
+            resp = download.download(url, config, logging.getLogger("test"))
+            self.assertEqual((resp.url, resp.status), (before.url, before.status))
+            if before.raw_response is None:
+                self.assertIsNone(resp.raw_response)
+            else:
+                self.assertEqual(resp.raw_response.content, before.raw_response.content)
+        missing = download.download("https://www.ics.uci.edu/other", config, logging.getLogger("test"))
+        self.assertEqual(missing.status, 404)
+        self.assertEqual((server.hits, server.misses), (3, 1))
+
+    def test_ignores_cut_off_record(self):
+        self.record(["https://www.ics.uci.edu/page1", "https://www.ics.uci.edu/page2"])
+        with open("cache.archive", "r+b") as f:
+            f.truncate(os.path.getsize("cache.archive") - 10)
+        archive = Archive("cache.archive")
+        self.addCleanup(archive.close)
+        self.assertEqual(len(archive), 1)
+        self.assertIn("https://www.ics.uci.edu/page1", archive)
+
+    def test_records_after_cut_off_record(self):
+        self.record(["https://www.ics.uci.edu/page1", "https://www.ics.uci.edu/page2"])
+        with open("cache.archive", "r+b") as f:
+            f.truncate(os.path.getsize("cache.archive") - 10)
+        # Reopening drops the torn tail, so the new record is not read as part of it
+        self.record(["https://www.ics.uci.edu/page3"])
+        archive = Archive("cache.archive")
+        self.addCleanup(archive.close)
+        self.assertEqual(len(archive), 2)
+        self.assertIn("https://www.ics.uci.edu/page1", archive)
+        self.assertIn("https://www.ics.uci.edu/page3", archive)
+        self.assertEqual(archive.get("https://www.ics.uci.edu/page3")[0], 200)
+
+    def test_records_flushed(self):
+        writer = ArchiveWriter("cache.archive")
+        self.addCleanup(writer.close)
+        writer.record("https://www.ics.uci.edu/page1", 200, b"body")
+        # Readable before the writer is closed
+        archive = Archive("cache.archive")
+        self.addCleanup(archive.close)
+        self.assertEqual(bytes(archive.get("https://www.ics.uci.edu/page1")[1]), b"body")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,507 @@
+import unittest
+import sys
+import os
+import time
+import signal
+import shutil
+import tempfile
+import textwrap
+import threading
+import subprocess
+from types import SimpleNamespace
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+import crawler.frontier as frontier_module
+from crawler.frontier import Frontier, HostScheduler, PriorityScheduler, UrlScorer
+from crawler.snapshot import sorted_digests
+from crawler.spill import SpillingScheduler
+import scraper
+from utils import bloom, get_urlhash
+from utils.bloom import BloomFilter
+
+
+def make_config(save_file, **overrides):
+    settings = dict(
+        save_file=save_file, seed_urls=["https://www.ics.uci.edu"], time_delay=0,
+        wal_commit_interval=0.05, wal_commit_size=500, wal_checkpoint_size=10000,
+        bloom_capacity=10000, bloom_error_rate=0.01,
+        priority_frontier=True, host_budget=0, frontier_memory_urls=0)
+    settings.update(overrides)
+    return SimpleNamespace(**settings)
+
+
+def drain(scheduler):
+    ''' Every pending url, in the order the scheduler hands them out. '''
+    urls = []
+    while True:
+        url = scheduler.get(timeout=0)
+        if url is None:
+            return urls
+        urls.append(url)
+        scheduler.release(url)
+
+
+class FrontierTestCase(unittest.TestCase):
+    ''' Runs each test in a scratch directory, since the frontier writes Logs/ and its save files there. '''
+
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._tmp = tempfile.TemporaryDirectory()
+        os.chdir(self._tmp.name)
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        self._tmp.cleanup()
+
+
+class TestHostScheduler(unittest.TestCase):
+    def test_hosts_interleave(self):
+        # URLs of other hosts are handed out while a host is leased
+        scheduler = HostScheduler(delay=60)
+        for url in ["https://a.ics.uci.edu/1", "https://a.ics.uci.edu/2", "https://b.ics.uci.edu/1"]:
+            scheduler.put(url)
+        self.assertEqual(scheduler.get(timeout=0.1), "https://a.ics.uci.edu/1")
+        self.assertEqual(scheduler.get(timeout=0.1), "https://b.ics.uci.edu/1")
+        self.assertEqual(len(scheduler), 1)
+
+    def test_politeness_window(self):
+        delay = 0.2
+        scheduler = HostScheduler(delay=delay)
+        scheduler.put("https://a.ics.uci.edu/1")
+        scheduler.put("https://a.ics.uci.edu/2")
+        first = scheduler.get(timeout=0.1)
+        scheduler.release(first)
+        released_at = time.monotonic()
+        self.assertEqual(scheduler.get(timeout=0.1), "https://a.ics.uci.edu/2")
+        self.assertGreaterEqual(time.monotonic() - released_at, delay)
+
+    def test_waits_for_leased_hosts(self):
+        # A worker must not give up while another worker may still add urls
+        scheduler = HostScheduler(delay=0)
+        scheduler.put("https://a.ics.uci.edu/1")
+        leased = scheduler.get(timeout=0.1)
+
+        def finish():
+            time.sleep(0.3)
+            scheduler.put("https://b.ics.uci.edu/1")
+            scheduler.release(leased)
+
+        threading.Thread(target=finish).start()
+        self.assertEqual(scheduler.get(timeout=0.1), "https://b.ics.uci.edu/1")
+
+    def test_empty_returns_none(self):
+        scheduler = HostScheduler(delay=0)
+        self.assertIsNone(scheduler.get(timeout=0.05))
+
+    def test_one_lease_per_host(self):
+        scheduler = HostScheduler(delay=0)
+        for i in range(50):
+            scheduler.put(f"https://a.ics.uci.edu/{i}")
+        active = []
+        overlaps = []
+        lock = threading.Lock()
+
+        def work():
+            while True:
+                url = scheduler.get(timeout=0.05)
+                if url is None:
+                    return
+                with lock:
+                    if active:
+                        overlaps.append(url)
+                    active.append(url)
+                time.sleep(0.001)
+                with lock:
+                    active.remove(url)
+                scheduler.release(url)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(overlaps, [])
+        self.assertEqual(len(scheduler), 0)
+
+
+class TestPriorityScheduler(unittest.TestCase):
+    def test_shallow_urls_first(self):
+        scheduler = PriorityScheduler(delay=0)
+        scheduler.put("https://a.ics.uci.edu/x/y/z/page")
+        scheduler.put("https://a.ics.uci.edu/about")
+        url = scheduler.get(timeout=0.1)
+        self.assertEqual(url, "https://a.ics.uci.edu/about")
+        scheduler.release(url)
+        self.assertEqual(scheduler.get(timeout=0.1), "https://a.ics.uci.edu/x/y/z/page")
+
+    def test_repeated_patterns_demoted(self):
+        # The calendar-like urls share one pattern, so the one-off page overtakes them
+        scheduler = PriorityScheduler(delay=0)
+        for day in range(1, 20):
+            scheduler.put(f"https://a.ics.uci.edu/events/2020-01-{day}")
+        scheduler.put("https://a.ics.uci.edu/people/faculty")
+        order = []
+        while True:
+            url = scheduler.get(timeout=0.05)
+            if url is None:
+                break
+            order.append(url)
+            scheduler.release(url)
+        self.assertEqual(len(order), 20)
+        self.assertLess(order.index("https://a.ics.uci.edu/people/faculty"), 3)
+
+    def test_host_budget(self):
+        # Once a host used its budget, other hosts go first, however deep their urls
+        scheduler = PriorityScheduler(delay=0, host_budget=2)
+        for i in range(5):
+            scheduler.put(f"https://a.ics.uci.edu/{i}")
+        for _ in range(2):
+            scheduler.release(scheduler.get(timeout=0.1))
+        scheduler.put("https://b.ics.uci.edu/deep/down/the/tree")
+        self.assertEqual(scheduler.get(timeout=0.1), "https://b.ics.uci.edu/deep/down/the/tree")
+        # Over budget is deferred, not dropped
+        self.assertEqual(scheduler.get(timeout=0.1), "https://a.ics.uci.edu/2")
+
+    def test_politeness_window(self):
+        delay = 0.2
+        scheduler = PriorityScheduler(delay=delay)
+        scheduler.put("https://a.ics.uci.edu/1")
+        scheduler.put("https://a.ics.uci.edu/2")
+        scheduler.release(scheduler.get(timeout=0.1))
+        released_at = time.monotonic()
+        self.assertEqual(scheduler.get(timeout=0.1), "https://a.ics.uci.edu/2")
+        self.assertGreaterEqual(time.monotonic() - released_at, delay)
+
+    def test_state_round_trip(self):
+        scheduler = PriorityScheduler(delay=0)
+        scheduler.put("https://a.ics.uci.edu/1")
+        scheduler.release(scheduler.get(timeout=0.1))
+        restored = PriorityScheduler(delay=0)
+        restored.set_state(scheduler.get_state())
+        self.assertEqual(restored.scorer.host_pages, {"a.ics.uci.edu": 1})
+        # Urls queued again on resume do not count their pattern twice
+        restored.restore("https://a.ics.uci.edu/2")
+        self.assertEqual(restored.get_state(), scheduler.get_state())
+
+    def test_pattern_table_capped(self):
+        scorer = UrlScorer(max_patterns=10)
+        for _ in range(3):
+            scorer.score("https://a.ics.uci.edu/events?day=1", "a.ics.uci.edu")
+        for i in range(20):
+            scorer.score(f"https://a.ics.uci.edu/page{'x' * i}", "a.ics.uci.edu")
+            self.assertLessEqual(len(scorer.patterns), 10)
+        # The common pattern outlives the one-offs
+        self.assertEqual(scorer.patterns["a.ics.uci.edu/events?day"], 3)
+
+
+class TestSpillingScheduler(FrontierTestCase):
+    def test_memory_bounded(self):
+        scheduler = SpillingScheduler(HostScheduler(delay=0), "spill", max_in_memory=20)
+        urls = [f"https://sub{i % 7}.ics.uci.edu/{i}" for i in range(200)]
+        for url in urls:
+            scheduler.put(url)
+        self.assertEqual(len(scheduler), 200)
+        self.assertEqual(len(scheduler.scheduler), 20)
+        handed_out = []
+        while True:
+            url = scheduler.get(timeout=0.05)
+            if url is None:
+                break
+            self.assertLessEqual(len(scheduler.scheduler), 20)
+            handed_out.append(url)
+            scheduler.release(url)
+        self.assertEqual(sorted(handed_out), sorted(urls))
+        self.assertEqual(os.listdir("spill"), [])
+
+    def test_spilled_urls_not_starved(self):
+        scheduler = SpillingScheduler(HostScheduler(delay=0), "spill", max_in_memory=4)
+        for i in range(12):
+            scheduler.put(f"https://a.ics.uci.edu/{i}")
+        order = []
+        for _ in range(12):
+            order.append(scheduler.get(timeout=0.05))
+            scheduler.release(order[-1])
+        self.assertCountEqual(order, [f"https://a.ics.uci.edu/{i}" for i in range(12)])
+        self.assertIsNone(scheduler.get(timeout=0))
+
+    def test_best_urls_stay_in_memory(self):
+        scheduler = SpillingScheduler(PriorityScheduler(delay=0), "spill", max_in_memory=8)
+        for i in range(40):
+            scheduler.put(f"https://a.ics.uci.edu/deep/path/{i}")
+        self.assertGreater(scheduler.spilled_total, 0)
+        # Put after the spill started, still admitted: a shallow url and a new host
+        scheduler.put("https://a.ics.uci.edu/top")
+        scheduler.put("https://b.ics.uci.edu/deep/path/0")
+        self.assertLessEqual(len(scheduler.scheduler), 8)
+        self.assertEqual(drain(scheduler)[:2], [
+            "https://a.ics.uci.edu/top", "https://b.ics.uci.edu/deep/path/0"])
+
+    def test_patterns_counted_once(self):
+        scheduler = SpillingScheduler(PriorityScheduler(delay=0), "spill", max_in_memory=4)
+        for i in range(20):
+            scheduler.put(f"https://a.ics.uci.edu/{i}")
+        scheduler.restore("https://a.ics.uci.edu/restored")
+        while True:
+            url = scheduler.get(timeout=0.05)
+            if url is None:
+                break
+            scheduler.release(url)
+        self.assertGreater(scheduler.refills, 0)
+        # Spilled and refilled urls were counted when put, restored ones never
+        self.assertEqual(sum(scheduler.scheduler.scorer.patterns.values()), 20)
+
+    def test_frontier_resume(self):
+        config = make_config("frontier.shelve", frontier_memory_urls=10)
+        frontier = Frontier(config, restart=True)
+        for i in range(100):
+            frontier.add_url(f"https://www.ics.uci.edu/page/{i}")
+        self.assertLessEqual(len(frontier.to_be_downloaded.scheduler), 10)
+        frontier.close()
+
+        resumed = Frontier(config, restart=False)
+        resumed._loader.join()
+        self.assertEqual(len(resumed.to_be_downloaded), 101)
+        self.assertLessEqual(len(resumed.to_be_downloaded.scheduler), 10)
+        self.assertEqual(len(set(drain(resumed.to_be_downloaded))), 101)
+        resumed.close()
+
+
+class TestBloomFilter(unittest.TestCase):
+    def test_no_false_negatives(self):
+        hashes = [get_urlhash(f"https://www.ics.uci.edu/{i}") for i in range(5000)]
+        discovered = BloomFilter(5000, 0.01)
+        for urlhash in hashes:
+            discovered.add(urlhash)
+        self.assertTrue(all(urlhash in discovered for urlhash in hashes))
+        others = [get_urlhash(f"https://www.cs.uci.edu/{i}") for i in range(20000)]
+        false_positives = sum(urlhash in discovered for urlhash in others)
+        self.assertLess(false_positives / len(others), 0.02)
+
+    def check_add_digests(self):
+        hashes = [get_urlhash(f"https://www.ics.uci.edu/{i}") for i in range(3000)]
+        one_by_one = BloomFilter(3000)
+        for urlhash in hashes:
+            one_by_one.add(urlhash)
+        in_bulk = BloomFilter(3000)
+        in_bulk.add_digests(b"".join(bytes.fromhex(urlhash) for urlhash in hashes))
+        self.assertEqual(in_bulk._bits, one_by_one._bits)
+        self.assertEqual(in_bulk.count, one_by_one.count)
+
+    def test_add_digests_with_numpy(self):
+        if bloom.np is None:
+            self.skipTest("numpy is not installed")
+        self.check_add_digests()
+
+    def test_add_digests_without_numpy(self):
+        saved, bloom.np = bloom.np, None
+        self.addCleanup(setattr, bloom, "np", saved)
+        self.check_add_digests()
+
+    def test_update(self):
+        first, second = BloomFilter(100), BloomFilter(100)
+        first.add(get_urlhash("https://www.ics.uci.edu/a"))
+        second.add(get_urlhash("https://www.ics.uci.edu/b"))
+        first.update(second)
+        self.assertIn(get_urlhash("https://www.ics.uci.edu/a"), first)
+        self.assertIn(get_urlhash("https://www.ics.uci.edu/b"), first)
+        with self.assertRaises(ValueError):
+            first.update(BloomFilter(1000))
+
+
+class TestFrontierPersistence(FrontierTestCase):
+    def test_close_and_resume(self):
+        frontier = Frontier(make_config("frontier.shelve"), restart=True)
+        frontier.add_url("https://www.ics.uci.edu/about")
+        frontier.add_url("https://www.ics.uci.edu/about")
+        frontier.mark_url_complete(frontier.get_tbd_url())
+        frontier.close()
+
+        resumed = Frontier(make_config("frontier.shelve"), restart=False)
+        self.assertEqual(len(resumed.to_be_downloaded), 1)
+        self.assertEqual(resumed.get_tbd_url(), "https://www.ics.uci.edu/about")
+        resumed.close()
+
+    def test_priority_state_persisted(self):
+        frontier = Frontier(make_config("frontier.shelve"), restart=True)
+        frontier.add_url("https://www.ics.uci.edu/about")
+        frontier.mark_url_complete(frontier.get_tbd_url())
+        frontier.close()
+        self.assertTrue(os.path.exists("frontier.shelve.priority"))
+
+        resumed = Frontier(make_config("frontier.shelve"), restart=False)
+        resumed._loader.join()
+        self.assertEqual(resumed.to_be_downloaded.get_state(), frontier.to_be_downloaded.get_state())
+        self.assertEqual(resumed.to_be_downloaded.scorer.host_pages, {"www.ics.uci.edu": 1})
+        resumed.close()
+
+    def test_trap_templates_persisted(self):
+        frontier = Frontier(make_config("frontier.shelve"), restart=True)
+        self.addCleanup(scraper.trap_templates.clear)
+        for i in range(scraper.trap_templates.min_pages):
+            scraper.trap_templates.record(f"https://www.ics.uci.edu/calendar/{i}", bad=True)
+        frontier.add_url("https://www.ics.uci.edu/calendar/999")
+        self.assertEqual(frontier._trap_skips, 1)
+        self.assertEqual(len(frontier.to_be_downloaded), 1)
+        frontier.close()
+        scraper.trap_templates.clear()
+
+        resumed = Frontier(make_config("frontier.shelve"), restart=False)
+        resumed.add_url("https://www.ics.uci.edu/calendar/1000")
+        resumed.add_url("https://www.ics.uci.edu/about")
+        self.assertEqual(resumed._trap_skips, 1)
+        resumed.close()
+        # A fresh crawl forgets them
+        Frontier(make_config("frontier.shelve"), restart=True).close()
+        self.assertFalse(scraper.trap_templates.blocked("https://www.ics.uci.edu/calendar/1000"))
+
+    def _crawl_and_kill(self, pages, completed, checkpoint_size):
+        # Discover pages, complete some of them, give the log one commit interval and SIGKILL the process
+        script = textwrap.dedent(f'''
+            import os, signal, sys, time
+            sys.path.insert(0, {ROOT!r})
+            sys.path.insert(0, {os.path.dirname(os.path.abspath(__file__))!r})
+            from frontier_tests import make_config
+            from crawler.frontier import Frontier
+            frontier = Frontier(make_config("frontier.shelve", wal_checkpoint_size={checkpoint_size}), restart=True)
+            for i in range({pages}):
+                frontier.add_url(f"https://www.ics.uci.edu/page/{{i}}")
+            for _ in range({completed}):
+                frontier.mark_url_complete(frontier.get_tbd_url())
+            time.sleep(0.5)
+            os.kill(os.getpid(), signal.SIGKILL)
+        ''')
+        proc = subprocess.run([sys.executable, "-c", script], capture_output=True)
+        self.assertEqual(proc.returncode, -signal.SIGKILL, proc.stderr.decode())
+
+    def test_survives_kill(self):
+        # Everything logged more than one commit interval before a SIGKILL must be recovered
+        self._crawl_and_kill(pages=300, completed=1, checkpoint_size=10000)
+        resumed = Frontier(make_config("frontier.shelve"), restart=False)
+        resumed._loader.join()
+        # 300 pages discovered and the seed downloaded since the first checkpoint
+        self.assertEqual(len(resumed.unsaved), 301)
+        self.assertEqual(len(resumed.to_be_downloaded), 300)
+        resumed.close()
+
+    def test_resume_from_snapshot_and_log(self):
+        # Checkpoints every 100 changes, so the resume combines a snapshot with the log written after it
+        self._crawl_and_kill(pages=250, completed=30, checkpoint_size=100)
+        resumed = Frontier(make_config("frontier.shelve"), restart=False)
+        self.assertIsNotNone(resumed.snapshot)
+        resumed._loader.join()
+        pending = drain(resumed.to_be_downloaded)
+        self.assertEqual(len(pending), 251 - 30)
+        self.assertEqual(len(set(pending)), len(pending))
+        self.assertNotIn("https://www.ics.uci.edu", pending)
+        self.assertIn("https://www.ics.uci.edu/page/249", pending)
+        self.assertTrue(resumed._is_discovered(get_urlhash("https://www.ics.uci.edu/page/0")))
+        resumed.close()
+
+    def test_filter_rebuilt_from_snapshot(self):
+        self._crawl_and_kill(pages=250, completed=30, checkpoint_size=100)
+        resumed = Frontier(make_config("frontier.shelve"), restart=False)
+        resumed._loader.join()
+        self.assertTrue(resumed._use_loaded_filter())
+        for i in range(250):
+            self.assertIn(get_urlhash(f"https://www.ics.uci.edu/page/{i}"), resumed.discovered_filter)
+        # Known urls are not added again; new ones are admitted without a lookup
+        resumed.add_url("https://www.ics.uci.edu/page/3")
+        self.assertEqual(len(resumed.to_be_downloaded), 251 - 30)
+        lookups = resumed._store_lookups
+        resumed.add_url("https://www.ics.uci.edu/new-page")
+        self.assertEqual(len(resumed.to_be_downloaded), 252 - 30)
+        self.assertEqual(resumed._store_lookups, lookups)
+        resumed.close()
+
+    def test_checkpoint_off_the_lock(self):
+        frontier = Frontier(make_config("frontier.shelve", wal_checkpoint_size=50), restart=True)
+        writing, resume = threading.Event(), threading.Event()
+        write_snapshot = frontier_module.write_snapshot
+
+        def slow_write_snapshot(*args):
+            writing.set()
+            resume.wait(5)
+            write_snapshot(*args)
+
+        with mock.patch.object(frontier_module, "write_snapshot", slow_write_snapshot):
+            for i in range(50):
+                frontier.add_url(f"https://www.ics.uci.edu/page/{i}")
+            self.assertTrue(writing.wait(5))
+            # The checkpoint is stuck writing its snapshot; urls are still admitted
+            start = time.perf_counter()
+            frontier.add_url("https://www.ics.uci.edu/page/0")
+            frontier.add_url("https://www.ics.uci.edu/new-page")
+            self.assertLess(time.perf_counter() - start, 1)
+            self.assertEqual(len(frontier.to_be_downloaded), 52)
+            self.assertEqual(len(frontier.unsaved), 1)
+            self.assertTrue(os.path.exists("frontier.shelve.wal.old"))
+            resume.set()
+            frontier.close()
+        self.assertFalse(os.path.exists("frontier.shelve.wal.old"))
+
+        resumed = Frontier(make_config("frontier.shelve"), restart=False)
+        resumed._loader.join()
+        self.assertEqual(len(resumed.to_be_downloaded), 52)
+        resumed.close()
+
+    def test_snapshot_digests_merged(self):
+        # Each checkpoint merges the new digests into those of the previous snapshot
+        frontier = Frontier(make_config("frontier.shelve"), restart=True)
+        for batch in range(3):
+            for i in range(50):
+                frontier.add_url(f"https://www.ics.uci.edu/{batch}/{i}")
+            frontier.mark_url_complete(frontier.get_tbd_url())
+            frontier._checkpoint()
+        self.assertEqual(frontier.snapshot.discovered_count, 151)
+        self.assertEqual(
+            b"".join(frontier.snapshot.iter_digest_chunks(chunk_size=7)),
+            b"".join(sorted_digests(frontier.save.keys())))
+        frontier.close()
+
+    def test_failed_checkpoint_recovered(self):
+        frontier = Frontier(make_config("frontier.shelve"), restart=True)
+        for i in range(20):
+            frontier.add_url(f"https://www.ics.uci.edu/page/{i}")
+        with mock.patch.object(frontier_module, "write_snapshot", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                frontier._checkpoint()
+        # Nothing is lost: the changes wait for the next checkpoint, logged in the old log
+        self.assertEqual(len(frontier.unsaved), 20)
+        frontier.add_url("https://www.ics.uci.edu/new-page")
+        frontier.wal.commit()
+        # A copy of the files as a crash now would leave them
+        os.mkdir("crashed")
+        for name in os.listdir("."):
+            if name.startswith("frontier.shelve"):
+                shutil.copy(name, os.path.join("crashed", name))
+        frontier.close()
+
+        for directory in (".", "crashed"):
+            with self.subTest(directory=directory):
+                os.chdir(os.path.join(self._tmp.name, directory))
+                resumed = Frontier(make_config("frontier.shelve"), restart=False)
+                if resumed._loader is not None:
+                    resumed._loader.join()
+                self.assertEqual(len(resumed.to_be_downloaded), 22)
+                self.assertFalse(os.path.exists("frontier.shelve.wal.old"))
+                resumed.close()
+
+    def test_filter_rebuilt_from_save_file(self):
+        frontier = Frontier(make_config("frontier.shelve"), restart=True)
+        frontier.add_url("https://www.ics.uci.edu/about")
+        frontier.close()
+        # Without a snapshot the resume starts from the save file
+        os.remove("frontier.shelve.snapshot")
+
+        resumed = Frontier(make_config("frontier.shelve"), restart=False)
+        self.assertTrue(resumed._filter_ready)
+        self.assertIn(get_urlhash("https://www.ics.uci.edu/about"), resumed.discovered_filter)
+        resumed.add_url("https://www.ics.uci.edu/about")
+        self.assertEqual(len(resumed.to_be_downloaded), 2)
+        resumed.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
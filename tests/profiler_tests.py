@@ -0,0 +1,70 @@
+import unittest
+import sys
+import os
+import time
+import signal
+import tempfile
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import profiler as profiler_module
+from utils.profiler import start_profiling, profile_on_signal
+
+
+def spin(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+class TestSamplingProfiler(unittest.TestCase):
+    def test_profiles_running_threads(self):
+        stop = threading.Event()
+        busy = threading.Thread(target=spin, args=(stop,), name="Worker-0", daemon=True)
+        busy.start()
+        self.addCleanup(stop.set)
+        with tempfile.TemporaryDirectory() as tmp:
+            profiler = start_profiling(duration=0.3, interval=0.005, out_dir=tmp)
+            # One window at a time
+            self.assertIsNone(start_profiling(duration=0.3, out_dir=tmp))
+            profiler.join(10)
+            self.assertFalse(profiler.is_alive())
+            self.assertTrue(busy.is_alive())
+
+            collapsed = [path for path in profiler.files if path.endswith(".collapsed")]
+            self.assertEqual(len(collapsed), 1)
+            with open(collapsed[0]) as f:
+                lines = [line for line in f if line.startswith("Worker-0;")]
+            self.assertTrue(lines)
+            self.assertTrue(all(" (profiler_tests.py:" in line for line in lines))
+            self.assertEqual(
+                sum(int(line.rsplit(" ", 1)[1]) for line in lines), profiler.samples)
+
+            report = [path for path in profiler.files if path.endswith("-Worker-0.txt")]
+            with open(report[0]) as f:
+                self.assertIn("spin (profiler_tests.py:", f.read())
+
+            # Another window may start once this one is over
+            profiler = start_profiling(duration=0.01, out_dir=tmp)
+            self.assertIsNotNone(profiler)
+            profiler.join(10)
+
+    @unittest.skipUnless(hasattr(signal, "SIGUSR1"), "needs SIGUSR1")
+    def test_signal_starts_profile(self):
+        previous = signal.getsignal(signal.SIGUSR1)
+        self.addCleanup(signal.signal, signal.SIGUSR1, previous)
+        with tempfile.TemporaryDirectory() as tmp:
+            profile_on_signal(signal.SIGUSR1, duration=0.05, out_dir=tmp)
+            # Taken by the trigger thread, not by the handler on this one
+            with profiler_module._lock:
+                os.kill(os.getpid(), signal.SIGUSR1)
+            deadline = time.monotonic() + 10
+            while time.monotonic() < deadline and not any(
+                    name.endswith(".collapsed") for name in os.listdir(tmp)):
+                time.sleep(0.01)
+            self.assertTrue(any(name.endswith(".collapsed") for name in os.listdir(tmp)))
+            while profiler_module._running is not None and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+
+if __name__ == "__main__":
+    unittest.main()
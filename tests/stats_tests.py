@@ -0,0 +1,255 @@
+import unittest
+import sys
+import os
+import time
+import random
+import json
+import tempfile
+import threading
+from collections import Counter
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import stats as stats_module
+from utils import digest_set, write_file_atomically
+from utils.digest_set import DigestSet
+from utils.stats import CrawlStats, MetricsFlusher, ShardedSet, TopK
+from utils.timing import Histogram, StageTimings
+
+
+class TestDigestSet(unittest.TestCase):
+    def check_against_set(self):
+        rng = random.Random(11)
+        items = DigestSet(capacity=16)
+        expected = set()
+        for _ in range(50000):
+            url = f"https://www.ics.uci.edu/{rng.randint(0, 30000)}"
+            self.assertEqual(items.add(url), url not in expected)
+            expected.add(url)
+        self.assertEqual(len(items), len(expected))
+        self.assertTrue(all(url in items for url in expected))
+        self.assertFalse(any(f"https://www.cs.uci.edu/{i}" in items for i in range(10000)))
+        # Grown by doubling, never past MAX_LOAD
+        self.assertLessEqual(len(items), items.nbytes // 8 * DigestSet.MAX_LOAD)
+
+    def test_grow_with_numpy(self):
+        if digest_set.np is None:
+            self.skipTest("numpy is not installed")
+        self.check_against_set()
+
+    def test_grow_without_numpy(self):
+        saved, digest_set.np = digest_set.np, None
+        self.addCleanup(setattr, digest_set, "np", saved)
+        self.check_against_set()
+
+    def test_zero_digest(self):
+        items = DigestSet()
+        self.assertTrue(items.add_digest(0))
+        self.assertTrue(items.contains_digest(0))
+        self.assertFalse(items.add_digest(0))
+
+
+class TestShardedSet(unittest.TestCase):
+    def test_add_reports_new_items(self):
+        items = ShardedSet(shards=4)
+        self.assertTrue(items.add("a"))
+        self.assertFalse(items.add("a"))
+        self.assertTrue(items.add("b"))
+        self.assertIn("a", items)
+        self.assertNotIn("c", items)
+        self.assertEqual(len(items), 2)
+
+    def test_digest_shards(self):
+        items = ShardedSet(shards=4)
+        urls = [f"https://www.ics.uci.edu/{i}" for i in range(5000)]
+        self.assertTrue(all(items.add(url) for url in urls))
+        self.assertFalse(any(items.add(url) for url in urls))
+        self.assertEqual(len(items), 5000)
+
+
+class TestCrawlStats(unittest.TestCase):
+    def run_threads(self, target, count=8):
+        threads = [threading.Thread(target=target, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_counts_exact_under_concurrency(self):
+        stats = CrawlStats()
+        first_times = []
+
+        def crawl(worker):
+            for page in range(1000):
+                # Every worker crawls the same 500 urls twice over
+                url = f"https://a.ics.uci.edu/{page % 500}"
+                if stats.add_url(url, url):
+                    first_times.append(url)
+                    stats.add_subdomain_page("a.ics.uci.edu")
+                stats.add_page_words(url, page, Counter({"word": 1, f"w{worker}": 2}))
+
+        self.run_threads(crawl)
+        # Every thread has exited and had its counters folded in
+        self.assertEqual(stats._locals, [])
+        self.assertEqual(len(first_times), 500)
+        self.assertEqual(stats.unique_pages(), 500)
+        self.assertEqual(stats.subdomain_counts(), {"a.ics.uci.edu": 500})
+        words = dict(stats.most_common_words(50))
+        self.assertEqual(words["word"], 8000)
+        self.assertEqual(words["w3"], 2000)
+        self.assertEqual(stats.longest_page()[1], 999)
+
+    def test_reads_include_unmerged_counters(self):
+        stats = CrawlStats()
+        self.assertLess(1, stats_module.MERGE_EVERY)
+        stats.add_page_words("https://a.ics.uci.edu/", 40, Counter({"crawler": 3}))
+        stats.add_subdomain_page("a.ics.uci.edu")
+        self.assertEqual(stats.most_common_words(1), [("crawler", 3)])
+        self.assertEqual(stats.longest_page(), ("https://a.ics.uci.edu/", 40))
+        self.assertEqual(stats.subdomain_count("a.ics.uci.edu"), 1)
+
+    def test_duplicate_detection(self):
+        stats = CrawlStats(near_dup_threshold=3)
+        self.assertTrue(stats.add_page_hash("abc"))
+        self.assertFalse(stats.add_page_hash("abc"))
+        self.assertTrue(stats.add_simhash(0b1111))
+        self.assertFalse(stats.add_simhash(0b1101))
+        self.assertTrue(stats.add_simhash(0b11110000 << 8))
+
+
+class TestTopK(unittest.TestCase):
+    def test_matches_full_sort(self):
+        rng = random.Random(7)
+        counts = Counter()
+        top = TopK(10)
+        for _ in range(20000):
+            # Skewed vocabulary so the top keeps changing early on
+            word = f"w{int(rng.paretovariate(1.2)) % 500}"
+            counts[word] += rng.randint(1, 3)
+            top.offer(word, counts[word])
+        expected = [count for _, count in counts.most_common(10)]
+        self.assertEqual([count for _, count in top.most_common()], expected)
+        for word, count in top.most_common():
+            self.assertEqual(counts[word], count)
+
+
+class TestMetricsFlusher(unittest.TestCase):
+    def test_flushes_every_n_pages_and_on_close(self):
+        flushed = threading.Event()
+        calls = []
+
+        def flush():
+            calls.append(1)
+            flushed.set()
+
+        flusher = MetricsFlusher(flush, interval=60, every_pages=5)
+        for _ in range(4):
+            flusher.page_done()
+        self.assertFalse(flushed.wait(0.1))
+        flusher.page_done()
+        self.assertTrue(flushed.wait(2))
+        flusher.close()
+        self.assertEqual(len(calls), 2)
+        self.assertFalse(flusher.is_alive())
+
+    def test_flush_errors_do_not_stop_the_thread(self):
+        calls = []
+
+        def flush():
+            calls.append(1)
+            raise OSError("disk full")
+
+        flusher = MetricsFlusher(flush, interval=0.01, every_pages=1000)
+        flusher.page_done()
+        deadline = time.monotonic() + 2
+        while len(calls) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertGreaterEqual(len(calls), 2)
+        self.assertTrue(flusher.is_alive())
+        flusher.close()
+
+
+class TestWriteFileAtomically(unittest.TestCase):
+    def test_concurrent_writers(self):
+        # Writers of the same file (final report, flusher thread) do not share a temporary file
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "metrics.txt")
+            texts = [str(i) * 10000 for i in range(8)]
+            errors = []
+
+            def write(text):
+                try:
+                    for _ in range(20):
+                        write_file_atomically(path, text)
+                except OSError as e:
+                    errors.append(e)
+
+            threads = [threading.Thread(target=write, args=(text,)) for text in texts]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(errors, [])
+            with open(path, encoding="utf-8") as f:
+                self.assertIn(f.read(), texts)
+            self.assertEqual(os.listdir(tmp), ["metrics.txt"])
+
+
+class TestHistogram(unittest.TestCase):
+    def test_percentiles_within_bucket_error(self):
+        rng = random.Random(5)
+        samples = [rng.lognormvariate(-6, 1.5) for _ in range(20000)]
+        histogram = Histogram()
+        for seconds in samples:
+            histogram.record(seconds)
+        samples.sort()
+        for pct in (50, 95, 99):
+            exact = samples[int(len(samples) * pct / 100) - 1]
+            self.assertAlmostEqual(histogram.percentile(pct) / exact, 1, delta=0.1)
+        self.assertEqual(histogram.max, samples[-1])
+        self.assertEqual(histogram.count, len(samples))
+
+    def test_extremes(self):
+        histogram = Histogram()
+        for seconds in (0.0, 1e-9, 1e9):
+            histogram.record(seconds)
+        self.assertEqual(histogram.percentile(100), 1e9)
+        self.assertEqual(Histogram().percentile(50), 0.0)
+
+
+class TestStageTimings(unittest.TestCase):
+    def test_aggregates_threads(self):
+        timings = StageTimings()
+
+        def work(seconds):
+            for _ in range(1000):
+                timings.record("download", seconds)
+                timings.count("pages")
+
+        threads = [threading.Thread(target=work, args=(0.001 * (i + 1),)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(timings._threads, [])
+        snapshot = timings.snapshot()
+        self.assertEqual(snapshot["counters"], {"pages": 4000})
+        download = snapshot["stages"]["download"]
+        self.assertEqual(download["count"], 4000)
+        self.assertAlmostEqual(download["total_s"], 10.0)
+        self.assertAlmostEqual(download["p50_s"], 0.002, delta=0.0002)
+        self.assertEqual(download["max_s"], 0.004)
+
+    def test_dump(self):
+        timings = StageTimings()
+        timings.record("parse", 0.01)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "stage_timings.json")
+            timings.dump(path)
+            with open(path) as f:
+                report = json.load(f)
+        self.assertEqual(report["stages"]["parse"]["count"], 1)
+        self.assertIn("written", report)
+
+
+if __name__ == "__main__":
+    unittest.main()
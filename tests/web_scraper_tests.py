@@ -1,6 +1,13 @@
 import unittest
+import random
 import sys
 import os
+import glob
+import hashlib
+import json
+from urllib.parse import urljoin
+from types import SimpleNamespace
+import unicodedata
 from bs4 import BeautifulSoup
 
 # NOTE The tests directory needs to be removed before submission
@@ -8,6 +15,14 @@ from bs4 import BeautifulSoup
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import scraper
 import tokenizer
+from utils import simhash
+from utils.simhash import SimhashIndex
+from bs4.element import Comment
+from utils.page_extract import extract_page, DISALLOWED_TAGS, WORD_RE
+from utils.url_filter import UrlFilter, RULES_FILE
+from utils.url_templates import TrapTemplates, template_segments
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
 
 # NOTE: URLs used are solely for test purposes, I'm not sure if it's a good idea to visit them
 class TestNormalizeURL(unittest.TestCase):
@@ -289,5 +304,220 @@ class TestLinkValidation(unittest.TestCase):
         for url in edge_cases:
             self.assertEqual(scraper.is_valid(url), True)
 
+class TestUrlFilter(unittest.TestCase):
+    def test_recorded_verdicts(self):
+        url_filter = UrlFilter.from_file()
+        with open(os.path.join(CORPUS_DIR, "links.tsv"), encoding="utf-8") as f:
+            for line in f:
+                verdict, url = line.rstrip("\n").split("\t", 1)
+                with self.subTest(url=url):
+                    self.assertEqual(url_filter.is_valid(url), verdict == "1")
+
+    def test_reason_codes(self):
+        url_filter = UrlFilter.from_file()
+        reasons = {
+            "https://www.ics.uci.edu/about": None,
+            "": "empty",
+            "ftp://ics.uci.edu/file": "scheme",
+            "https://example.com/ics.uci.edu": "domain",
+            "https://www.ics.uci.edu/paper.PDF": "file_type",
+            "https://www.ics.uci.edu/2020/01/02/post": "date_path",
+            "https://www.ics.uci.edu/news?page=1234": "deep_pagination",
+            "https://www.ics.uci.edu/a/b/a/b/a/b": "repeated_segments",
+            "https://isg.ics.uci.edu/events/talk": "calendar",
+            "https://isg.ics.uci.edu/people": None,
+            "https://gitlab.ics.uci.edu/": "gitlab",
+            "https://www.ics.uci.edu/wiki/doku.php": "wiki",
+        }
+        for url, reason in reasons.items():
+            with self.subTest(url=url):
+                self.assertEqual(url_filter.check(url), reason)
+
+    def test_rules_are_data(self):
+        with open(RULES_FILE, encoding="utf-8") as f:
+            rules = json.load(f)
+        rules["host_rules"]["vision.ics.uci.edu"] = [{"reason": "archive", "path_prefixes": ["/old/"]}]
+        rules["substrings"].append({"reason": "print_view", "field": "query", "values": ["print=1"]})
+        url_filter = UrlFilter(rules)
+        self.assertEqual(url_filter.check("https://vision.ics.uci.edu/old/index.html"), "archive")
+        self.assertIsNone(url_filter.check("https://vision.ics.uci.edu/papers"))
+        self.assertEqual(url_filter.check("https://www.ics.uci.edu/page?print=1"), "print_view")
+        self.assertNotEqual(url_filter.signature(), UrlFilter.from_file().signature())
+
+
+class TestLinkCache(unittest.TestCase):
+    HREFS = ["/about", "people/", "../up", "?q=1", "#top", "//cs.uci.edu/x", "//", "//?q",
+             "///x", "https:///x", "https://www.stat.uci.edu/a/./b", "http://x/./y",
+             "https:rel", "mailto:a@ics.uci.edu", "/\n/evil.org/x", "a:\n/", "/", ""]
+    PAGES = ["https://www.ics.uci.edu/dept/a.html", "http://cs.uci.edu/x/y/",
+             "HTTPS://WWW.Stat.uci.edu:8080/a;p?q#f"]
+
+    def setUp(self):
+        self.addCleanup(scraper.set_link_cache_size, scraper.LINK_CACHE_SIZE)
+        scraper.set_link_cache_size(1000)
+
+    def test_matches_urljoin(self):
+        for page_url in self.PAGES:
+            for _ in range(2):  # second round is served from the cache
+                resolved = [link for link, _ in scraper.resolve_links(page_url, self.HREFS)]
+                self.assertEqual(resolved, [urljoin(page_url, href) for href in self.HREFS])
+
+    def test_shared_links_hit_across_pages(self):
+        hrefs = ["/about", "https://www.cs.uci.edu/people", "local.html"]
+        for page in range(10):
+            scraper.resolve_links(f"https://www.ics.uci.edu/p{page}/index.html", hrefs)
+        info = scraper.link_cache_info()
+        # Only the page-relative href misses on every page
+        self.assertEqual((info.hits, info.misses), (18, 12))
+
+    def test_normalized_and_validated(self):
+        (link, normalized), = scraper.resolve_links(
+            "https://www.ics.uci.edu/", ["/About/?utm_source=x&b=2&a=1#frag"])
+        self.assertEqual(link, "https://www.ics.uci.edu/About/?utm_source=x&b=2&a=1#frag")
+        self.assertEqual(normalized, "https://ics.uci.edu/About?a=1&b=2")
+        (_, normalized), = scraper.resolve_links("https://www.ics.uci.edu/", ["/logo.png"])
+        self.assertIsNone(normalized)
+
+
+class TestTrapTemplates(unittest.TestCase):
+    def test_template_segments(self):
+        self.assertEqual(
+            template_segments("https://WICS.ics.uci.edu/events/2020-01-05/?view=day&ical=1"),
+            ("wics.ics.uci.edu", ["events", "{d}-{d}-{d}", "?ical&view"]))
+        self.assertEqual(template_segments("https://ics.uci.edu"), ("ics.uci.edu", []))
+
+    def test_blocks_bad_template(self):
+        traps = TrapTemplates(min_pages=10, bad_ratio=0.8)
+        for day in range(1, 10):
+            self.assertIsNone(traps.record(f"https://wics.ics.uci.edu/events/2020-01-{day}", bad=True))
+        self.assertFalse(traps.blocked("https://wics.ics.uci.edu/events/2021-03-04"))
+        self.assertEqual(
+            traps.record("https://wics.ics.uci.edu/events/2020-01-10", bad=True),
+            "wics.ics.uci.edu/events/{d}-{d}-{d}")
+        self.assertTrue(traps.blocked("https://wics.ics.uci.edu/events/2021-03-04"))
+        # Other templates, parents and other hosts are left alone
+        self.assertFalse(traps.blocked("https://wics.ics.uci.edu/events"))
+        self.assertFalse(traps.blocked("https://wics.ics.uci.edu/events/2021-03-04/details"))
+        self.assertFalse(traps.blocked("https://wics.ics.uci.edu/events/2021-03-04?view=day"))
+        self.assertFalse(traps.blocked("https://www.ics.uci.edu/events/2021-03-04"))
+
+    def test_good_template_kept(self):
+        traps = TrapTemplates(min_pages=10, bad_ratio=0.8)
+        for i in range(100):
+            traps.record(f"https://www.ics.uci.edu/~user/pub/{i}", bad=i % 3 == 0)
+        self.assertFalse(traps.blocked("https://www.ics.uci.edu/~user/pub/500"))
+        disabled = TrapTemplates(min_pages=0)
+        for i in range(100):
+            disabled.record(f"https://www.ics.uci.edu/page/{i}", bad=True)
+        self.assertFalse(disabled.blocked("https://www.ics.uci.edu/page/500"))
+
+    def test_state_round_trip(self):
+        traps = TrapTemplates(min_pages=2, bad_ratio=1.0)
+        for url in ["https://a.ics.uci.edu/p/1", "https://a.ics.uci.edu/p/2", "https://a.ics.uci.edu/q"]:
+            traps.record(url, bad=True)
+        restored = TrapTemplates(min_pages=2, bad_ratio=1.0)
+        restored.set_state(json.loads(json.dumps(traps.get_state())))
+        self.assertEqual(restored.blocked_count, 1)
+        self.assertTrue(restored.blocked("https://a.ics.uci.edu/p/3"))
+        self.assertEqual(restored.get_state(), traps.get_state())
+
+
+class TestSimhashIndex(unittest.TestCase):
+    def test_matches_linear_scan(self):
+        # The index must flag exactly the fingerprints the linear hamming_distance scan would flag
+        rng = random.Random(121)
+        stored = [rng.getrandbits(64) for _ in range(2000)]
+        index = SimhashIndex(threshold=scraper.NEAR_DUP_THRESHOLD)
+        for fp in stored:
+            index.add(fp)
+
+        probes = [rng.getrandbits(64) for _ in range(200)]
+        for fp in stored[:200]:
+            for distance in range(7):
+                flipped = fp
+                for bit in rng.sample(range(64), distance):
+                    flipped ^= 1 << bit
+                probes.append(flipped)
+
+        for probe in probes:
+            expected = any(scraper.hamming_distance(probe, fp) < scraper.NEAR_DUP_THRESHOLD for fp in stored)
+            self.assertEqual(index.find_near(probe) is not None, expected)
+
+    def test_add_if_unique(self):
+        index = SimhashIndex(threshold=5)
+        self.assertIsNone(index.add_if_unique(0b11111))
+        # 4 bits away is a near-duplicate and is not stored, 5 bits away is a new page
+        self.assertEqual(index.add_if_unique(0b10000), 0b11111)
+        self.assertIsNone(index.add_if_unique(0))
+        self.assertEqual(len(index), 2)
+
+
+class TestComputeSimhash(unittest.TestCase):
+    @staticmethod
+    def _original_simhash(words):
+        hash_bits = [0] * 64
+        for word in set(words):
+            freq = words.count(word)
+            h = int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16)
+            for i in range(64):
+                hash_bits[i] += freq if (h >> i) & 1 else -freq
+        return sum(1 << i for i, bit_sum in enumerate(hash_bits) if bit_sum > 0)
+
+    def test_md5_mode_matches_original(self):
+        rng = random.Random(7)
+        vocab = ["research", "student", "computer", "uci", "data", "graduate", "café", "x", "events"]
+        for size in (0, 1, 5, 50, 500):
+            words = [rng.choice(vocab) for _ in range(size)]
+            self.assertEqual(scraper.compute_simhash(words, "md5"), self._original_simhash(words))
+
+    def test_fast_path_matches_bit_loop(self):
+        words = "the quick brown fox jumps over the lazy dog the end".split()
+        counts = {w: words.count(w) for w in dict.fromkeys(words)}
+        for token_hash, hash_fn in simhash.TOKEN_HASHES.items():
+            expected = simhash._simhash_bits_loop([hash_fn(w) for w in counts], counts.values())
+            self.assertEqual(simhash.compute_simhash(words, token_hash), expected)
+
+
+class TestPageExtract(unittest.TestCase):
+    @staticmethod
+    def _three_walks(content):
+        # Text, words and links exactly as extract_next_links used to build them from the soup
+        soup = BeautifulSoup(content, "lxml")
+        visible = [t.strip() for t in soup.find_all(string=True)
+                   if t.parent.name not in DISALLOWED_TAGS and not isinstance(t, Comment) and t.strip()]
+        text_content = unicodedata.normalize("NFKC", " ".join(visible))
+        words = WORD_RE.findall(" ".join(visible).lower())
+        hrefs = [link.get("href").strip() for link in soup.find_all("a", href=True)]
+        return text_content, words, hrefs
+
+    def _assert_parity(self, content, name):
+        expected = self._three_walks(content)
+        for backend in ("lxml", "soup"):
+            with self.subTest(page=name, backend=backend):
+                self.assertEqual(tuple(extract_page(content, backend)), expected)
+
+    def test_corpus_parity(self):
+        # Pages cover scripts/comments, malformed markup, doctypes in odd places, declared and sniffed encodings
+        paths = sorted(glob.glob(os.path.join(CORPUS_DIR, "html", "*.html")))
+        self.assertTrue(paths)
+        for path in paths:
+            with open(path, "rb") as f:
+                self._assert_parity(f.read(), os.path.basename(path))
+
+    def test_encoding_lxml_rejects(self):
+        # EncodingDetector guesses cp1006 first, which libxml2 does not know
+        content = b"<br>\n</td>caf\xe9"
+        self.assertEqual(extract_page(content, "lxml"), extract_page(content, "soup"))
+        resp = SimpleNamespace(url="https://www.ics.uci.edu/cafe", status=200, payload_size=0,
+                               raw_response=SimpleNamespace(content=content, headers={"Content-Type": "text/html"}))
+        self.assertEqual(scraper.extract_next_links(resp.url, resp), [])
+
+    def test_large_page_parity(self):
+        rows = "".join(f"<tr><td><a href='/item/{i}'>Item {i}</a></td><td>description of item {i} &amp; more</td></tr>\n"
+                       for i in range(20000))
+        content = f"<html><head><title>Big</title></head><body><table>{rows}</table></body></html>".encode("utf-8")
+        self._assert_parity(content, "large")
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,5 +1,8 @@
 import os
 import logging
+import tempfile
+import threading
+import weakref
 from hashlib import sha256
 from urllib.parse import urlparse
 
@@ -22,6 +25,41 @@ def get_logger(name, filename=None):
     return logger
 
 
+def write_file_atomically(path, text):
+    """ Replace the file with the text; readers see the old or the new
+    contents, never a partly written file. """
+    # A temporary file of its own, so that concurrent writers never share one
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            # mkstemp makes it private; the reports are for everyone to read
+            os.fchmod(f.fileno(), 0o644)
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+class _ThreadExit(object):
+    __slots__ = ("__weakref__",)
+
+
+_thread_exit = threading.local()
+
+
+def at_thread_exit(callback, *args):
+    """ Call callback(*args) when the calling thread exits, from that thread,
+    before join() on it returns. Never called for the main thread. """
+    # Only the thread's local storage holds the token; it is released when
+    # the thread finishes, which runs the finalizers attached to it
+    token = getattr(_thread_exit, "token", None)
+    if token is None:
+        token = _thread_exit.token = _ThreadExit()
+    weakref.finalize(token, callback, *args).atexit = False
+
+
 def get_urlhash(url):
     parsed = urlparse(url)
     # everything other than scheme.
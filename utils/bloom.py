@@ -0,0 +1,81 @@
+import math
+
+try:
+    import numpy as np
+except ImportError:  # Rebuild with a Python loop instead
+    np = None
+
+
+class BloomFilter(object):
+    """Probabilistic set of url hashes (SHA256 hex digests, as made by
+    utils.get_urlhash).
+
+    `in` never misses a hash that was added; it wrongly reports one that
+    was not with probability about `error_rate` while the filter holds at
+    most `capacity` hashes, and more often past that. Bits are set by
+    double hashing the first 128 bits of the digest, so the same hash sets
+    the same bits in every run and a filter can be rebuilt from persisted
+    digests: add_digests() takes raw 32-byte digests in bulk.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        if capacity < 1 or not 0 < error_rate < 1:
+            raise ValueError("capacity must be positive and error_rate in (0, 1)")
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _indexes(self, urlhash):
+        size = self.size
+        a = int(urlhash[:16], 16) % size
+        b = (int(urlhash[16:32], 16) | 1) % size
+        return [(a + i * b) % size for i in range(self.hashes)]
+
+    def add(self, urlhash):
+        bits = self._bits
+        for index in self._indexes(urlhash):
+            bits[index >> 3] |= 1 << (index & 7)
+        self.count += 1
+
+    def __contains__(self, urlhash):
+        bits = self._bits
+        for index in self._indexes(urlhash):
+            if not bits[index >> 3] & (1 << (index & 7)):
+                return False
+        return True
+
+    def add_digests(self, digests):
+        """Add raw 32-byte digests, concatenated in a bytes-like object."""
+        if np is None:
+            view = memoryview(digests)
+            for start in range(0, len(view), 32):
+                self.add(view[start:start + 32].hex())
+            return
+        rows = np.frombuffer(digests, dtype=np.uint8).reshape(-1, 32)
+        if not len(rows):
+            return
+        size = np.uint64(self.size)
+        # Same indexes as _indexes: the hex prefixes read as big-endian integers
+        a = rows[:, :8].copy().view(">u8").ravel().astype(np.uint64) % size
+        b = (rows[:, 8:16].copy().view(">u8").ravel().astype(np.uint64) | np.uint64(1)) % size
+        bits = np.frombuffer(self._bits, dtype=np.uint8)
+        for i in range(self.hashes):
+            index = (a + np.uint64(i) * b) % size
+            np.bitwise_or.at(
+                bits, (index >> np.uint64(3)).astype(np.intp),
+                np.left_shift(1, (index & np.uint64(7)).astype(np.uint8)).astype(np.uint8))
+        self.count += len(rows)
+
+    def update(self, other):
+        """Add every hash of another filter with the same size and hash count."""
+        if (other.size, other.hashes) != (self.size, self.hashes):
+            raise ValueError("Bloom filters differ in size")
+        if np is None:
+            self._bits = bytearray(x | y for x, y in zip(self._bits, other._bits))
+        else:
+            bits = np.frombuffer(self._bits, dtype=np.uint8)
+            np.bitwise_or(bits, np.frombuffer(other._bits, dtype=np.uint8), out=bits)
+        self.count += other.count
@@ -0,0 +1,112 @@
+import mmap
+import os
+import struct
+import threading
+
+# Each record: header, then the url (UTF-8) and the body the cache server
+# sent back (CBOR), byte for byte.
+RECORD_HEADER = struct.Struct("<IHI")  # url length, HTTP status, body length
+MAGIC = b"SPACETIME-ARCHIVE-1\n"
+
+
+def _records(data):
+    ''' (url, status, offset of the body, body length) of each record in the
+    archive contents `data`, up to the first one cut short. '''
+    offset = len(MAGIC)
+    while offset + RECORD_HEADER.size <= len(data):
+        url_length, status, length = RECORD_HEADER.unpack_from(data, offset)
+        body = offset + RECORD_HEADER.size + url_length
+        if body + length > len(data):
+            return
+        url = bytes(data[offset + RECORD_HEADER.size:body]).decode("utf-8")
+        yield url, status, body, length
+        offset = body + length
+
+
+def _read_magic(f, path):
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError(f"{path} is not a cache archive")
+
+
+class ArchiveWriter(object):
+    ''' Appends cache server answers to an archive file. Safe to share
+    between threads; records reach the file in the order they are made,
+    each flushed as it is written. A record cut short by a crash while
+    recording is cut off on open, so recording goes on after the last
+    complete one. '''
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "ab")
+        size = self._file.tell()
+        if size == 0:
+            self._file.write(MAGIC)
+            self._file.flush()
+        else:
+            end = self._complete_size(size)
+            if end < size:
+                self._file.truncate(end)
+        self.records = 0
+
+    def _complete_size(self, size):
+        ''' Bytes of the file up to the end of its last complete record. '''
+        with open(self.path, "rb") as f:
+            _read_magic(f, self.path)
+            if size == len(MAGIC):
+                return size
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                end = len(MAGIC)
+                for _, _, body, length in _records(data):
+                    end = body + length
+                return end
+
+    def record(self, url, status_code, content):
+        url = url.encode("utf-8")
+        content = content or b""
+        header = RECORD_HEADER.pack(len(url), status_code, len(content))
+        with self._lock:
+            self._file.write(header + url + content)
+            self._file.flush()
+            self.records += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class Archive(object):
+    ''' Read side of an archive: the last answer recorded for each url.
+
+    The file is memory-mapped and only indexed on open, so bodies are not
+    read until they are asked for. A record cut short by a crash while
+    recording is ignored. '''
+
+    def __init__(self, path):
+        self.path = path
+        # url -> (status, offset of the body, body length)
+        self._index = dict()
+        with open(path, "rb") as f:
+            _read_magic(f, path)
+            size = os.fstat(f.fileno()).st_size
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size > len(MAGIC) else b""
+        for url, status, body, length in _records(self._map):
+            self._index[url] = (status, body, length)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, url):
+        return url in self._index
+
+    def get(self, url):
+        ''' (status, body) recorded for the url, or None. '''
+        entry = self._index.get(url)
+        if entry is None:
+            return None
+        status, body, length = entry
+        return status, self._map[body:body + length]
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
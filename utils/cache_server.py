@@ -0,0 +1,79 @@
+"""Local stand-in for the cache server, answering from a recorded archive.
+
+It speaks the same protocol as the real one: GET /?q=<url>&u=<user agent>
+answered with the CBOR body recorded for the url, so the crawler runs
+unchanged against it, offline and without network latency. Urls missing
+from the archive get an empty 404.
+
+Run from the repository root:
+    python -m utils.cache_server ARCHIVE [--host 127.0.0.1] [--port 9000]
+"""
+import threading
+from argparse import ArgumentParser
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from utils.cache_archive import Archive
+
+
+class _ArchiveHandler(BaseHTTPRequestHandler):
+    # Keep-alive, like the real server
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = parse_qs(urlparse(self.path).query).get("q", [""])[0]
+        found = self.server.archive.get(url)
+        with self.server.counts_lock:
+            if found is None:
+                self.server.misses += 1
+            else:
+                self.server.hits += 1
+        status, body = found or (404, b"")
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ArchiveServer(ThreadingHTTPServer):
+    ''' Serves an Archive; port 0 picks a free port (see server_address). '''
+    daemon_threads = True
+
+    def __init__(self, archive, host="127.0.0.1", port=0):
+        super().__init__((host, port), _ArchiveHandler)
+        self.archive = archive
+        self.counts_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def start(self):
+        ''' Serve on a background thread until shutdown(). '''
+        thread = threading.Thread(
+            target=self.serve_forever, daemon=True, name="ArchiveServer")
+        thread.start()
+        return thread
+
+
+def main(path, host, port):
+    server = ArchiveServer(Archive(path), host, port)
+    print(f"Serving {len(server.archive)} recorded urls from {path} "
+          f"on {host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"{server.hits} answered from the archive, {server.misses} not found.")
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("archive")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    args = parser.parse_args()
+    main(args.archive, args.host, args.port)
@@ -8,10 +8,41 @@ class Config(object):
         assert self.user_agent != "DEFAULT AGENT", "Set useragent in config.ini"
         assert re.match(r"^[a-zA-Z0-9_ ,]+$", self.user_agent), "User agent should not have any special characters outside '_', ',' and 'space'"
         self.threads_count = int(config["LOCAL PROPERTIES"]["THREADCOUNT"])
+        self.autoscale = config["LOCAL PROPERTIES"].getboolean("AUTOSCALE", False)
+        self.min_threads_count = int(config["LOCAL PROPERTIES"].get("MIN_THREADCOUNT", "1"))
+        self.max_threads_count = int(config["LOCAL PROPERTIES"].get("MAX_THREADCOUNT", "16"))
+        self.autoscale_interval = float(config["LOCAL PROPERTIES"].get("AUTOSCALE_INTERVAL", "5"))
+        assert 1 <= self.min_threads_count <= self.max_threads_count, "Need 1 <= MIN_THREADCOUNT <= MAX_THREADCOUNT"
         self.save_file = config["LOCAL PROPERTIES"]["SAVE"]
+        self.engine = config["LOCAL PROPERTIES"].get("ENGINE", "threads").strip().lower()
+        assert self.engine in {"threads", "asyncio", "pipeline"}, "ENGINE should be 'threads', 'asyncio' or 'pipeline'"
+        self.async_concurrency = int(config["LOCAL PROPERTIES"].get("ASYNC_CONCURRENCY", "200"))
+        self.pipeline_processes = int(config["LOCAL PROPERTIES"].get("PIPELINE_PROCESSES", "0"))
+        self.pipeline_queue_size = int(config["LOCAL PROPERTIES"].get("PIPELINE_QUEUE_SIZE", "64"))
+        self.pipeline_report_interval = float(config["LOCAL PROPERTIES"].get("PIPELINE_REPORT_INTERVAL", "30"))
+        self.wal_commit_interval = float(config["LOCAL PROPERTIES"].get("WAL_COMMIT_INTERVAL", "1.0"))
+        self.wal_commit_size = int(config["LOCAL PROPERTIES"].get("WAL_COMMIT_SIZE", "500"))
+        self.wal_checkpoint_size = int(config["LOCAL PROPERTIES"].get("WAL_CHECKPOINT_SIZE", "10000"))
+        self.link_cache_size = int(config["LOCAL PROPERTIES"].get("LINK_CACHE_SIZE", "65536"))
+        self.bloom_capacity = int(config["LOCAL PROPERTIES"].get("BLOOM_CAPACITY", "2000000"))
+        self.bloom_error_rate = float(config["LOCAL PROPERTIES"].get("BLOOM_ERROR_RATE", "0.01"))
+        self.priority_frontier = config["LOCAL PROPERTIES"].getboolean("PRIORITY_FRONTIER", True)
+        self.host_budget = int(config["LOCAL PROPERTIES"].get("HOST_BUDGET", "0"))
+        self.frontier_memory_urls = int(config["LOCAL PROPERTIES"].get("FRONTIER_MEMORY_URLS", "100000"))
+        self.trap_min_pages = int(config["LOCAL PROPERTIES"].get("TRAP_MIN_PAGES", "20"))
+        self.trap_bad_ratio = float(config["LOCAL PROPERTIES"].get("TRAP_BAD_RATIO", "0.8"))
+        self.recrawl = config["LOCAL PROPERTIES"].getboolean("RECRAWL", False)
+        self.recrawl_file = config["LOCAL PROPERTIES"].get("RECRAWL_FILE", "pages.shelve")
+        self.stage_timings_file = config["LOCAL PROPERTIES"].get("STAGE_TIMINGS_FILE", "Logs/stage_timings.json")
+        self.stage_timings_interval = float(config["LOCAL PROPERTIES"].get("STAGE_TIMINGS_INTERVAL", "30"))
 
         self.host = config["CONNECTION"]["HOST"]
         self.port = int(config["CONNECTION"]["PORT"])
+        self.connect_timeout = float(config["CONNECTION"].get("CONNECT_TIMEOUT", "5"))
+        self.read_timeout = float(config["CONNECTION"].get("READ_TIMEOUT", "30"))
+        self.max_retries = int(config["CONNECTION"].get("MAX_RETRIES", "3"))
+        self.retry_backoff = float(config["CONNECTION"].get("RETRY_BACKOFF", "0.5"))
+        self.hedge_percentile = float(config["CONNECTION"].get("HEDGE_PERCENTILE", "0"))
 
         self.seed_urls = config["CRAWLER"]["SEEDURL"].split(",")
         self.time_delay = float(config["CRAWLER"]["POLITENESS"])
@@ -0,0 +1,124 @@
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # Grow the table with a Python loop instead
+    np = None
+
+MASK64 = (1 << 64) - 1
+# Odd 64-bit constant for Fibonacci hashing: the slot is the top bits of
+# digest * FIBONACCI, so digests that share their low bits (for example all
+# the items of one ShardedSet shard) still spread over the whole table.
+FIBONACCI = 0x9E3779B97F4A7C15
+
+
+class DigestSet(object):
+    """Set that keeps a 64-bit digest of each item instead of the item.
+
+    Digests sit in an open-addressing table (linear probing) backed by an
+    array of unsigned 64-bit integers, 8 bytes per slot with no per-item
+    objects, against well over 100 bytes per url for a set of strings. The
+    table doubles once it is MAX_LOAD full, so it costs 11-23 bytes per
+    item.
+
+    The digest is Python's hash() of the item, which for str and bytes is a
+    keyed 64-bit SipHash. Two different items share a digest with
+    probability about n / 2**64 per lookup (under 1e-12 at ten million
+    items), in which case the second one is reported as already present.
+    hash() is randomized per process, so the digests must not be persisted;
+    add_digest() takes a caller's own (stable) 64-bit digest instead.
+    """
+
+    MAX_LOAD = 0.7
+
+    def __init__(self, capacity=1024):
+        size = 8
+        while size * self.MAX_LOAD < capacity:
+            size *= 2
+        self._count = 0
+        self._allocate(size)
+
+    def _allocate(self, size):
+        self._table = array("Q", bytes(8 * size))
+        self._shift = 64 - (size.bit_length() - 1)
+        self._mask = size - 1
+        self._limit = int(size * self.MAX_LOAD)
+
+    @staticmethod
+    def digest(item):
+        return hash(item) & MASK64
+
+    def add(self, item):
+        """Add the item; True if it was not in the set yet."""
+        return self.add_digest(hash(item) & MASK64)
+
+    def __contains__(self, item):
+        return self.contains_digest(hash(item) & MASK64)
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def nbytes(self):
+        return self._table.itemsize * len(self._table)
+
+    def add_digest(self, digest):
+        digest = digest or 1  # 0 marks an empty slot
+        table = self._table
+        mask = self._mask
+        slot = ((digest * FIBONACCI) & MASK64) >> self._shift
+        while True:
+            value = table[slot]
+            if value == 0:
+                break
+            if value == digest:
+                return False
+            slot = (slot + 1) & mask
+        table[slot] = digest
+        self._count += 1
+        if self._count > self._limit:
+            self._grow()
+        return True
+
+    def contains_digest(self, digest):
+        digest = digest or 1
+        table = self._table
+        mask = self._mask
+        slot = ((digest * FIBONACCI) & MASK64) >> self._shift
+        while True:
+            value = table[slot]
+            if value == digest:
+                return True
+            if value == 0:
+                return False
+            slot = (slot + 1) & mask
+
+    def _grow(self):
+        old = self._table
+        self._allocate(2 * len(old))
+        if np is None:
+            count = self._count
+            self._count = 0
+            for digest in old:
+                if digest:
+                    self.add_digest(digest)
+            self._count = count
+            return
+        self._insert_all(np.frombuffer(old, dtype=np.uint64))
+
+    def _insert_all(self, old):
+        """Place the digests of the old table all at once: in every round each
+        free slot takes the first digest probing it and the others move on to
+        their next slot, which is where one-by-one insertion would put them."""
+        table = np.frombuffer(self._table, dtype=np.uint64)
+        digests = old[old != 0]
+        slots = (digests * np.uint64(FIBONACCI)) >> np.uint64(self._shift)
+        mask = np.uint64(self._mask)
+        while digests.size:
+            free = np.flatnonzero(table[slots] == 0)
+            taken, first = np.unique(slots[free], return_index=True)
+            table[taken] = digests[free[first]]
+            placed = np.zeros(digests.size, dtype=bool)
+            placed[free[first]] = True
+            digests = digests[~placed]
+            slots = (slots[~placed] + np.uint64(1)) & mask
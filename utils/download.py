@@ -1,21 +1,147 @@
 import requests
 import cbor
 import time
+import logging
+import threading
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from utils.response import Response
 
+# Status reported when the cache server could not be reached at all (timeout
+# or connection error after all retries). 600-606 are used by the cache server.
+DOWNLOAD_FAILED_STATUS = 607
+
+# Hedging only starts once this many latencies have been observed
+HEDGE_MIN_SAMPLES = 50
+
+_local = threading.local()
+# ArchiveWriter recording every answer of the cache server, see record_to()
+_recorder = None
+_hedge_lock = threading.Lock()
+_hedge_pool = None
+# For callers that pass no logger of their own
+_logger = logging.getLogger(__name__)
+
+
+class LatencyTracker(object):
+    ''' Sliding window of recent download latencies. '''
+
+    def __init__(self, window=500):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct):
+        with self._lock:
+            if len(self._samples) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(len(ordered) * pct / 100))
+        return ordered[index]
+
+
+latencies = LatencyTracker()
+
+
+def _session(config):
+    ''' The calling thread's session, keeping its connection to the cache
+    server alive between downloads. '''
+    session = getattr(_local, "session", None)
+    if session is None:
+        retry = Retry(
+            total=config.max_retries, backoff_factor=config.retry_backoff,
+            status_forcelist=(502, 503, 504), allowed_methods=frozenset({"GET"}),
+            raise_on_status=False)
+        session = requests.Session()
+        session.mount("http://", HTTPAdapter(
+            pool_connections=1, pool_maxsize=1, max_retries=retry))
+        _local.session = session
+    return session
+
+
+def _get(cache_url, params, config):
+    start = time.monotonic()
+    resp = _session(config).get(
+        cache_url, params=params,
+        timeout=(config.connect_timeout, config.read_timeout))
+    latencies.record(time.monotonic() - start)
+    return resp
+
+
+def _hedged_get(cache_url, params, config, hedge_after):
+    ''' Send the request, and a second identical one if the first has not
+    answered after `hedge_after` seconds; the first answer wins. '''
+    global _hedge_pool
+    with _hedge_lock:
+        if _hedge_pool is None:
+            _hedge_pool = ThreadPoolExecutor(
+                max_workers=2 * config.threads_count,
+                thread_name_prefix="Hedge")
+    primary = _hedge_pool.submit(_get, cache_url, params, config)
+    done, _ = wait([primary], timeout=hedge_after)
+    if done:
+        return primary.result()
+    hedge = _hedge_pool.submit(_get, cache_url, params, config)
+    pending = {primary, hedge}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+    # Both failed: report the primary's error
+    return primary.result()
+
+
 def download(url, config, logger=None):
+    logger = logger or _logger
     host, port = config.cache_server
-    resp = requests.get(
-        f"http://{host}:{port}/",
-        params=[("q", f"{url}"), ("u", f"{config.user_agent}")])
+    cache_url = f"http://{host}:{port}/"
+    params = [("q", f"{url}"), ("u", f"{config.user_agent}")]
+    hedge_after = (
+        latencies.percentile(config.hedge_percentile)
+        if config.hedge_percentile else None)
+    try:
+        if hedge_after is None:
+            resp = _get(cache_url, params, config)
+        else:
+            resp = _hedged_get(cache_url, params, config, hedge_after)
+    except requests.RequestException as e:
+        logger.error(f"Download failed for url {url}: {e}")
+        return Response({
+            "error": f"Download failed for url {url}: {e}",
+            "status": DOWNLOAD_FAILED_STATUS,
+            "url": url})
+    return decode_cache_response(url, resp.status_code, resp.content, logger)
+
+
+def record_to(writer):
+    ''' Save every answer of the cache server to an archive from now on
+    (None stops), for utils.cache_server to replay. '''
+    global _recorder
+    _recorder = writer
+
+
+def decode_cache_response(url, status_code, content, logger=None):
+    ''' Build the Response for the body the cache server sent back. '''
+    logger = logger or _logger
+    recorder = _recorder
+    if recorder is not None:
+        recorder.record(url, status_code, content)
     try:
-        if resp and resp.content:
-            return Response(cbor.loads(resp.content))
+        if status_code < 400 and content:
+            return Response(cbor.loads(content))
     except (EOFError, ValueError) as e:
         pass
-    logger.error(f"Spacetime Response error {resp} with url {url}.")
+    logger.error(
+        f"Spacetime Response error <Response [{status_code}]> with url {url}.")
     return Response({
-        "error": f"Spacetime Response error {resp} with url {url}.",
-        "status": resp.status_code,
+        "error": f"Spacetime Response error <Response [{status_code}]> with url {url}.",
+        "status": status_code,
         "url": url})
@@ -0,0 +1,146 @@
+import re
+import unicodedata
+from collections import namedtuple
+
+from bs4 import BeautifulSoup
+from bs4.dammit import EncodingDetector
+from bs4.element import Comment, Tag
+from lxml import etree
+
+# Text whose parent is one of these tags is not shown to the user
+DISALLOWED_TAGS = frozenset({"style", "script", "head", "title", "meta", "[document]"})
+
+# Regex pattern that matches sequences of one or more alphabetic character(s), ensuring there is a word boundary
+WORD_RE = re.compile(r"\b[a-zA-Z]+\b")
+
+# text  -> NFKC-normalized visible text, used for exact duplicate detection
+# words -> lowercase alphabetic words of the visible text
+# hrefs -> stripped href of every <a href> in document order, not yet joined with the page URL
+PageContent = namedtuple("PageContent", ["text", "words", "hrefs"])
+
+
+def extract_page(content, backend="lxml"):
+    """Extract visible text, words and hrefs from raw HTML in a single pass.
+
+    Both backends give the same result as collecting the visible strings and
+    the <a href> values of a BeautifulSoup(content, "lxml") tree; "lxml" streams parser events without
+    building any tree, "soup" builds the soup and walks it once.
+    """
+    return _BACKENDS[backend](content)
+
+
+def _page_content(visible, hrefs):
+    text = " ".join(visible)
+    return PageContent(
+        unicodedata.normalize("NFKC", text),
+        WORD_RE.findall(text.lower()),
+        hrefs)
+
+
+def _extract_with_soup(content):
+    try:
+        soup = BeautifulSoup(content, "lxml")
+    except Exception:
+        soup = BeautifulSoup(content, "html.parser")
+    return _walk_soup(soup)
+
+
+def _walk_soup(soup, _disallowed=DISALLOWED_TAGS):
+    visible = []
+    hrefs = []
+    for node in soup.descendants:
+        if isinstance(node, Tag):
+            if node.name == "a":
+                href = node.get("href")
+                if href is not None:
+                    hrefs.append(href.strip())
+        elif node.parent.name not in _disallowed and not isinstance(node, Comment):
+            s = node.strip()
+            if s:
+                visible.append(s)
+    return _page_content(visible, hrefs)
+
+
+class _ExtractTarget(object):
+    """lxml parser target that mirrors how BeautifulSoup's lxml tree builder
+    splits the document into strings, keeping only what the extractor needs:
+    the stack of open tag names, the pending text run and the results."""
+
+    def __init__(self):
+        self.stack = ["[document]"]
+        self.data_parts = []
+        self.visible = []
+        self.hrefs = []
+
+    def _end_data(self, _disallowed=DISALLOWED_TAGS):
+        if self.data_parts:
+            s = "".join(self.data_parts).strip()
+            self.data_parts = []
+            if s and self.stack[-1] not in _disallowed:
+                self.visible.append(s)
+
+    def start(self, tag, attrib):
+        self._end_data()
+        if tag == "a":
+            href = attrib.get("href")
+            if href is not None:
+                self.hrefs.append(href.strip())
+        self.stack.append(tag)
+
+    def end(self, tag):
+        self._end_data()
+        if len(self.stack) > 1:
+            self.stack.pop()
+
+    def data(self, data):
+        self.data_parts.append(data)
+
+    def comment(self, text):
+        # Comments become their own (invisible) string in the soup
+        self._end_data()
+
+    def pi(self, target, data):
+        self._end_data()
+        self.data_parts.append(target + " " + data)
+        self._end_data()
+
+    def doctype(self, name, pubid, system):
+        # Same string bs4's Doctype holds; visible when the doctype ends up inside <body>
+        self._end_data()
+        value = name or ""
+        if pubid is not None:
+            value += ' PUBLIC "%s"' % pubid
+            if system is not None:
+                value += ' "%s"' % system
+        elif system is not None:
+            value += ' SYSTEM "%s"' % system
+        self.data_parts.append(value)
+        self._end_data()
+
+    def close(self):
+        self._end_data()
+        return _page_content(self.visible, self.hrefs)
+
+
+def _extract_with_lxml(content):
+    """Stream the page through lxml's HTML parser, trying encodings in the order BeautifulSoup would."""
+    if isinstance(content, str):
+        strategies = [(content, None), (content.encode("utf8"), "utf8")]
+    else:
+        detector = EncodingDetector(content, is_html=True)
+        strategies = [(detector.markup, encoding) for encoding in detector.encodings]
+    for markup, encoding in strategies:
+        try:
+            # libxml2 rejects some encodings the detector guesses (cp1006, mac_latin2)
+            parser = etree.HTMLParser(target=_ExtractTarget(), recover=True, encoding=encoding)
+            parser.feed(markup)
+            return parser.close()
+        except (UnicodeDecodeError, LookupError, etree.ParserError):
+            continue
+    return _walk_soup(BeautifulSoup(content, "html.parser"))
+
+
+_BACKENDS = {
+    "lxml": _extract_with_lxml,
+    "soup": _extract_with_soup,
+}
@@ -0,0 +1,79 @@
+import hashlib
+import shelve
+import threading
+from collections import namedtuple
+
+from utils import get_urlhash
+
+# What a page looked like when it was crawled:
+# etag / last_modified -> its validators, None if the answer had none
+# body_hash            -> hash of the raw body (see PageFingerprint)
+PageFingerprint = namedtuple("PageFingerprint", ["etag", "last_modified", "body_hash"])
+
+# A crawled page: its fingerprint, the canonical and report URL it was
+# counted under, the outlinks the scraper returned for it, and what the
+# crawl statistics count for it (as in scraper.PageAnalysis), so that a
+# crawl starting over can count it without parsing it.
+PageRecord = namedtuple("PageRecord", [
+    "etag", "last_modified", "body_hash", "canonical", "report_key", "links",
+    "page_hash", "simhash", "word_count", "word_freqs"])
+
+
+def fingerprint(headers, content):
+    return PageFingerprint(
+        headers.get("ETag"), headers.get("Last-Modified"),
+        hashlib.blake2b(content, digest_size=16).hexdigest())
+
+
+class PageStore(object):
+    ''' The last crawl of every page, kept across crawls (and --restart).
+
+    A page is unchanged when both crawls have an ETag and it is the same,
+    else when both have a Last-Modified date and it is the same, else when
+    the raw bodies hash the same. Safe to share between threads. '''
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = shelve.open(path)
+        self.unchanged_count = 0
+        self.changed_count = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._db)
+
+    def unchanged(self, url, page):
+        ''' The PageRecord of the url if `page` (a PageFingerprint) shows it
+        did not change since, else None. '''
+        urlhash = get_urlhash(url)
+        with self._lock:
+            record = self._db.get(urlhash)
+            if record is not None and _same(record, page):
+                self.unchanged_count += 1
+                return record
+            self.changed_count += 1
+            return None
+
+    def remember(self, url, page, analysis, links):
+        ''' Record the crawl of a page: its PageFingerprint, its
+        scraper.PageAnalysis and the outlinks the scraper returned. '''
+        record = PageRecord(
+            *page, analysis.canonical, analysis.report_key, list(links),
+            analysis.page_hash, analysis.simhash, analysis.word_count,
+            dict(analysis.word_freqs))
+        urlhash = get_urlhash(url)
+        with self._lock:
+            self._db[urlhash] = record
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def _same(record, page):
+    if record.etag and page.etag:
+        return record.etag == page.etag
+    if record.last_modified and page.last_modified:
+        return record.last_modified == page.last_modified
+    return record.body_hash == page.body_hash
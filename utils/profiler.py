@@ -0,0 +1,136 @@
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+
+# Only one profiling window at a time
+_lock = threading.Lock()
+_running = None
+
+
+def _frame_name(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _stack(frame):
+    ''' Frame names from the outermost call to the innermost. '''
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    names.reverse()
+    return tuple(names)
+
+
+class SamplingProfiler(threading.Thread):
+    ''' Samples the stacks of every other thread for `duration` seconds.
+
+    Every `interval` seconds it reads sys._current_frames(), so the
+    profiled threads run unchanged; a sample costs a walk over each stack
+    with the GIL held. When the window is over it writes to `out_dir`:
+
+        profile-<time>.collapsed       "thread;outer;...;inner count" lines,
+                                       the input of flamegraph.pl / speedscope
+        profile-<time>-<thread>.txt    the thread's hottest functions, by
+                                       samples on top of the stack (self)
+                                       and anywhere in it (total)
+    '''
+
+    def __init__(self, duration=30.0, interval=0.01, out_dir="Logs"):
+        super().__init__(daemon=True, name="Profiler")
+        self.duration = duration
+        self.interval = interval
+        self.out_dir = out_dir
+        # thread name -> Counter of stacks
+        self.stacks = dict()
+        self.samples = 0
+        self.files = []
+
+    def run(self):
+        global _running
+        try:
+            self._sample()
+            self._write()
+        finally:
+            with _lock:
+                _running = None
+
+    def _sample(self):
+        me = threading.get_ident()
+        deadline = time.monotonic() + self.duration
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                name = names.get(ident, f"thread-{ident}")
+                self.stacks.setdefault(name, Counter())[_stack(frame)] += 1
+            self.samples += 1
+            time.sleep(self.interval)
+
+    def _write(self):
+        os.makedirs(self.out_dir, exist_ok=True)
+        prefix = os.path.join(self.out_dir, f"profile-{time.strftime('%Y%m%d-%H%M%S')}")
+        path = f"{prefix}.collapsed"
+        with open(path, "w", encoding="utf-8") as f:
+            for name, stacks in sorted(self.stacks.items()):
+                for stack, n in stacks.most_common():
+                    f.write(";".join((name,) + stack) + f" {n}\n")
+        self.files.append(path)
+        for name, stacks in sorted(self.stacks.items()):
+            path = f"{prefix}-{''.join(c if c.isalnum() or c in '-_' else '_' for c in name)}.txt"
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(self._thread_report(name, stacks))
+            self.files.append(path)
+
+    def _thread_report(self, name, stacks, top=30):
+        total = sum(stacks.values())
+        own = Counter()
+        anywhere = Counter()
+        for stack, n in stacks.items():
+            own[stack[-1]] += n
+            for frame in set(stack):
+                anywhere[frame] += n
+        lines = [f"Thread {name}: {total} samples every {self.interval * 1e3:.0f} ms "
+                 f"over {self.duration:.0f} s", ""]
+        for title, counts in [("self", own), ("total", anywhere)]:
+            lines.append(f"{'samples':>8} {title:>6}  function")
+            for frame, n in counts.most_common(top):
+                lines.append(f"{n:>8} {n / total:>6.1%}  {frame}")
+            lines.append("")
+        return "\n".join(lines)
+
+
+def start_profiling(duration=30.0, interval=0.01, out_dir="Logs"):
+    ''' Start a profiling window in the background, unless one is running.
+    Returns the SamplingProfiler, or None if one was already running. '''
+    global _running
+    with _lock:
+        if _running is not None:
+            return None
+        _running = SamplingProfiler(duration, interval, out_dir)
+        _running.start()
+        return _running
+
+
+def profile_on_signal(signum, duration=30.0, interval=0.01, out_dir="Logs"):
+    ''' Take a profile each time the process gets the signal `signum`.
+
+    The handler only sets an event, and a thread of its own starts the
+    profile: a handler runs on the main thread between two bytecodes, and
+    taking _lock there while the main thread holds it would deadlock. '''
+    requested = threading.Event()
+
+    def trigger():
+        while True:
+            requested.wait()
+            requested.clear()
+            if start_profiling(duration, interval, out_dir) is None:
+                print("A profile is already being taken.")
+            else:
+                print(f"Profiling for {duration:.0f} s, writing to {out_dir}/.")
+
+    threading.Thread(target=trigger, daemon=True, name="ProfileTrigger").start()
+    signal.signal(signum, lambda *_: requested.set())
@@ -1,14 +1,38 @@
 import pickle
 
 class Response(object):
+    ''' A download, as answered by the cache server.
+
+    url, status and error are read from the answer right away. The page
+    itself (raw_response, a pickled requests.Response holding the body and
+    the headers) is only unpickled on first access, so answers the scraper
+    turns down on their status or payload size are never decoded. The
+    headers are pickled with the body: reading them decodes both. '''
+
+    __slots__ = ("url", "status", "error", "payload_size", "_pickled", "_raw_response")
+
     def __init__(self, resp_dict):
         self.url = resp_dict["url"]
         self.status = resp_dict["status"]
         self.error = resp_dict["error"] if "error" in resp_dict else None
-        try:
-            self.raw_response = (
-                pickle.loads(resp_dict["response"])
-                if "response" in resp_dict else
-                None)
-        except TypeError:
-            self.raw_response = None
+        self._pickled = resp_dict["response"] if "response" in resp_dict else None
+        self._raw_response = None
+        # Bytes of the pickled page, body and headers; 0 without one
+        pickled = self._pickled
+        self.payload_size = len(pickled) if isinstance(pickled, (bytes, bytearray)) else 0
+
+    @property
+    def raw_response(self):
+        if self._pickled is not None:
+            try:
+                self._raw_response = pickle.loads(self._pickled)
+            except TypeError:
+                self._raw_response = None
+            self._pickled = None
+        return self._raw_response
+
+    @property
+    def headers(self):
+        ''' Headers of the page; decodes it. '''
+        raw = self.raw_response
+        return raw.headers if raw is not None else {}
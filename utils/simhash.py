@@ -0,0 +1,175 @@
+import hashlib
+from collections import Counter
+from functools import lru_cache
+from itertools import combinations
+
+try:
+    import numpy as np
+except ImportError:  # Fall back to the pure Python bit loop
+    np = None
+
+# Distinct tokens whose 64-bit hash is remembered between pages
+TOKEN_HASH_CACHE_SIZE = 1 << 18
+
+
+@lru_cache(maxsize=TOKEN_HASH_CACHE_SIZE)
+def _md5_token_hash(token):
+    # Low 64 bits of the MD5 digest, the bits the original simhash used
+    return int.from_bytes(hashlib.md5(token.encode("utf-8")).digest()[8:], "big")
+
+
+@lru_cache(maxsize=TOKEN_HASH_CACHE_SIZE)
+def _blake2b_token_hash(token):
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+# "md5" reproduces fingerprints from before the hash switch bit for bit,
+# "blake2b" is cheaper to compute. Fingerprints from different token hashes
+# are not comparable, so an index must only ever hold one kind.
+TOKEN_HASHES = {
+    "md5": _md5_token_hash,
+    "blake2b": _blake2b_token_hash,
+}
+
+
+def compute_simhash(words, token_hash="blake2b"):
+    """Compute the 64-bit simhash of a list of words.
+
+    Each distinct word votes +freq on the bits set in its token hash and
+    -freq on the others; the fingerprint keeps the bits with a positive
+    total. With NumPy the votes are one matrix product over the unpacked
+    hash bits instead of a Python loop over 64 bits per word.
+    """
+    counts = Counter(words)
+    if not counts:
+        return 0
+    hash_fn = TOKEN_HASHES[token_hash]
+    hashes = [hash_fn(word) for word in counts]
+    if np is None:
+        return _simhash_bits_loop(hashes, counts.values())
+
+    freqs = np.fromiter(counts.values(), dtype=np.int64, count=len(counts))
+    # One row of 64 bits per token, bit i of the hash in column i
+    bits = np.unpackbits(
+        np.array(hashes, dtype="<u8").view(np.uint8).reshape(-1, 8),
+        axis=1, bitorder="little")
+    # sum(+freq where set, -freq where clear) == 2 * (freq where set) - sum(freq)
+    votes = 2 * (freqs @ bits) - freqs.sum()
+    packed = np.packbits(votes > 0, bitorder="little")
+    return int.from_bytes(packed.tobytes(), "little")
+
+
+def _simhash_bits_loop(hashes, freqs):
+    hash_bits = [0] * 64
+    for h, freq in zip(hashes, freqs):
+        for i in range(64):
+            hash_bits[i] += freq if (h >> i) & 1 else -freq
+    fingerprint = 0
+    for i, bit_sum in enumerate(hash_bits):
+        if bit_sum > 0:
+            fingerprint |= 1 << i
+    return fingerprint
+
+
+class SimhashIndex(object):
+    """Set of simhash fingerprints that answers near-duplicate queries.
+
+    A query asks whether any stored fingerprint is within Hamming distance
+    ``threshold - 1`` of the given one (i.e. ``hamming_distance < threshold``).
+
+    Fingerprints are split into ``blocks`` contiguous bit ranges. If two
+    fingerprints differ in at most ``threshold - 1`` bits, at least
+    ``blocks - threshold + 1`` of those ranges are identical (pigeonhole), so
+    keeping one exact-match table per combination of that many blocks finds
+    every candidate. Only the fingerprints sharing a table key are compared
+    bit by bit, which keeps lookups close to constant time instead of
+    scanning every stored fingerprint.
+
+    More blocks means longer table keys and smaller buckets, at the cost of
+    more tables (``C(blocks, threshold - 1)``) and memory per fingerprint.
+    The default of ``threshold + 1`` blocks keeps buckets near one entry up
+    to about a million fingerprints; ``blocks=threshold`` needs an order of
+    magnitude less memory but buckets grow linearly past ~10k fingerprints.
+    """
+
+    def __init__(self, threshold=5, bits=64, blocks=None):
+        if threshold < 1:
+            raise ValueError("threshold must be at least 1")
+        max_distance = threshold - 1
+        if blocks is None:
+            blocks = min(max_distance + 2, bits)
+        if blocks <= max_distance or blocks > bits:
+            raise ValueError(
+                f"blocks must be in ({max_distance}, {bits}], got {blocks}")
+        self.threshold = threshold
+        self.bits = bits
+        self.blocks = blocks
+
+        # Split the fingerprint into blocks of (nearly) equal width.
+        block_masks = []
+        start = 0
+        for i in range(blocks):
+            width = bits // blocks + (1 if i < bits % blocks else 0)
+            block_masks.append(((1 << width) - 1) << start)
+            start += width
+
+        # One table per combination of blocks that must match exactly.
+        self._masks = []
+        for combo in combinations(block_masks, blocks - max_distance):
+            mask = 0
+            for block_mask in combo:
+                mask |= block_mask
+            self._masks.append(mask)
+        self._tables = [dict() for _ in self._masks]
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, fingerprint):
+        return self.find_near(fingerprint) is not None
+
+    def find_near(self, fingerprint):
+        """Return a stored fingerprint within the threshold, or None."""
+        threshold = self.threshold
+        for mask, table in zip(self._masks, self._tables):
+            bucket = table.get(fingerprint & mask)
+            if bucket is None:
+                continue
+            # Buckets hold a bare int until a second fingerprint shares the key.
+            if type(bucket) is int:
+                if (bucket ^ fingerprint).bit_count() < threshold:
+                    return bucket
+                continue
+            for candidate in bucket:
+                if (candidate ^ fingerprint).bit_count() < threshold:
+                    return candidate
+        return None
+
+    def add(self, fingerprint):
+        """Store a fingerprint. Exact duplicates are ignored."""
+        for mask, table in zip(self._masks, self._tables):
+            key = fingerprint & mask
+            bucket = table.get(key)
+            if bucket is None:
+                table[key] = fingerprint
+            elif type(bucket) is int:
+                if bucket == fingerprint:
+                    return
+                table[key] = [bucket, fingerprint]
+            else:
+                if fingerprint in bucket:
+                    return
+                bucket.append(fingerprint)
+        self._count += 1
+
+    def add_if_unique(self, fingerprint):
+        """Store the fingerprint unless a near-duplicate is already indexed.
+
+        Returns the near-duplicate that was found, or None if the fingerprint
+        was added.
+        """
+        match = self.find_near(fingerprint)
+        if match is None:
+            self.add(fingerprint)
+        return match
@@ -0,0 +1,276 @@
+import threading
+import weakref
+from collections import Counter
+from itertools import count
+
+from utils import at_thread_exit
+from utils.digest_set import DigestSet
+from utils.simhash import SimhashIndex
+
+# Independent locks behind each set; threads only contend on the same shard
+SET_SHARDS = 16
+# Records a thread makes before folding its counters into the global view
+MERGE_EVERY = 50
+# Most common words kept up to date as counts change
+TOP_WORDS = 50
+
+
+class ShardedSet(object):
+    ''' DigestSet split into shards by hash, each behind its own lock. '''
+
+    def __init__(self, shards=SET_SHARDS):
+        self._shards = [DigestSet() for _ in range(shards)]
+        self._locks = [threading.Lock() for _ in range(shards)]
+
+    def add(self, item):
+        ''' Add the item; True if it was not in the set yet. '''
+        index = hash(item) % len(self._shards)
+        with self._locks[index]:
+            return self._shards[index].add(item)
+
+    def __contains__(self, item):
+        index = hash(item) % len(self._shards)
+        with self._locks[index]:
+            return item in self._shards[index]
+
+    def __len__(self):
+        return sum(len(shard) for shard in self._shards)
+
+
+class TopK(object):
+    ''' The k largest counts of a counter whose counts only ever grow.
+
+    offer() is called with a key's new count after every increase. A key
+    outside the top only gets in by passing the smallest count in it, and
+    keys inside can only move up, so the top stays exact without sorting the
+    whole counter. Only the smallest count is tracked between offers. '''
+
+    def __init__(self, k):
+        self.k = k
+        self._top = {}
+        self._min_key = None
+
+    def offer(self, key, count):
+        top = self._top
+        if key in top:
+            top[key] = count
+            if key == self._min_key:
+                self._min_key = min(top, key=top.get)
+        elif len(top) < self.k:
+            top[key] = count
+            if self._min_key is None or count < top[self._min_key]:
+                self._min_key = key
+        elif count > top[self._min_key]:
+            del top[self._min_key]
+            top[key] = count
+            self._min_key = min(top, key=top.get)
+
+    def most_common(self, n=None):
+        ordered = sorted(self._top.items(), key=lambda item: item[1], reverse=True)
+        return ordered if n is None else ordered[:n]
+
+
+class _LocalStats(object):
+    ''' Counters of one thread, not yet folded into the global view. The
+    lock is only contended while a reader merges. '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = 0  # records since the last merge
+        self.words = Counter()
+        self.subdomains = Counter()
+        self.longest_page = ("", 0)
+
+
+class CrawlStats(object):
+    ''' Statistics of a crawl shared by every worker thread.
+
+    Membership (page hashes, simhashes, urls) must be exact across threads,
+    so it lives in sharded sets of 64-bit digests. Counters (words, pages per subdomain, the
+    longest page) are only additive: each thread accumulates its own and
+    folds them into the global view every MERGE_EVERY records, taking the
+    global lock once per batch instead of once per page. The read methods
+    merge every thread's pending counters under the global lock first, so
+    reports are exact. A thread's counters are folded in for good, and
+    dropped, when the thread exits. '''
+
+    def __init__(self, near_dup_threshold=5):
+        self.seen_hashes = ShardedSet()
+        self.seen_urls = ShardedSet()
+        self.report_urls = ShardedSet()
+        self._simhashes = SimhashIndex(threshold=near_dup_threshold)
+        self._simhash_lock = threading.Lock()
+
+        self._local = threading.local()
+        self._locals = []
+        self._lock = threading.Lock()  # guards the global view and _locals
+        # _locals holds the counters of live threads only
+        self._words = Counter()
+        self._top_words = TopK(TOP_WORDS)
+        self._subdomains = Counter()
+        self._longest_page = ("", 0)
+
+    # --- Recording, called by the crawl threads ---
+
+    def add_page_hash(self, page_hash):
+        ''' True unless the exact page was seen before. '''
+        return self.seen_hashes.add(page_hash)
+
+    def add_simhash(self, fingerprint):
+        ''' True unless a near-duplicate of the page was seen before. '''
+        with self._simhash_lock:
+            return self._simhashes.add_if_unique(fingerprint) is None
+
+    def add_url(self, canonical, report_key):
+        ''' Record a crawled url; True the first time its canonical form is seen. '''
+        self.report_urls.add(report_key)
+        return self.seen_urls.add(canonical)
+
+    def add_subdomain_page(self, host):
+        local = self._local_stats()
+        with local.lock:
+            local.subdomains[host] += 1
+            local.pending += 1
+        self._maybe_merge(local)
+
+    def add_page_words(self, url, word_count, word_freqs):
+        ''' Count the words of a page that is neither a duplicate nor low-information. '''
+        local = self._local_stats()
+        with local.lock:
+            local.pending += 1
+            local.words.update(word_freqs)
+            if word_count > local.longest_page[1]:
+                local.longest_page = (url, word_count)
+        self._maybe_merge(local)
+
+    # --- Reading ---
+
+    def subdomain_count(self, host):
+        ''' Pages seen on a subdomain. Cheap and slightly behind: counters
+        other threads have not merged yet are left out. '''
+        local = self._local_stats()
+        with self._lock:
+            merged = self._subdomains.get(host, 0)
+        return merged + local.subdomains.get(host, 0)
+
+    def unique_pages(self):
+        return len(self.report_urls)
+
+    def longest_page(self):
+        with self._lock:
+            self._merge_all()
+            return self._longest_page
+
+    def most_common_words(self, n):
+        with self._lock:
+            self._merge_all()
+            if n <= self._top_words.k:
+                return self._top_words.most_common(n)
+            return self._words.most_common(n)
+
+    def subdomain_counts(self):
+        ''' Copy of the pages per subdomain. '''
+        with self._lock:
+            self._merge_all()
+            return dict(self._subdomains)
+
+    # --- Internals ---
+
+    def _local_stats(self):
+        local = getattr(self._local, "stats", None)
+        if local is None:
+            local = self._local.stats = _LocalStats()
+            with self._lock:
+                self._locals.append(local)
+            at_thread_exit(_retire_local, weakref.ref(self), local)
+        return local
+
+    def _maybe_merge(self, local):
+        if local.pending >= MERGE_EVERY:
+            with self._lock:
+                self._merge_local(local)
+
+    def _merge_all(self):
+        for local in self._locals:
+            self._merge_local(local)
+
+    def _merge_local(self, local):
+        # Called with the global lock held. Locks are always taken global
+        # first, then local, so merging cannot deadlock with a reader.
+        with local.lock:
+            if not local.pending:
+                return
+            words = self._words
+            words.update(local.words)
+            offer = self._top_words.offer
+            for word in local.words:
+                offer(word, words[word])
+            self._subdomains.update(local.subdomains)
+            if local.longest_page[1] > self._longest_page[1]:
+                self._longest_page = local.longest_page
+            local.words = Counter()
+            local.subdomains = Counter()
+            local.longest_page = ("", 0)
+            local.pending = 0
+
+
+def _retire_local(stats_ref, local):
+    # The thread that owned local has exited: fold its counters in and forget it
+    stats = stats_ref()
+    if stats is None:
+        return
+    with stats._lock:
+        stats._merge_local(local)
+        stats._locals.remove(local)
+
+
+class MetricsFlusher(threading.Thread):
+    ''' Writes the crawl reports on a background thread.
+
+    A flush happens every `interval` seconds, and as soon as page_done()
+    has been called `every_pages` times since the last one. page_done() only
+    counts and wakes the thread, so crawl threads never wait for report I/O.
+    The thread starts with the first page; close() stops it after a final
+    flush. '''
+
+    def __init__(self, flush, interval=60.0, every_pages=200):
+        super().__init__(daemon=True, name="MetricsFlusher")
+        self.flush = flush
+        self.interval = interval
+        self.every_pages = every_pages
+        # next() on itertools.count is atomic under the GIL
+        self._pages = count(1)
+        self._wakeup = threading.Event()
+        self._closed = threading.Event()
+        self._start_lock = threading.Lock()
+
+    def page_done(self):
+        if not self.is_alive():
+            with self._start_lock:
+                if not self.is_alive() and not self._closed.is_set():
+                    self.start()
+        if next(self._pages) % self.every_pages == 0:
+            self._wakeup.set()
+
+    def run(self):
+        while not self._closed.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if self._closed.is_set():
+                break
+            self._flush_safely()
+
+    def close(self):
+        """ Stop the thread and write the final reports. """
+        with self._start_lock:
+            self._closed.set()
+        self._wakeup.set()
+        if self.is_alive():
+            self.join()
+        self._flush_safely()
+
+    def _flush_safely(self):
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Failed to write metrics - {e!r}")
@@ -0,0 +1,165 @@
+import json
+import math
+import threading
+import time
+import weakref
+
+from utils import at_thread_exit, write_file_atomically
+
+# Histogram buckets: SUB_BUCKETS per power of two from MIN_SECONDS up, so a
+# percentile is off by at most 2**(1/8) - 1 (about 9%) of its value.
+MIN_SECONDS = 1e-6
+SUB_BUCKETS = 8
+BUCKETS = 40 * SUB_BUCKETS  # up to 2**40 us, about 12 days
+
+
+def _bucket(seconds):
+    if seconds <= MIN_SECONDS:
+        return 0
+    mantissa, exponent = math.frexp(seconds / MIN_SECONDS)
+    index = exponent * SUB_BUCKETS + int((mantissa - 0.5) * 2 * SUB_BUCKETS)
+    return min(index, BUCKETS - 1)
+
+
+def _bucket_value(index):
+    ''' Middle of a bucket, in seconds. '''
+    exponent, sub = divmod(index, SUB_BUCKETS)
+    low = (0.5 + sub / (2 * SUB_BUCKETS)) * 2.0 ** exponent
+    high = (0.5 + (sub + 1) / (2 * SUB_BUCKETS)) * 2.0 ** exponent
+    return (low + high) / 2 * MIN_SECONDS
+
+
+class Histogram(object):
+    ''' Log-bucketed latency histogram: constant memory, O(1) record. '''
+
+    __slots__ = ("buckets", "count", "total", "max")
+
+    def __init__(self):
+        self.buckets = [0] * BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.buckets[_bucket(seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other):
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, pct):
+        if not self.count:
+            return 0.0
+        rank = math.ceil(self.count * pct / 100)
+        seen = 0
+        for index, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                if index == BUCKETS - 1:
+                    # Open-ended top bucket
+                    return self.max
+                return min(_bucket_value(index), self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "total_s": self.total,
+            "mean_s": self.total / self.count if self.count else 0.0,
+            "p50_s": self.percentile(50),
+            "p95_s": self.percentile(95),
+            "p99_s": self.percentile(99),
+            "max_s": self.max,
+        }
+
+
+class StageTimings(object):
+    ''' Per-stage latency histograms and counters shared by every crawl thread.
+
+    Each thread records into histograms and counters of its own, so
+    record() and count() take no lock; snapshot() adds them up. A snapshot
+    taken while threads record may miss their latest few samples. When a
+    thread exits, its histograms and counters are merged into the totals of
+    finished threads and released.
+
+        start = time.perf_counter()
+        ...
+        stage_timings.record("download", time.perf_counter() - start)
+    '''
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # (histograms, counters) of every live thread that recorded something
+        self._threads = []
+        # ... and the sums of the threads that have exited
+        self._finished = (dict(), dict())
+        self.started = time.time()
+
+    def _mine(self):
+        mine = getattr(self._local, "mine", None)
+        if mine is None:
+            mine = self._local.mine = (dict(), dict())
+            with self._lock:
+                self._threads.append(mine)
+            at_thread_exit(_retire_thread, weakref.ref(self), mine)
+        return mine
+
+    @staticmethod
+    def _add(histograms, counters, into):
+        into_histograms, into_counters = into
+        for stage, histogram in list(histograms.items()):
+            into_histograms.setdefault(stage, Histogram()).merge(histogram)
+        for name, n in list(counters.items()):
+            into_counters[name] = into_counters.get(name, 0) + n
+
+    def record(self, stage, seconds):
+        histograms = self._mine()[0]
+        histogram = histograms.get(stage)
+        if histogram is None:
+            histogram = histograms[stage] = Histogram()
+        histogram.record(seconds)
+
+    def count(self, name, n=1):
+        counters = self._mine()[1]
+        counters[name] = counters.get(name, 0) + n
+
+    def snapshot(self):
+        ''' {"stages": {stage: summary}, "counters": {name: total}} over all threads. '''
+        stages = dict()
+        counters = dict()
+        with self._lock:
+            threads = list(self._threads)
+            self._add(*self._finished, (stages, counters))
+        for histograms, thread_counters in threads:
+            self._add(histograms, thread_counters, (stages, counters))
+        return {
+            "stages": {stage: h.summary() for stage, h in sorted(stages.items())},
+            "counters": dict(sorted(counters.items())),
+        }
+
+    def dump(self, path):
+        ''' Write snapshot() as JSON, replacing the file atomically. '''
+        report = self.snapshot()
+        report["since"] = self.started
+        report["written"] = time.time()
+        write_file_atomically(path, json.dumps(report, indent=2))
+
+
+def _retire_thread(timings_ref, mine):
+    # Called from the exiting thread, which records nothing more
+    timings = timings_ref()
+    if timings is None:
+        return
+    with timings._lock:
+        timings._add(*mine, timings._finished)
+        timings._threads.remove(mine)
+
+
+stage_timings = StageTimings()
@@ -0,0 +1,171 @@
+import os
+import re
+import json
+from hashlib import sha256
+from urllib.parse import urlparse
+
+# Rules the crawler ships with; see UrlFilter for the format
+RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "url_rules.json")
+
+# Reason codes of the built-in checks. Pattern, host and substring rules
+# report the "reason" given in the rules file.
+EMPTY = "empty"
+TOO_LONG = "too_long"
+MALFORMED = "malformed"
+SCHEME = "scheme"
+DOMAIN = "domain"
+FILE_TYPE = "file_type"
+LONG_QUERY = "long_query"
+DEEP_PATH = "deep_path"
+TOO_MANY_PARAMS = "too_many_params"
+REPEATED_SEGMENTS = "repeated_segments"
+DEEP_HOST = "deep_host"
+LONG_SEGMENT = "long_segment"
+
+
+class UrlFilter(object):
+    """Decides which urls the crawler may visit, from rules loaded as data.
+
+    Everything is prepared once: patterns are compiled, the blocked file
+    extensions become a single regex and trap rules for particular hosts
+    sit in a host -> rules table, so a url only meets the rules of its own
+    host. check() returns None for a valid url or the reason code of the
+    first rule rejecting it.
+
+    Rules (see url_rules.json):
+        schemes, allowed_domains  -- what a url must use / end with
+        blocked_extensions        -- file types rejected by path suffix
+        limits                    -- length and count limits
+        patterns                  -- {reason, field, pattern, ignore_case}
+                                     regexes searched in the raw path/query
+        host_rules                -- host -> [{reason, path_prefixes}];
+                                     no prefixes blocks the whole host
+        substrings                -- {reason, field, values} searched in
+                                     the lowercased path/query
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.schemes = frozenset(rules["schemes"])
+        self.allowed_domains = tuple(rules["allowed_domains"])
+        self.blocked_extension_re = re.compile(
+            r"\.(%s)$" % "|".join(map(re.escape, rules["blocked_extensions"])))
+        limits = rules["limits"]
+        self.max_url_length = limits["max_url_length"]
+        self.max_query_length = limits["max_query_length"]
+        self.max_path_slashes = limits["max_path_slashes"]
+        self.max_query_params = limits["max_query_params"]
+        self.max_host_labels = limits["max_host_labels"]
+        self.max_segment_length = limits["max_segment_length"]
+        self.repeated_segments_min_count = limits["repeated_segments_min_count"]
+        # Rules are split by the field they look at so check() need not dispatch on it
+        self.path_patterns, self.query_patterns = self._by_field(
+            rules["patterns"], lambda rule: [(re.compile(
+                rule["pattern"], re.IGNORECASE if rule.get("ignore_case") else 0),
+                rule["reason"])])
+        self.host_rules = {
+            host: [(tuple(rule.get("path_prefixes", ())), rule["reason"])
+                   for rule in host_rules]
+            for host, host_rules in rules["host_rules"].items()}
+        self.path_substrings, self.query_substrings = self._by_field(
+            rules["substrings"],
+            lambda rule: [(value, rule["reason"]) for value in rule["values"]])
+        # One search per field answers whether any pattern matches; the
+        # rules are only walked one by one to name the reason.
+        self.path_patterns_any = self._any_of(self.path_patterns)
+        self.query_patterns_any = self._any_of(self.query_patterns)
+
+    @staticmethod
+    def _any_of(patterns):
+        if not patterns:
+            return re.compile(r"(?!)")
+        return re.compile("|".join(
+            "(?%s:%s)" % ("i" if pattern.flags & re.IGNORECASE else "-i", pattern.pattern)
+            for pattern, _ in patterns))
+
+    @staticmethod
+    def _by_field(rules, compile_rule):
+        by_field = {"path": [], "query": []}
+        for rule in rules:
+            by_field[rule["field"]].extend(compile_rule(rule))
+        return by_field["path"], by_field["query"]
+
+    @classmethod
+    def from_file(cls, path=RULES_FILE):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def signature(self):
+        """Digest of the rules and of this engine; changes whenever the set of valid urls may."""
+        with open(os.path.abspath(__file__), "rb") as f:
+            source = f.read()
+        return sha256(
+            source + json.dumps(self.rules, sort_keys=True).encode("utf-8")).digest()
+
+    def is_valid(self, url):
+        return self.check(url) is None
+
+    def check(self, url):
+        """Return None if the url may be crawled, else the reason code."""
+        if not url:
+            return EMPTY
+        if len(url) > self.max_url_length:
+            return TOO_LONG
+        try:
+            parsed = urlparse(url)
+            scheme = parsed.scheme.lower()
+            netloc = parsed.netloc.lower()
+            path = parsed.path or ""
+            query = parsed.query or ""
+        except (TypeError, ValueError, AttributeError):
+            return MALFORMED
+
+        if scheme not in self.schemes:
+            return SCHEME
+        if not netloc.endswith(self.allowed_domains):
+            return DOMAIN
+        path_lower = path.lower()
+        if self.blocked_extension_re.search(path_lower):
+            return FILE_TYPE
+        if len(query) > self.max_query_length:
+            return LONG_QUERY
+        if path.count("/") > self.max_path_slashes:
+            return DEEP_PATH
+        if query and query.count("&") + 1 > self.max_query_params:
+            return TOO_MANY_PARAMS
+        # n segments need at least n - 1 slashes
+        if path.count("/") >= self.repeated_segments_min_count - 1:
+            segments = [seg for seg in path.strip("/").split("/") if seg]
+            if (len(segments) >= self.repeated_segments_min_count
+                    and len(set(segments)) < len(segments) / 2):
+                return REPEATED_SEGMENTS
+        if netloc.count(".") >= self.max_host_labels:
+            return DEEP_HOST
+        if len(path) > self.max_segment_length and any(
+                len(seg) > self.max_segment_length for seg in path.split("/")):
+            return LONG_SEGMENT
+
+        if self.path_patterns_any.search(path):
+            for pattern, reason in self.path_patterns:
+                if pattern.search(path):
+                    return reason
+        if query and self.query_patterns_any.search(query):
+            for pattern, reason in self.query_patterns:
+                if pattern.search(query):
+                    return reason
+
+        host_rules = self.host_rules.get(netloc)
+        if host_rules:
+            for prefixes, reason in host_rules:
+                if not prefixes or path_lower.startswith(prefixes):
+                    return reason
+
+        for value, reason in self.path_substrings:
+            if value in path_lower:
+                return reason
+        if query:
+            query_lower = query.lower()
+            for value, reason in self.query_substrings:
+                if value in query_lower:
+                    return reason
+        return None
@@ -0,0 +1,111 @@
+import re
+import threading
+from urllib.parse import urlparse
+
+# Runs of digits stand for any number in a template
+_DIGITS_RE = re.compile(r"\d+")
+
+
+def template_segments(url):
+    """The host and template segments of a url: path segments with runs
+    of digits masked as {d}, then "?" and the sorted query keys if it has a
+    query. "https://a.uci.edu/events/2020-01-05?view=day" gives
+    ("a.uci.edu", ["events", "{d}-{d}-{d}", "?view"])."""
+    parsed = urlparse(url)
+    segments = [segment for segment in _DIGITS_RE.sub("{d}", parsed.path).split("/") if segment]
+    if parsed.query:
+        keys = sorted({pair.split("=", 1)[0] for pair in parsed.query.split("&") if pair})
+        segments.append("?" + "&".join(keys))
+    return parsed.netloc.lower(), segments
+
+
+class _Node(object):
+    __slots__ = ("children", "pages", "bad", "blocked")
+
+    def __init__(self):
+        self.children = dict()
+        self.pages = 0
+        self.bad = 0
+        self.blocked = False
+
+
+class TrapTemplates(object):
+    """Learns which url templates of each host lead to trap pages.
+
+    Every crawled page is recorded under its template (see
+    template_segments) in a trie per host, one level per segment, with how
+    many of its pages were low-information or duplicates. Once `min_pages`
+    pages of a template were crawled and at least `bad_ratio` of them were
+    bad, the template is blocked: blocked() is then True for every url
+    following it. Both walk one node per segment, so a lookup costs the
+    length of the url's path, however many templates are known.
+    `min_pages` 0 turns blocking off.
+    """
+
+    def __init__(self, min_pages=20, bad_ratio=0.8):
+        self.min_pages = min_pages
+        self.bad_ratio = bad_ratio
+        self._hosts = dict()
+        self._lock = threading.Lock()
+        self.blocked_count = 0
+
+    def record(self, url, bad):
+        """Record a crawled page; returns its template if this blocks it."""
+        host, segments = template_segments(url)
+        with self._lock:
+            node = self._hosts.get(host)
+            if node is None:
+                node = self._hosts[host] = _Node()
+            for segment in segments:
+                child = node.children.get(segment)
+                if child is None:
+                    child = node.children[segment] = _Node()
+                node = child
+            node.pages += 1
+            if bad:
+                node.bad += 1
+            if (self.min_pages and not node.blocked and node.pages >= self.min_pages
+                    and node.bad >= self.bad_ratio * node.pages):
+                node.blocked = True
+                self.blocked_count += 1
+                return host + "/" + "/".join(segments)
+        return None
+
+    def blocked(self, url):
+        """Whether the url follows a blocked template. Takes no lock."""
+        if not self.blocked_count:
+            return False
+        host, segments = template_segments(url)
+        node = self._hosts.get(host)
+        for segment in segments:
+            if node is None:
+                return False
+            node = node.children.get(segment)
+        return node is not None and node.blocked
+
+    def clear(self):
+        with self._lock:
+            self._hosts = dict()
+            self.blocked_count = 0
+
+    def get_state(self):
+        """The tries as nested [pages, bad, blocked, {segment: node}] lists."""
+        def dump(node):
+            return [node.pages, node.bad, node.blocked,
+                    {segment: dump(child) for segment, child in node.children.items()}]
+        with self._lock:
+            return {host: dump(node) for host, node in self._hosts.items()}
+
+    def set_state(self, state):
+        def load(data):
+            node = _Node()
+            node.pages, node.bad, node.blocked, children = data
+            node.children = {segment: load(child) for segment, child in children.items()}
+            return node
+        hosts = {host: load(data) for host, data in state.items()}
+        with self._lock:
+            self._hosts = hosts
+            self.blocked_count = sum(self._count_blocked(node) for node in hosts.values())
+
+    def _count_blocked(self, node):
+        return node.blocked + sum(self._count_blocked(child) for child in node.children.values())